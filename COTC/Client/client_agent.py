@@ -18,6 +18,7 @@ import platform
 from collectors.pc_metrics import PCMetricsCollector
 from collectors.stock_collector import StockCollector
 from collectors.api_client import APIClient
+from collectors.spool import Spool
 
 class ClientAgent:
     def __init__(self, config_path):
@@ -31,13 +32,42 @@ class ClientAgent:
         self.setup_logging()
         
         # Initialize collectors and API client
-        self.api_client = APIClient(self.config["server_url"])
+        # Undelivered samples are kept on disk and replayed when the server is reachable again
+        spool_config = self.config.get("spool", {})
+        self.spool = None
+        if spool_config.get("enabled"):
+            self.spool = Spool(
+                Path(__file__).parent / spool_config.get("path", "spool.db"),
+                max_samples=spool_config.get("max_samples", 100000)
+            )
+        
+        self.api_client = APIClient(
+            self.config["server_url"],
+            self.config.get("batching"),
+            spool=self.spool,
+            replay_batch_size=spool_config.get("replay_batch_size", 1000)
+        )
         self.pc_metrics = PCMetricsCollector(self.config["metrics"]["enabled"])
         
-        if self.config["stocks"]["api_key"]:
+        if not self.config["stocks"].get("collect", True):
+            self.stock_collector = None
+            logging.info("Stock collection turned off - quotes are fetched by the server")
+        elif self.config["stocks"]["api_key"]:
+            # A quote is not re-sent while cached, so a TTL beyond stock_interval would skip whole cycles
+            quote_cache_ttl = self.config["stocks"].get("quote_cache_ttl", 0)
+            if quote_cache_ttl > self.config["stock_interval"]:
+                logging.warning(
+                    f"quote_cache_ttl ({quote_cache_ttl}s) is longer than stock_interval, "
+                    f"using {self.config['stock_interval']}s"
+                )
+                quote_cache_ttl = self.config["stock_interval"]
             self.stock_collector = StockCollector(
                 self.config["stocks"]["api_key"],
-                self.config["stocks"]["symbols"]
+                self.config["stocks"]["symbols"],
+                max_workers=self.config["stocks"].get("max_workers", 8),
+                timeout=self.config["stocks"].get("timeout", 5),
+                rate_limit_per_minute=self.config["stocks"].get("rate_limit_per_minute", 60),
+                quote_cache_ttl=quote_cache_ttl
             )
         else:
             self.stock_collector = None
@@ -307,6 +337,14 @@ class ClientAgent:
         if self.stock_polling_thread:
             self.stock_polling_thread.join()
         
+        if self.stock_collector:
+            self.stock_collector.close()
+        
+        # Send any samples still waiting for the next batch
+        self.api_client.close()
+        if self.spool:
+            self.spool.close()
+        
         logging.info("Client agent stopped")
 
     def get_mac_address(self):
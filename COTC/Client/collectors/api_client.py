@@ -2,26 +2,71 @@
 API Client
 
 This module handles communication with the monitoring server API.
+
+With batching enabled, system and stock samples are queued with their
+collection timestamp and sent together as one compressed POST to
+/metrics/batch once max_samples are queued or the oldest has waited
+max_delay seconds, instead of one request per sample.
+
+With a spool, samples that can't be delivered are stored on disk instead of
+being dropped and are replayed in order, in large batches, as soon as the
+server answers again. Replays run on the background flusher thread, so a
+large backlog never holds up the collectors' sends.
 """
+import datetime
+import gzip
+import json
 import requests
 import logging
+import threading
+import time
 from requests.exceptions import RequestException
 from urllib3.exceptions import InsecureRequestWarning
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # Suppress only the single warning from urllib3 needed.
 requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
 
 class APIClient:
-    def __init__(self, server_url):
+    def __init__(self, server_url, batching=None, spool=None, replay_batch_size=1000):
         """
         Initialize the API client.
         
         Args:
             server_url: The URL of the monitoring server
+            batching: Optional dict with "enabled", "max_samples", "max_delay" (seconds),
+                      "max_pending" and "compression" ("gzip", "zstd" or "none")
+            spool: Optional Spool keeping undelivered samples for replay
+            replay_batch_size: Samples per request when replaying the spool
         """
         self.server_url = server_url
         self.session = requests.Session()
         self.timeout = 5  # 5 second timeout for all requests
+        
+        batching = batching or {}
+        self.batching = batching.get("enabled", False)
+        self.max_samples = batching.get("max_samples", 100)
+        self.max_delay = batching.get("max_delay", 30)
+        self.max_pending = batching.get("max_pending", 10000)
+        self.compression = batching.get("compression", "gzip")
+        if self.compression == "zstd" and zstandard is None:
+            logging.warning("zstandard is not installed, compressing batches with gzip")
+            self.compression = "gzip"
+        
+        self.spool = spool
+        self.replay_batch_size = replay_batch_size
+        self._replay_lock = threading.Lock()
+        
+        self._pending = []
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._replay_requested = False
+        self._flush_thread = None
     
     def _make_request(self, method, endpoint, **kwargs):
         """
@@ -95,24 +140,36 @@ class APIClient:
         Returns:
             True if successful, False otherwise
         """
+        if self.batching:
+            return self.queue_sample({
+                "type": "system",
+                "hostname": hostname,
+                "mac_address": mac_address,
+                "metrics": metrics
+            })
+        
         payload = {
             "hostname": hostname,
             "mac_address": mac_address,
             "metrics": metrics
         }
+        collected_at = datetime.datetime.now().isoformat()
         
-        logging.info(f"Sending system metrics with payload: {payload}")
+        logging.debug(f"Sending system metrics with payload: {payload}")
         response = self._make_request('PUT', '/metrics/system', json=payload)
         
         if response and response.status_code == 200:
             try:
                 response_json = response.json()
-                logging.info(f"System metrics sent successfully: {metrics}")
-                logging.info(f"Server response: {response_json}")
+                logging.debug(f"System metrics sent successfully: {metrics}")
+                logging.debug(f"Server response: {response_json}")
             except:
-                logging.info(f"System metrics sent successfully: {metrics}. Response: {response.text}")
+                logging.debug(f"System metrics sent successfully: {metrics}. Response: {response.text}")
+            self._request_replay()
             return True
         else:
+            if self._retryable(response):
+                self._spool_samples([dict(payload, type="system", timestamp=collected_at)])
             if response:
                 try:
                     error_json = response.json()
@@ -134,17 +191,24 @@ class APIClient:
         Returns:
             True if successful, False otherwise
         """
+        if self.batching:
+            return self.queue_sample({"type": "stock", "symbol": symbol, "price": price})
+        
         payload = {
             "symbol": symbol,
             "price": price
         }
+        collected_at = datetime.datetime.now().isoformat()
         
         response = self._make_request('PUT', f'/metrics/stock/{symbol}', json=payload)
         
         if response and response.status_code == 200:
-            logging.info(f"Stock data sent successfully: {symbol}=${price}")
+            logging.debug(f"Stock data sent successfully: {symbol}=${price}")
+            self._request_replay()
             return True
         else:
+            if self._retryable(response):
+                self._spool_samples([dict(payload, type="stock", timestamp=collected_at)])
             if response:
                 logging.error(f"Failed to send stock data: {response.status_code} - {response.text}")
             return False
@@ -160,11 +224,11 @@ class APIClient:
         Returns:
             Stock symbol (str) if available, None otherwise
         """
-        logging.info(f"Making poll request to {self.server_url}/metrics/stock/poll (hostname: {hostname}, MAC: {mac_address})")
+        logging.debug(f"Making poll request to {self.server_url}/metrics/stock/poll (hostname: {hostname}, MAC: {mac_address})")
         response = self._make_request('GET', f'/metrics/stock/poll?hostname={hostname}&mac_address={mac_address}')
         
         if response:
-            logging.info(f"Poll response received - Status: {response.status_code}")
+            logging.debug(f"Poll response received - Status: {response.status_code}")
             if response.status_code == 200:
                 try:
                     data = response.json()
@@ -173,7 +237,7 @@ class APIClient:
                     if symbol:
                         logging.info(f"Received new stock symbol from polling: {symbol}")
                     else:
-                        logging.info("Poll response: No new symbols available")
+                        logging.debug("Poll response: No new symbols available")
                     return symbol
                 except Exception as e:
                     logging.error(f"Error parsing poll response: {e}")
@@ -186,4 +250,204 @@ class APIClient:
         else:
             logging.warning("No response received from polling request")
             
-        return None 
\ No newline at end of file
+        return None
+    
+    def queue_sample(self, sample):
+        """
+        Queue a sample for the next batch, stamped with the current time.
+        
+        Args:
+            sample: Sample dict in the format accepted by /metrics/batch
+            
+        Returns:
+            True (the sample is sent by the background flusher)
+        """
+        sample.setdefault("timestamp", datetime.datetime.now().isoformat())
+        with self._condition:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(sample)
+            self._trim_pending()
+            if len(self._pending) >= self.max_samples:
+                self._condition.notify()
+        self.start()
+        logging.debug(f"Queued {sample['type']} sample for batching: {sample}")
+        return True
+    
+    def _trim_pending(self):
+        """Drop the oldest queued samples beyond max_pending (called with the condition held)."""
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            logging.warning(f"Batch queue full, dropped {overflow} oldest samples")
+    
+    def send_batch(self, samples):
+        """
+        Send samples to the server in one compressed request.
+        
+        Args:
+            samples: List of sample dicts
+            
+        Returns:
+            True if the batch was handled (stored, or rejected by the server for
+            good), False if it should be retried later
+        """
+        body = json.dumps({"samples": samples}).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.compression == "gzip":
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        elif self.compression == "zstd":
+            body = zstandard.ZstdCompressor().compress(body)
+            headers["Content-Encoding"] = "zstd"
+        
+        response = self._make_request('POST', '/metrics/batch', data=body, headers=headers)
+        
+        if response and response.status_code == 200:
+            try:
+                result = response.json()
+                if result.get("rejected"):
+                    rejected = [item for item in result.get("results", []) if item.get("status") == "rejected"]
+                    logging.warning(f"Server rejected {result['rejected']} of {len(samples)} samples: {rejected[:5]}")
+            except ValueError:
+                pass
+            logging.debug(f"Sent batch of {len(samples)} samples ({len(body)} bytes)")
+            return True
+        
+        if response:
+            logging.error(f"Failed to send batch: {response.status_code} - {response.text}")
+        else:
+            logging.error("Failed to send batch: No response received")
+        # Retrying a batch the server refused as invalid would block everything queued behind it
+        return not self._retryable(response)
+    
+    def _retryable(self, response):
+        """Whether a failed request may succeed later (no response, timeout, rate limit or server error)."""
+        return response is None or response.status_code in (408, 429) or response.status_code >= 500
+    
+    def _spool_samples(self, samples):
+        """Keep undelivered samples in the spool, if there is one."""
+        if self.spool is not None and samples:
+            self.spool.append(samples)
+            logging.debug(f"Spooled {len(samples)} undelivered samples")
+    
+    def _request_replay(self):
+        """Have the flusher thread replay the spool, if anything is spooled."""
+        if self.spool is None or not len(self.spool):
+            return
+        with self._condition:
+            self._replay_requested = True
+            self._condition.notify()
+        self.start()
+    
+    def replay_spool(self):
+        """
+        Send spooled samples to the server, oldest first, in batches of replay_batch_size.
+        
+        Returns:
+            True if the spool is empty afterwards, False if the server stopped answering
+        """
+        if self.spool is None:
+            return True
+        replayed = 0
+        # One replay at a time, so concurrent senders never deliver the same samples twice
+        with self._replay_lock:
+            while True:
+                samples, last_id = self.spool.peek(self.replay_batch_size)
+                if not samples:
+                    break
+                if not self.send_batch(samples):
+                    logging.warning(f"Spool replay interrupted after {replayed} samples")
+                    return False
+                self.spool.ack(last_id)
+                replayed += len(samples)
+        if replayed:
+            logging.info(f"Replayed {replayed} spooled samples")
+        return True
+    
+    def flush(self):
+        """
+        Send every queued sample now.
+        
+        Returns:
+            True if nothing was queued or the batch was sent, False if it was re-queued or spooled
+        """
+        with self._condition:
+            samples, self._pending = self._pending, []
+            self._oldest = None
+        
+        if self.spool is not None:
+            # Spooled samples are older, so they go first; anything unsent joins them on disk
+            if not self.replay_spool():
+                self._spool_samples(samples)
+                return False
+            for start in range(0, len(samples), self.max_samples):
+                if not self.send_batch(samples[start:start + self.max_samples]):
+                    self._spool_samples(samples[start:])
+                    return False
+            return True
+        
+        if not samples:
+            return True
+        
+        sent = True
+        for start in range(0, len(samples), self.max_samples):
+            batch = samples[start:start + self.max_samples]
+            if not self.send_batch(batch):
+                # Put the unsent samples back in front of anything queued since
+                with self._condition:
+                    self._pending = samples[start:] + self._pending
+                    self._oldest = time.monotonic()
+                    self._trim_pending()
+                sent = False
+                break
+        return sent
+    
+    def start(self):
+        """Start the background flusher if batching or a spool is enabled and it isn't running yet."""
+        if (not self.batching and self.spool is None) or self._flush_thread is not None:
+            return
+        with self._condition:
+            if self._flush_thread is not None:
+                return
+            self._stopping = False
+            self._flush_thread = threading.Thread(target=self._run, name="BatchFlusher", daemon=True)
+            self._flush_thread.start()
+    
+    def close(self):
+        """Stop the background flusher and send anything still queued."""
+        thread = self._flush_thread
+        if thread is not None:
+            with self._condition:
+                self._stopping = True
+                self._condition.notify()
+            thread.join(self.timeout + 5)
+            self._flush_thread = None
+        if self.batching:
+            self.flush()
+    
+    def _run(self):
+        """
+        Flush whenever max_samples are queued or the oldest sample is max_delay
+        seconds old, and replay the spool when a send succeeded.
+        """
+        while True:
+            with self._condition:
+                while not self._stopping and not self._replay_requested:
+                    if len(self._pending) >= self.max_samples:
+                        break
+                    if self._pending:
+                        remaining = self._oldest + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._stopping:
+                    return
+                self._replay_requested = False
+            # flush() replays the spool before sending the queued samples
+            if not (self.flush() if self.batching else self.replay_spool()):
+                # Server unreachable: wait a full window before retrying
+                with self._condition:
+                    self._condition.wait(self.max_delay)
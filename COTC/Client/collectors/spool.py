@@ -0,0 +1,99 @@
+"""
+Sample Spool
+
+Durable SQLite-backed FIFO for samples that could not be delivered to the
+server. Samples keep the timestamp they were collected at and are replayed
+oldest first, in batches, once the server is reachable again. The spool is
+capped at max_samples; beyond that the oldest samples are evicted.
+"""
+import json
+import logging
+import sqlite3
+import threading
+
+
+class Spool:
+    def __init__(self, path, max_samples=100000):
+        """
+        Open (or create) the spool.
+
+        Args:
+            path: Path to the SQLite file
+            max_samples: Maximum number of samples kept; the oldest are evicted beyond this
+        """
+        self.path = str(path)
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, sample TEXT NOT NULL)"
+        )
+        self._connection.commit()
+        # Kept in step with every insert and delete, so appends don't COUNT(*) the table
+        self._count = self._connection.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        self._evicted = 0
+
+    def append(self, samples):
+        """
+        Store samples at the end of the spool, evicting the oldest beyond max_samples.
+
+        Args:
+            samples: List of sample dicts (with their original timestamps)
+        """
+        if not samples:
+            return
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT INTO spool (sample) VALUES (?)",
+                    [(json.dumps(sample),) for sample in samples]
+                )
+                overflow = self._count + len(samples) - self.max_samples
+                if overflow > 0:
+                    self._connection.execute(
+                        "DELETE FROM spool WHERE id IN (SELECT id FROM spool ORDER BY id LIMIT ?)",
+                        (overflow,)
+                    )
+            self._count += len(samples) - max(overflow, 0)
+            if overflow > 0:
+                self._evicted += overflow
+        if overflow > 0:
+            logging.warning(f"Spool full, evicted {overflow} oldest samples")
+
+    def peek(self, limit):
+        """
+        Read the oldest samples without removing them.
+
+        Returns:
+            Tuple (list of sample dicts, id of the last one or None)
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, sample FROM spool ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        if not rows:
+            return [], None
+        return [json.loads(sample) for _, sample in rows], rows[-1][0]
+
+    def ack(self, last_id):
+        """Remove every sample up to and including last_id, once they were delivered."""
+        with self._lock:
+            with self._connection:
+                deleted = self._connection.execute("DELETE FROM spool WHERE id <= ?", (last_id,)).rowcount
+            self._count -= deleted
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def get_stats(self):
+        """Return the number of spooled and evicted samples."""
+        with self._lock:
+            return {"spooled": self._count, "evicted": self._evicted}
+
+    def close(self):
+        """Close the SQLite connection."""
+        with self._lock:
+            self._connection.close()
@@ -2,12 +2,83 @@
 Stock Data Collector
 
 This module is responsible for collecting stock price data from the Finnhub API.
+
+Quotes for all symbols are fetched concurrently by a bounded thread pool
+over one keep-alive session, each request with a timeout, and a token bucket
+keeps the request rate within the Finnhub per-minute quota. Quotes are
+cached for quote_cache_ttl seconds: a symbol with a fresh cached quote is
+neither fetched again nor reported again until the quote expires.
 """
 import requests
 import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+FINNHUB_QUOTE_URL = "https://finnhub.io/api/v1/quote"
+
+# Number of recent cycles and requests kept for the latency percentiles
+LATENCY_WINDOW = 500
+
+def percentiles(samples, points=(50, 90, 99)):
+    """
+    Nearest-rank percentiles of a list of numbers.
+    
+    Returns:
+        Dict like {"p50": ..., "p90": ..., "p99": ...}, empty if there are no samples
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {
+        f"p{point}": ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))]
+        for point in points
+    }
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        """
+        Initialize a token bucket.
+        
+        Args:
+            rate_per_minute: Tokens added per minute
+            burst: Maximum tokens held (defaults to one second's worth, at least 1)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self, timeout=None):
+        """
+        Take one token, waiting for it if necessary.
+        
+        Args:
+            timeout: Maximum seconds to wait, or None to wait as long as needed
+            
+        Returns:
+            True if a token was taken, False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
 
 class StockCollector:
-    def __init__(self, api_key, stocks_to_collect=None):
+    def __init__(self, api_key, stocks_to_collect=None, max_workers=8, timeout=5, rate_limit_per_minute=60,
+                 quote_cache_ttl=0):
         """
         Initialize the stock collector.
         
@@ -15,9 +86,31 @@ class StockCollector:
             api_key: Finnhub API key
             stocks_to_collect: List of stock symbols to collect data for.
                                If None, will attempt to get from server.
+            max_workers: Maximum concurrent quote requests
+            timeout: Seconds before a quote request is abandoned
+            rate_limit_per_minute: Upstream quota; requests beyond it wait for the token bucket
+            quote_cache_ttl: Seconds a fetched quote is reused (0 disables the cache)
         """
         self.api_key = api_key
         self.stocks_to_collect = stocks_to_collect or []
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.rate_limiter = TokenBucket(rate_limit_per_minute)
+        
+        # One keep-alive session with a connection per worker, shared by all quote requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="StockQuote")
+        
+        self.cycle_latencies = deque(maxlen=LATENCY_WINDOW)
+        self.request_latencies = deque(maxlen=LATENCY_WINDOW)
+        
+        # symbol -> (price, time.monotonic() when fetched)
+        self.quote_cache_ttl = quote_cache_ttl
+        self.quote_cache = {}
+        self.quote_cache_lock = threading.Lock()
         
     def get_stocks_from_server(self, server_url):
         """
@@ -30,7 +123,7 @@ class StockCollector:
             List of stock symbols or empty list if failed
         """
         try:
-            response = requests.get(f"{server_url}/metrics/stock/symbols")
+            response = self.session.get(f"{server_url}/metrics/stock/symbols", timeout=self.timeout)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -71,15 +164,51 @@ class StockCollector:
         Returns:
             Dict mapping stock symbols to their current prices
         """
+        started = time.monotonic()
+        # Symbols with a fresh cached quote were already reported
+        symbols = [symbol for symbol in dict.fromkeys(self.stocks_to_collect) if self.get_cached_price(symbol) is None]
         results = {}
         
-        for symbol in self.stocks_to_collect:
-            price = self.get_stock_price(symbol)
+        for symbol, price in zip(symbols, self.executor.map(self.get_stock_price, symbols)):
             if price is not None:
                 results[symbol] = price
         
+        self.cycle_latencies.append(time.monotonic() - started)
+        logging.debug(f"Collected {len(results)}/{len(symbols)} quotes; latency {self.get_latency_stats()}")
         return results
     
+    def get_cached_price(self, symbol):
+        """
+        Return the cached quote for a symbol if it is younger than quote_cache_ttl.
+        
+        Returns:
+            Price or None if there is no fresh quote
+        """
+        if not self.quote_cache_ttl:
+            return None
+        with self.quote_cache_lock:
+            cached = self.quote_cache.get(symbol)
+        if cached is None or time.monotonic() - cached[1] >= self.quote_cache_ttl:
+            return None
+        return cached[0]
+    
+    def get_latency_stats(self):
+        """
+        Latency percentiles, in seconds, over the recent collection cycles and quote requests.
+        
+        Returns:
+            Dict with "cycle" and "request" percentile dicts
+        """
+        return {
+            "cycle": percentiles(list(self.cycle_latencies)),
+            "request": percentiles(list(self.request_latencies))
+        }
+    
+    def close(self):
+        """Stop the worker threads and close the HTTP session."""
+        self.executor.shutdown(wait=False)
+        self.session.close()
+    
     def get_stock_price(self, symbol):
         """
         Get the current price for a specific stock symbol.
@@ -90,14 +219,43 @@ class StockCollector:
         Returns:
             Current price or None if request failed
         """
+        price = self.get_cached_price(symbol)
+        if price is not None:
+            return price
+        
+        price = self.fetch_quote(symbol)
+        if price is not None and self.quote_cache_ttl:
+            with self.quote_cache_lock:
+                self.quote_cache[symbol] = (price, time.monotonic())
+        return price
+    
+    def fetch_quote(self, symbol):
+        """
+        Fetch the current price of a symbol from Finnhub, bypassing the cache.
+        
+        Args:
+            symbol: Stock symbol to get price for
+            
+        Returns:
+            Current price or None if request failed
+        """
+        if not self.rate_limiter.acquire(timeout=self.timeout):
+            logging.warning(f"Skipping {symbol} this cycle: Finnhub rate limit reached")
+            return None
+        
+        started = time.monotonic()
         try:
-            finnhub_url = f"https://finnhub.io/api/v1/quote?symbol={symbol}&token={self.api_key}"
-            response = requests.get(finnhub_url)
+            response = self.session.get(
+                FINNHUB_QUOTE_URL,
+                params={"symbol": symbol, "token": self.api_key},
+                timeout=self.timeout
+            )
+            self.request_latencies.append(time.monotonic() - started)
             
             if response.status_code == 200:
                 stock_data = response.json()
                 price = stock_data['c']  # Current price
-                logging.info(f"Got price for {symbol}: ${price}")
+                logging.debug(f"Got price for {symbol}: ${price}")
                 return price
             else:
                 logging.warning(f"Failed to get stock data for {symbol}: {response.status_code}")
@@ -0,0 +1,113 @@
+"""
+Request Decompression
+
+WSGI middleware that transparently decompresses request bodies sent with
+Content-Encoding: gzip, deflate or (when the zstandard package is installed)
+zstd, so the endpoints read them with request.get_json() as usual. The
+decompressed size is capped to protect against compression bombs: larger
+bodies are answered with 413, corrupt ones with 400.
+"""
+import io
+import json
+import logging
+import zlib
+from werkzeug.wsgi import get_input_stream
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Default cap on a decompressed request body, in bytes
+MAX_DECOMPRESSED_BYTES = 16 * 1024 * 1024
+
+# Bytes read from the compressed stream per step
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class DecompressedTooLarge(Exception):
+    pass
+
+
+def _zlib_decompress(stream, max_bytes, wbits):
+    """Inflate a gzip/zlib stream, stopping as soon as max_bytes is exceeded."""
+    decompressor = zlib.decompressobj(wbits)
+    output = bytearray()
+    while True:
+        chunk = stream.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        output += decompressor.decompress(chunk, max_bytes + 1 - len(output))
+        if len(output) > max_bytes or decompressor.unconsumed_tail:
+            raise DecompressedTooLarge()
+    output += decompressor.flush()
+    if len(output) > max_bytes:
+        raise DecompressedTooLarge()
+    if not decompressor.eof:
+        raise zlib.error("Truncated compressed body")
+    return bytes(output)
+
+def _zstd_decompress(stream, max_bytes):
+    """Decompress a zstd stream, stopping as soon as max_bytes is exceeded."""
+    reader = zstandard.ZstdDecompressor().stream_reader(stream)
+    output = bytearray()
+    while True:
+        chunk = reader.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        output += chunk
+        if len(output) > max_bytes:
+            raise DecompressedTooLarge()
+    return bytes(output)
+
+# Content-Encoding -> decompressor(stream, max_bytes)
+DECODERS = {
+    "gzip": lambda stream, max_bytes: _zlib_decompress(stream, max_bytes, 16 + zlib.MAX_WBITS),
+    "deflate": lambda stream, max_bytes: _zlib_decompress(stream, max_bytes, zlib.MAX_WBITS)
+}
+if zstandard is not None:
+    DECODERS["zstd"] = _zstd_decompress
+
+
+class DecompressionMiddleware:
+    def __init__(self, app, max_bytes=MAX_DECOMPRESSED_BYTES):
+        """
+        Wrap a WSGI application.
+
+        Args:
+            app: The WSGI application (e.g. flask_app.wsgi_app)
+            max_bytes: Largest accepted decompressed body
+        """
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if not encoding or encoding == "identity":
+            return self.app(environ, start_response)
+
+        decoder = DECODERS.get(encoding)
+        if decoder is None:
+            return self._error(start_response, "415 Unsupported Media Type", f"Unsupported Content-Encoding: {encoding}")
+
+        try:
+            body = decoder(get_input_stream(environ), self.max_bytes)
+        except DecompressedTooLarge:
+            return self._error(
+                start_response, "413 Request Entity Too Large",
+                f"Decompressed body exceeds {self.max_bytes} bytes"
+            )
+        except Exception as e:
+            logging.warning(f"Failed to decompress {encoding} request body: {e}")
+            return self._error(start_response, "400 Bad Request", "Invalid compressed body")
+
+        environ["wsgi.input"] = io.BytesIO(body)
+        environ["CONTENT_LENGTH"] = str(len(body))
+        del environ["HTTP_CONTENT_ENCODING"]
+        return self.app(environ, start_response)
+
+    def _error(self, start_response, status, message):
+        """Answer with a JSON error like the endpoints do."""
+        body = json.dumps({"error": message}).encode("utf-8")
+        start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+        return [body]
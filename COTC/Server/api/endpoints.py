@@ -1,15 +1,38 @@
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
 import json
 import requests
 from datetime import datetime
 from database.models import (
-    insert_system_metric, insert_stock_data,
+    insert_stock_data,
     fetch_latest_system_metrics, fetch_latest_stock_data,
     fetch_stock_symbols, get_stock_history, init_database as init_db,
-    get_system_metrics_history
+    get_system_metrics_history, get_system_metrics_history_page, get_stock_history_page,
+    get_system_metrics_rollup_page, get_stock_rollup_page,
+    get_system_metrics_resolution, get_stock_resolution, configure_history, pick_resolution, AUTO_RESOLUTION,
+    iter_system_metrics_history, iter_stock_history, iter_system_metrics_rollups, iter_stock_rollups,
+    DEFAULT_PAGE_SIZE, SYSTEM_EXPORT_COLUMNS, STOCK_EXPORT_COLUMNS,
+    SYSTEM_ROLLUP_EXPORT_COLUMNS, STOCK_ROLLUP_EXPORT_COLUMNS
 )
+from database.rollups import RESOLUTIONS
+from api.export import EXPORT_FORMATS
+from api.compression import DecompressionMiddleware, MAX_DECOMPRESSED_BYTES
+from api.quote_fetcher import QuoteFetcher, DEFAULT_BASE_URL
+from database.ingestion import (
+    ingest_system_metrics, ingest_batch, validate_sample, resolve_device_pk, parse_timestamp, configure_ingestion,
+    STOCK_DEDUP_TOLERANCE
+)
+from database.device_cache import get_device_cache
+from database.last_seen import get_last_seen_tracker
+from database.write_buffer import WriteBehindBuffer, WriteBufferFull
+from database.retention import RetentionWorker
+from database.query_cache import configure_query_cache, get_query_cache, DEVICES, SYSTEM_METRICS, STOCK_DATA
+from database.events import get_event_broker
+from database.hot_tier import configure_hot_tier, get_hot_tier
+import atexit
 import logging
 import os
+import threading
+import time
 from sqlalchemy import inspect
 from sqlalchemy.exc import SQLAlchemyError
 from pathlib import Path
@@ -62,13 +85,37 @@ def reset_pending_stock_symbol():
 def register_routes(app, config):
     """Register all routes with the Flask app"""
     
+    # Apply pool/PRAGMA settings before the first engine for this database is created
+    from database.schema import configure_database
+    configure_database(config.get('database'))
+    
+    # Long history ranges, and ranges whose raw rows retention has pruned, are read from the rollups;
+    # see the "resolution" parameter of the history endpoints
+    retention_config = config.get('retention', {})
+    configure_history(dict(
+        config.get('history') or {},
+        retention=retention_config.get('tables', {}) if retention_config.get('enabled') else {}
+    ))
+    
+    # Stock prices arriving well within one stock_interval of a stored price for the symbol are dropped as
+    # duplicates; the 10% tolerance keeps the next interval's price when its timestamp arrives a little early
+    configure_ingestion({"stock_dedup_seconds": config.get('stock_interval', 0) * STOCK_DEDUP_TOLERANCE})
+    
+    # Accept gzip/deflate/zstd request bodies (e.g. batched client uploads), with a cap on their decompressed size
+    app.wsgi_app = DecompressionMiddleware(
+        app.wsgi_app,
+        max_bytes=config.get('max_decompressed_bytes', MAX_DECOMPRESSED_BYTES)
+    )
+    
     # Function to check if all required tables exist in the database
     def check_tables_exist(db_path):
         from database.schema import get_engine
         try:
             engine = get_engine(db_path)
             inspector = inspect(engine)
-            required_tables = ['devices', 'metric_types', 'system_metrics', 'stock_symbols', 'stock_data']
+            required_tables = ['devices', 'metric_types', 'system_metrics', 'stock_symbols', 'stock_data',
+                               'latest_metrics', 'latest_stock_prices',
+                               'system_metric_rollups', 'stock_data_rollups']
             existing_tables = inspector.get_table_names()
             
             for table in required_tables:
@@ -103,7 +150,162 @@ def register_routes(app, config):
         except Exception as e:
             logging.error(f"Error initializing database: {e}")
 
+    # Optional write-behind mode: handlers queue validated samples for a background flusher
+    write_buffer = None
+    write_behind_config = config.get('write_behind', {})
+    if write_behind_config.get('enabled'):
+        write_buffer = WriteBehindBuffer(
+            config['database_path'],
+            allowed_metrics=config['system_metrics'],
+            max_queue=write_behind_config.get('max_queue', 10000),
+            flush_size=write_behind_config.get('flush_size', 500),
+            flush_interval=write_behind_config.get('flush_interval', 1.0)
+        )
+    
+    def buffer_full_response(error):
+        """Backpressure response used when the write-behind queue is full"""
+        app.logger.warning(f"Refusing samples: {error}")
+        response = jsonify({"error": "Server busy, please retry shortly"})
+        response.headers['Retry-After'] = str(max(1, int(write_behind_config.get('flush_interval', 1.0))))
+        return response, 503
+
+    # Identity cache mapping MAC address / device_id to devices.id for the ingest path
+    device_cache = get_device_cache(config['database_path'])
+    
+    # Shared result cache for the dashboard's read queries, invalidated by ingestion
+    configure_query_cache(config.get('query_cache'))
+    query_cache = get_query_cache(config['database_path'])
+    
+    # Recent samples kept in memory for dashboard reads
+    configure_hot_tier(config.get('hot_tier'))
+    hot_tier = get_hot_tier(config['database_path'])
+    
+    # Pub/sub feeding the /events stream that tells dashboards when new data arrives
+    live_updates_config = config.get('live_updates', {})
+    event_broker = get_event_broker(config['database_path'])
+    event_broker.max_subscribers = live_updates_config.get('max_clients', 100)
+    
+    # last_seen is kept in memory by the ingest path and written back in periodic batched UPDATEs
+    last_seen_tracker = get_last_seen_tracker(config['database_path'])
+    last_seen_tracker.flush_interval = config.get('last_seen_flush_interval', 15)
+    atexit.register(last_seen_tracker.stop)
+    
+    # Retention: prune expired raw samples and rollups in small chunks in the background
+    retention_worker = None
+    if retention_config.get('enabled'):
+        retention_worker = RetentionWorker(
+            config['database_path'],
+            retention_config.get('tables', {}),
+            interval_seconds=retention_config.get('interval_seconds', 3600),
+            chunk_size=retention_config.get('chunk_size', 1000),
+            chunk_pause=retention_config.get('chunk_pause_seconds', 0.05),
+            vacuum_pages=retention_config.get('incremental_vacuum_pages', 1000)
+        )
+    
+    # Optional shared quote fetcher: one upstream call per symbol per interval for the whole fleet
+    quote_fetcher = None
+    quote_fetcher_config = config.get('quote_fetcher', {})
+    if quote_fetcher_config.get('enabled'):
+        quote_fetcher = QuoteFetcher(
+            config['database_path'],
+            api_key=quote_fetcher_config.get('api_key'),
+            base_url=quote_fetcher_config.get('base_url', DEFAULT_BASE_URL),
+            interval_seconds=quote_fetcher_config.get('interval_seconds', config.get('stock_interval', 10)),
+            max_workers=quote_fetcher_config.get('max_workers', 8),
+            timeout=quote_fetcher_config.get('timeout', 5),
+            rate_limit_per_minute=quote_fetcher_config.get('rate_limit_per_minute', 60),
+            # A symbol just added from the dashboard is fetched before any price is stored for it
+            extra_symbols=lambda: [symbol for symbol in [get_pending_stock_symbol()] if symbol]
+        )
+    
+    # The workers above start with the first request rather than at import, so that under
+    # the debug reloader only the process serving requests runs them, not the watcher as well.
+    # Stopping them at exit drains anything still queued in the write buffer.
+    background_workers = [worker for worker in (write_buffer, retention_worker, quote_fetcher) if worker]
+    background_workers_started = threading.Event()
+    background_workers_lock = threading.Lock()
+    
+    @app.before_request
+    def start_background_workers():
+        """Start the background workers once, before the first request is handled"""
+        if background_workers_started.is_set():
+            return
+        with background_workers_lock:
+            if background_workers_started.is_set():
+                return
+            for worker in background_workers:
+                worker.start()
+                atexit.register(worker.stop)
+            background_workers_started.set()
+    
     # Route definitions
+    @app.route('/stats', methods=['GET'])
+    def get_stats():
+        """Get runtime counters for the ingestion pipeline"""
+        return jsonify({
+            "write_buffer": write_buffer.get_stats() if write_buffer else None,
+            "device_cache": device_cache.get_stats(),
+            "last_seen": last_seen_tracker.get_stats(),
+            "retention": retention_worker.get_stats() if retention_worker else None,
+            "query_cache": query_cache.get_stats(),
+            "hot_tier": hot_tier.get_stats(),
+            "quote_fetcher": quote_fetcher.get_stats() if quote_fetcher else None,
+            "events": event_broker.get_stats()
+        })
+
+    @app.route('/events', methods=['GET'])
+    def live_events():
+        """
+        Server-Sent Events stream of data changes.
+        Query parameters:
+            device_id - optional: only report metrics of this device ("" for none, "all" for every device)
+            symbol    - optional: only report prices of this symbol ("" for none)
+
+        Each "update" event carries {"topics": [...]} naming the data that changed:
+        stock_symbols and devices, and system_metrics:<devices.id> and
+        stock_data:<symbol> for the devices and symbols watched (every one when the
+        parameter is omitted); comments are sent as heartbeats. Answers 204 when live
+        updates are disabled, which tells EventSource not to reconnect, and 503 when
+        too many clients are connected.
+        """
+        if not live_updates_config.get('enabled'):
+            return Response(status=204)
+        
+        keys = {}
+        device_id = request.args.get('device_id')
+        if device_id is not None and device_id != 'all':
+            device_pk = resolve_device_pk(config['database_path'], device_id=device_id) if device_id else None
+            keys[SYSTEM_METRICS] = [device_pk] if device_pk is not None else []
+        symbol = request.args.get('symbol')
+        if symbol is not None:
+            keys[STOCK_DATA] = [symbol.upper().strip()] if symbol.strip() else []
+        
+        subscription = event_broker.subscribe(keys)
+        if subscription is None:
+            return jsonify({"error": "Too many live update clients"}), 503
+        
+        heartbeat = live_updates_config.get('heartbeat_seconds', 15)
+        min_push_interval = live_updates_config.get('min_push_interval', 1.0)
+        
+        def stream():
+            try:
+                yield "retry: 5000\n\n"
+                while True:
+                    topics = subscription.wait(heartbeat)
+                    if topics is None:
+                        yield ": keep-alive\n\n"
+                        continue
+                    yield f"event: update\ndata: {json.dumps({'topics': sorted(topics)})}\n\n"
+                    # Let further changes accumulate into the next event
+                    time.sleep(min_push_interval)
+            finally:
+                event_broker.unsubscribe(subscription)
+        
+        response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
     @app.route('/devices', methods=['GET'])
     def get_devices():
         """Get all registered devices"""
@@ -114,7 +316,14 @@ def register_routes(app, config):
         try:
             devices = session.query(Device).all()
             logging.warning(f"Retrieved devices: {[{d.device_id: d.hostname} for d in devices]}")
-            return jsonify([device.to_dict() for device in devices])
+            
+            # Overlay the in-memory last_seen, which is newer than the stored one between flushes
+            devices_data = []
+            for device in devices:
+                device_dict = device.to_dict()
+                device_dict["last_seen"] = last_seen_tracker.get(device.id, device.last_seen).isoformat()
+                devices_data.append(device_dict)
+            return jsonify(devices_data)
         except Exception as e:
             logging.error(f"Error getting devices: {e}")
             return jsonify({"error": str(e)}), 500
@@ -153,6 +362,14 @@ def register_routes(app, config):
                     status_code = 200
                     
                     session.commit()
+                    # The device's identifiers may have changed, drop any cached mapping
+                    device_cache.invalidate(
+                        mac_address=device_data['mac_address'],
+                        device_id=device_data['device_id'],
+                        pk=existing_device_by_mac.id
+                    )
+                    query_cache.invalidate(DEVICES)
+                    event_broker.publish([DEVICES])
                     return jsonify({
                         "message": message,
                         "device_id": existing_device_by_mac.device_id,
@@ -189,9 +406,14 @@ def register_routes(app, config):
                 
                 session.commit()
                 
-                # Verify the device was saved
-                saved_device = session.query(Device).filter_by(device_id=device_data['device_id']).first()
-                logging.warning(f"Verified saved device: {saved_device.device_id if saved_device else 'Not found'}")
+                # The device's identifiers may have changed (MAC migration), drop any cached mapping
+                device_cache.invalidate(
+                    mac_address=device_data['mac_address'],
+                    device_id=device_data['device_id'],
+                    pk=existing_device.id if existing_device else None
+                )
+                query_cache.invalidate(DEVICES)
+                event_broker.publish([DEVICES])
                 
                 return jsonify({
                     "message": message,
@@ -234,65 +456,108 @@ def register_routes(app, config):
             
             metrics = payload['metrics']
             
-            # Find the device by MAC address first
-            from database.models import get_session, Device
-            from database.schema import get_or_create_device
+            # In write-behind mode, validate now and let the flusher store the sample
+            if write_buffer:
+                sample, error = validate_sample(
+                    {"type": "system", "device_id": device_id, "mac_address": mac_address,
+                     "hostname": hostname, "metrics": metrics},
+                    datetime.now(),
+                    config['system_metrics']
+                )
+                if error:
+                    return jsonify({"error": error}), 400
+                try:
+                    write_buffer.submit([sample])
+                except WriteBufferFull as e:
+                    return buffer_full_response(e)
+                return jsonify({"message": "Metrics stored successfully"}), 200
             
-            session = get_session(config['database_path'])
+            # Resolve the device and metric types once and store every metric in one transaction
             try:
-                # Try to find the device
-                device = None
-                
-                # Check by MAC address first
-                if mac_address:
-                    device = session.query(Device).filter_by(mac_address=mac_address).first()
-                
-                # If not found by MAC or MAC not provided, try by device_id
-                if not device and device_id:
-                    device = session.query(Device).filter_by(device_id=device_id).first()
-                
-                # If still not found but we have MAC, create a new device
-                if not device and mac_address:
-                    logging.warning(f"Creating new device for MAC: {mac_address}")
-                    device = get_or_create_device(session, device_id=None, mac_address=mac_address, hostname=hostname)
-                    session.add(device)
-                    session.flush()  # Generate ID
-                elif not device:
-                    return jsonify({"error": "Device not found and insufficient information to create one"}), 400
-                
-                # Now we have a valid device, we can store metrics
-                device_id_for_metrics = device.device_id
-                
-                # Update device last_seen timestamp
-                device.last_seen = datetime.now()
-                session.commit()
-                
-                # Store each metric in the database
-                for metric_name, metric_value in metrics.items():
-                    if metric_name in config['system_metrics']:
-                        # Using the found/created device's ID to store metrics
-                        insert_system_metric(
-                            config['database_path'],
-                            metric_name,
-                            metric_value,
-                            device_id=device_id_for_metrics,
-                            mac_address=mac_address
-                        )
-                
-                return jsonify({"message": "Metrics stored successfully"}), 200
-                
+                result = ingest_system_metrics(
+                    config['database_path'],
+                    metrics,
+                    device_id=device_id,
+                    mac_address=mac_address,
+                    hostname=hostname,
+                    allowed_metrics=config['system_metrics']
+                )
             except Exception as e:
-                session.rollback()
                 app.logger.error(f"Error processing system metrics: {e}")
                 return jsonify({"error": str(e)}), 500
-            finally:
-                session.close()
+            
+            if not result["success"]:
+                return jsonify({"error": result["error"]}), 400
+            
+            return jsonify({"message": "Metrics stored successfully"}), 200
             
         except Exception as e:
             app.logger.error(f"Error in PUT /metrics/system: {e}")
             return jsonify({"error": str(e)}), 500
 
 
+    # Bulk ingestion endpoint for many samples from many devices and symbols
+    @app.route('/metrics/batch', methods=['POST'])
+    def batch_metrics_endpoint():
+        """
+        POST: Receive and store a batch of timestamped system and stock samples
+        Expected JSON payload (a bare list of samples is also accepted):
+        {
+            "samples": [
+                {"type": "system", "mac_address": "string", "device_id": "string",
+                 "hostname": "string", "metrics": {"cpu_usage": float}, "timestamp": "ISO-8601"},
+                {"type": "stock", "symbol": "string", "price": float, "timestamp": "ISO-8601"}
+            ]
+        }
+        Returns a status for every sample, in order; stock prices already stored
+        within 90% of stock_interval for their symbol are reported as "duplicate".
+        """
+        try:
+            payload = request.get_json(silent=True)
+            samples = payload.get('samples') if isinstance(payload, dict) else payload
+            
+            if not isinstance(samples, list):
+                return jsonify({"error": "Expected a list of samples"}), 400
+            
+            max_samples = config.get('batch_max_samples', 10000)
+            if len(samples) > max_samples:
+                return jsonify({"error": f"Batch too large (maximum {max_samples} samples)"}), 413
+            
+            if write_buffer:
+                # Validate now, queue the valid samples and report them as queued
+                now = datetime.now()
+                results = []
+                queued = []
+                for index, sample in enumerate(samples):
+                    normalised, error = validate_sample(sample, now, config['system_metrics'])
+                    if error:
+                        results.append({"index": index, "status": "rejected", "error": error})
+                    else:
+                        queued.append(normalised)
+                        results.append({"index": index, "status": "queued"})
+                try:
+                    write_buffer.submit(queued)
+                except WriteBufferFull as e:
+                    return buffer_full_response(e)
+            else:
+                results = ingest_batch(
+                    config['database_path'],
+                    samples,
+                    allowed_metrics=config['system_metrics']
+                )
+            
+            accepted = sum(1 for result in results if result['status'] != 'rejected')
+            return jsonify({
+                "accepted": accepted,
+                "rejected": len(results) - accepted,
+                "duplicates": sum(1 for result in results if result['status'] == 'duplicate'),
+                "results": results
+            }), 200
+            
+        except Exception as e:
+            app.logger.error(f"Error in POST /metrics/batch: {e}")
+            return jsonify({"error": str(e)}), 500
+
     # Endpoint: Poll for pending stock symbol
     @app.route('/metrics/stock/poll', methods=['GET'])
     def poll_stock_symbol():
@@ -309,30 +574,15 @@ def register_routes(app, config):
         if not (device_id or mac_address):
             return jsonify({"error": "Either mac_address or device_id is required"}), 400
         
-        # Verify device exists
-        from database.models import get_session
-        from database.schema import Device, get_or_create_device
-        
-        session = get_session(config['database_path'])
         try:
-            # Try to find the device
-            device = None
-            
-            # Check by MAC address first
-            if mac_address:
-                device = session.query(Device).filter_by(mac_address=mac_address).first()
-            
-            # If not found by MAC or MAC not provided, try by device_id
-            if not device and device_id:
-                device = session.query(Device).filter_by(device_id=device_id).first()
-            
-            # If still not found but we have MAC, create a new device
-            if not device and mac_address:
-                logging.warning(f"Creating new device for MAC: {mac_address}")
-                device = get_or_create_device(session, device_id=None, mac_address=mac_address, hostname=hostname)
-                session.add(device)
-                session.commit()
-            elif not device:
+            # Verify the device exists (or create it from its MAC), answered from the identity cache when known
+            device_pk = resolve_device_pk(
+                config['database_path'],
+                device_id=device_id,
+                mac_address=mac_address,
+                hostname=hostname
+            )
+            if device_pk is None:
                 return jsonify({"error": "Device not found and insufficient information to create one"}), 400
             
             # Device found or created, proceed with polling
@@ -349,11 +599,8 @@ def register_routes(app, config):
             return jsonify({"symbol": None})
             
         except Exception as e:
-            session.rollback()
             app.logger.error(f"Error in poll_stock_symbol: {e}")
             return jsonify({"error": str(e)}), 500
-        finally:
-            session.close()
 
     # Update the stock metrics endpoint to support both formats
     @app.route('/metrics/stock/<symbol>', methods=['PUT'])
@@ -387,6 +634,14 @@ def register_routes(app, config):
             except (ValueError, TypeError):
                 return jsonify({"error": "Price must be a valid number"}), 400
             
+            # In write-behind mode, queue the price for the flusher
+            if write_buffer:
+                try:
+                    write_buffer.submit([{"type": "stock", "symbol": symbol, "price": price, "timestamp": datetime.now()}])
+                except WriteBufferFull as e:
+                    return buffer_full_response(e)
+                return jsonify({"message": f"Stock data for {symbol} stored successfully"}), 200
+            
             # Insert the stock data
             success = insert_stock_data(
                 config['database_path'],
@@ -394,27 +649,8 @@ def register_routes(app, config):
                 price
             )
             
+            # The ingestion path also adds new symbols to the stock symbols table
             if success:
-                # Also add/update the symbol in the stock symbols table
-                from database.models import get_session
-                from database.schema import StockSymbol
-                
-                session = get_session(config['database_path'])
-                try:
-                    # Check if symbol already exists
-                    stock_symbol = session.query(StockSymbol).filter_by(symbol=symbol).first()
-                    if not stock_symbol:
-                        # Add new symbol
-                        stock_symbol = StockSymbol(symbol=symbol)
-                        session.add(stock_symbol)
-                        session.commit()
-                        app.logger.info(f"Added new stock symbol: {symbol}")
-                except Exception as e:
-                    session.rollback()
-                    app.logger.error(f"Error updating stock symbol: {e}")
-                finally:
-                    session.close()
-                
                 return jsonify({"message": f"Stock data for {symbol} stored successfully"}), 200
             else:
                 return jsonify({"error": f"Failed to store stock data for {symbol}"}), 500
@@ -452,6 +688,14 @@ def register_routes(app, config):
             except (ValueError, TypeError):
                 return jsonify({"error": "Price must be a valid number"}), 400
             
+            # In write-behind mode, queue the price for the flusher
+            if write_buffer:
+                try:
+                    write_buffer.submit([{"type": "stock", "symbol": symbol, "price": price, "timestamp": datetime.now()}])
+                except WriteBufferFull as e:
+                    return buffer_full_response(e)
+                return jsonify({"message": f"Stock data for {symbol} stored successfully"}), 200
+            
             # Insert the stock data
             success = insert_stock_data(
                 config['database_path'],
@@ -459,27 +703,8 @@ def register_routes(app, config):
                 price
             )
             
+            # The ingestion path also adds new symbols to the stock symbols table
             if success:
-                # Also add/update the symbol in the stock symbols table
-                from database.models import get_session
-                from database.schema import StockSymbol
-                
-                session = get_session(config['database_path'])
-                try:
-                    # Check if symbol already exists
-                    stock_symbol = session.query(StockSymbol).filter_by(symbol=symbol).first()
-                    if not stock_symbol:
-                        # Add new symbol
-                        stock_symbol = StockSymbol(symbol=symbol)
-                        session.add(stock_symbol)
-                        session.commit()
-                        app.logger.info(f"Added new stock symbol: {symbol}")
-                except Exception as e:
-                    session.rollback()
-                    app.logger.error(f"Error updating stock symbol: {e}")
-                finally:
-                    session.close()
-                
                 return jsonify({"message": f"Stock data for {symbol} stored successfully"}), 200
             else:
                 return jsonify({"error": f"Failed to store stock data for {symbol}"}), 500
@@ -488,3 +713,190 @@ def register_routes(app, config):
             app.logger.error(f"Error in PUT /metrics/stock: {e}")
             return jsonify({"error": str(e)}), 500
 
+    def parse_history_args():
+        """
+        Parse the range, cursor, limit and resolution query parameters shared by the history endpoints.
+
+        Timestamps may be ISO-8601 strings or epoch seconds. The resolution is
+        "auto" (the default), "raw" or a rollup resolution in seconds.
+
+        Returns:
+            Tuple (arguments dict, error message or None)
+        """
+        arguments = {}
+        for name in ('since', 'until', 'after_timestamp'):
+            value = request.args.get(name)
+            if value is None:
+                arguments[name] = None
+                continue
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+            arguments[name] = parse_timestamp(value, None)
+            if arguments[name] is None:
+                return None, f"Invalid timestamp for {name}"
+        
+        try:
+            arguments['after_id'] = request.args.get('after_id', type=int)
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return None, "after_id and limit must be integers"
+        if limit <= 0:
+            return None, "limit must be a positive integer"
+        arguments['limit'] = min(limit, config.get('history_max_page_size', 5000))
+        
+        resolution = request.args.get('resolution', AUTO_RESOLUTION).lower()
+        if resolution == AUTO_RESOLUTION:
+            arguments['resolution'] = AUTO_RESOLUTION
+        elif resolution in ('raw', '0'):
+            arguments['resolution'] = None
+        elif resolution.isdigit() and int(resolution) in RESOLUTIONS:
+            arguments['resolution'] = int(resolution)
+        else:
+            return None, f"resolution must be auto, raw or one of {', '.join(str(r) for r in RESOLUTIONS)}"
+        return arguments, None
+
+    @app.route('/metrics/system/history', methods=['GET'])
+    def system_metrics_history_endpoint():
+        """
+        GET: One page of system metrics history
+        Query parameters:
+            metric          - required, metric type name (e.g. cpu_usage)
+            device_id       - optional, defaults to every device
+            since, until    - optional time range (ISO-8601 or epoch seconds)
+            after_timestamp - optional cursor from the previous page's next_cursor
+            after_id        - optional cursor tiebreak from next_cursor
+            limit           - optional page size
+            resolution      - optional: "auto" (default), "raw", or 60, 3600 or 86400 seconds
+        With "auto", long ranges are read from the rollups at the coarsest resolution
+        that still gives enough points. The response's "resolution" is 0 for raw rows;
+        pass it back when following next_cursor so every page has the same resolution.
+        """
+        try:
+            metric_name = request.args.get('metric')
+            if not metric_name:
+                return jsonify({"error": "Missing required parameter: metric"}), 400
+            
+            arguments, error = parse_history_args()
+            if error:
+                return jsonify({"error": error}), 400
+            
+            device_id = request.args.get('device_id')
+            resolution = arguments.pop('resolution')
+            if resolution == AUTO_RESOLUTION:
+                resolution = get_system_metrics_resolution(
+                    config['database_path'], (metric_name,), device_id, arguments['since'], arguments['until']
+                )
+            
+            if resolution:
+                page = get_system_metrics_rollup_page(
+                    config['database_path'], metric_name, resolution, device_id=device_id, **arguments
+                )
+            else:
+                page = get_system_metrics_history_page(
+                    config['database_path'], metric_name, device_id=device_id, **arguments
+                )
+                page["resolution"] = 0
+            return jsonify(page), 200
+        except Exception as e:
+            app.logger.error(f"Error in GET /metrics/system/history: {e}")
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/metrics/stock/<symbol>/history', methods=['GET'])
+    def stock_history_endpoint(symbol):
+        """
+        GET: One page of price history for a stock symbol
+        Query parameters:
+            since, until    - optional time range (ISO-8601 or epoch seconds)
+            after_timestamp - optional cursor from the previous page's next_cursor
+            after_id        - optional cursor tiebreak from next_cursor
+            limit           - optional page size
+            resolution      - optional: "auto" (default), "raw", or 60, 3600 or 86400 seconds
+        Resolutions are handled like in /metrics/system/history.
+        """
+        try:
+            arguments, error = parse_history_args()
+            if error:
+                return jsonify({"error": error}), 400
+            
+            symbol = symbol.upper().strip()
+            resolution = arguments.pop('resolution')
+            if resolution == AUTO_RESOLUTION:
+                resolution = get_stock_resolution(
+                    config['database_path'], symbol, arguments['since'], arguments['until']
+                )
+            
+            if resolution:
+                page = get_stock_rollup_page(config['database_path'], symbol, resolution, **arguments)
+            else:
+                page = get_stock_history_page(config['database_path'], symbol, **arguments)
+                page["resolution"] = 0
+            return jsonify(page), 200
+        except Exception as e:
+            app.logger.error(f"Error in GET /metrics/stock/{symbol}/history: {e}")
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/export', methods=['GET'])
+    def export_history():
+        """
+        GET: Stream history as a file
+        Query parameters:
+            type         - "system" (default) or "stock"
+            format       - "csv" (default), "ndjson" or, when pyarrow is installed, "parquet"
+            metric       - optional metric type name (system)
+            device_id    - optional device ID (system)
+            symbol       - optional stock symbol (stock)
+            since, until - optional time range (ISO-8601 or epoch seconds)
+            resolution   - optional: "raw" (default), "auto", or 60, 3600 or 86400 seconds
+        Raw rows are exported unless a resolution is given. With "auto", raw rows are
+        exported unless the range reaches back past the raw retention, in which case the
+        finest rollup still covering it is exported (for a range without since, that is
+        the whole history).
+        Rows are read from a server-side cursor and sent in chunks, ordered by timestamp.
+        """
+        try:
+            export_type = request.args.get('type', 'system')
+            if export_type not in ('system', 'stock'):
+                return jsonify({"error": "type must be system or stock"}), 400
+            
+            export_format = request.args.get('format', 'csv').lower()
+            if export_format not in EXPORT_FORMATS:
+                return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+            encoder, mimetype, extension = EXPORT_FORMATS[export_format]
+            
+            arguments, error = parse_history_args()
+            if error:
+                return jsonify({"error": error}), 400
+            
+            # Unlike the history pages, an export is raw unless asked otherwise
+            resolution = arguments['resolution'] if 'resolution' in request.args else None
+            if resolution == AUTO_RESOLUTION:
+                resolution = pick_resolution(export_type, arguments['since'], arguments['until'], min_points=0)
+            window = {"since": arguments['since'], "until": arguments['until']}
+            
+            if export_type == 'system':
+                filters = {"metric_name": request.args.get('metric'), "device_id": request.args.get('device_id')}
+                if resolution:
+                    columns = SYSTEM_ROLLUP_EXPORT_COLUMNS
+                    rows = iter_system_metrics_rollups(config['database_path'], resolution, **filters, **window)
+                else:
+                    columns = SYSTEM_EXPORT_COLUMNS
+                    rows = iter_system_metrics_history(config['database_path'], **filters, **window)
+            else:
+                symbol = request.args.get('symbol')
+                symbol = symbol.upper().strip() if symbol else None
+                if resolution:
+                    columns = STOCK_ROLLUP_EXPORT_COLUMNS
+                    rows = iter_stock_rollups(config['database_path'], resolution, symbol=symbol, **window)
+                else:
+                    columns = STOCK_EXPORT_COLUMNS
+                    rows = iter_stock_history(config['database_path'], symbol=symbol, **window)
+            
+            response = Response(stream_with_context(encoder(columns, rows)), mimetype=mimetype)
+            response.headers['Content-Disposition'] = f'attachment; filename="{export_type}_history.{extension}"'
+            return response
+        except Exception as e:
+            app.logger.error(f"Error in GET /export: {e}")
+            return jsonify({"error": str(e)}), 500
+
@@ -0,0 +1,145 @@
+"""
+History Export Encoders
+
+Turn streamed history rows into chunks of CSV, NDJSON or Parquet for the
+/export endpoint. Every encoder is a generator that consumes the rows lazily
+and emits one chunk per chunk_rows rows, so a response of any size is built
+in constant memory.
+
+Parquet needs pyarrow, which is optional; without it only CSV and NDJSON are
+offered.
+"""
+import csv
+import datetime
+import io
+import json
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Rows per emitted chunk (and per Parquet row group)
+EXPORT_CHUNK_ROWS = 1000
+
+# Parquet column types for the export columns
+PARQUET_TYPES = {
+    "id": "int64",
+    "timestamp": "timestamp",
+    "device_id": "string",
+    "hostname": "string",
+    "metric_name": "string",
+    "metric_value": "float64",
+    "symbol": "string",
+    "price": "float64",
+    "resolution": "int64",
+    "min": "float64",
+    "max": "float64",
+    "avg": "float64",
+    "count": "int64",
+    "last": "float64"
+}
+
+
+def _format_value(value):
+    """Render datetimes as ISO-8601 for the text formats."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+def _chunks(rows, chunk_rows):
+    """Group rows into lists of at most chunk_rows."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def encode_csv(columns, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield CSV text: a header line, then the rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for chunk in _chunks(rows, chunk_rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_format_value(value) for value in row] for row in chunk)
+        yield buffer.getvalue()
+
+def encode_ndjson(columns, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield newline-delimited JSON, one object per row."""
+    for chunk in _chunks(rows, chunk_rows):
+        yield "".join(
+            json.dumps(dict(zip(columns, (_format_value(value) for value in row)))) + "\n"
+            for row in chunk
+        )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the caller."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        """Return and forget everything written since the last call."""
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _parquet_schema(columns):
+    """Arrow schema for the export columns."""
+    types = {
+        "int64": pyarrow.int64(),
+        "float64": pyarrow.float64(),
+        "string": pyarrow.string(),
+        "timestamp": pyarrow.timestamp("us")
+    }
+    return pyarrow.schema([(name, types[PARQUET_TYPES[name]]) for name in columns])
+
+def encode_parquet(columns, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield a Parquet file, one row group per chunk."""
+    schema = _parquet_schema(columns)
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    try:
+        for chunk in _chunks(rows, chunk_rows):
+            arrays = [
+                pyarrow.array([row[position] for row in chunk], type=field.type)
+                for position, field in enumerate(schema)
+            ]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+# Format name -> (encoder, MIME type, file extension)
+EXPORT_FORMATS = {
+    "csv": (encode_csv, "text/csv", "csv"),
+    "ndjson": (encode_ndjson, "application/x-ndjson", "ndjson")
+}
+if pyarrow is not None:
+    EXPORT_FORMATS["parquet"] = (encode_parquet, "application/vnd.apache.parquet", "parquet")
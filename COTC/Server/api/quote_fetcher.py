@@ -0,0 +1,208 @@
+"""
+Quote Fetcher
+
+Optional background service that fetches the price of every symbol in
+stock_symbols once per interval and stores them through ingest_batch, so the
+fleet makes one upstream call per symbol per interval however many agents
+watch it. Agents can then turn off their own stock collection.
+
+Requests go to base_url + "/quote?symbol=...&token=..." and expect Finnhub's
+response format ({"c": current price, ...}); base_url is configurable so the
+fetcher can be pointed at a local stub server. Quotes are fetched by a
+bounded thread pool over one pooled keep-alive session, each request with a
+timeout, a token bucket keeps the request rate within the upstream
+per-minute quota, and each cycle's prices are written in one batch.
+"""
+import datetime
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from database.ingestion import ingest_batch
+from database.models import fetch_stock_symbols
+
+DEFAULT_BASE_URL = "https://finnhub.io/api/v1"
+
+
+# Same as the agent's collectors.stock_collector.TokenBucket; agent and server are deployed separately
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        """
+        Initialize a token bucket.
+
+        Args:
+            rate_per_minute: Tokens added per minute
+            burst: Maximum tokens held (defaults to one second's worth, at least 1)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """
+        Take one token, waiting for it if necessary.
+
+        Args:
+            timeout: Maximum seconds to wait, or None to wait as long as needed
+
+        Returns:
+            True if a token was taken, False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class QuoteFetcher:
+    def __init__(self, db_path, api_key=None, base_url=DEFAULT_BASE_URL, interval_seconds=10,
+                 max_workers=8, timeout=5, rate_limit_per_minute=60, extra_symbols=None):
+        """
+        Initialize the fetcher.
+
+        Args:
+            db_path: Path to the SQLite database
+            api_key: Upstream API token (defaults to the FINNHUB_API_KEY environment variable)
+            base_url: Upstream API root, e.g. a local stub server for testing
+            interval_seconds: Time between fetch cycles
+            max_workers: Maximum concurrent upstream requests
+            timeout: Seconds before an upstream request is abandoned
+            rate_limit_per_minute: Upstream quota; requests that can't get a token in time are skipped
+            extra_symbols: Optional callable returning symbols to fetch that may not be stored yet
+        """
+        self.db_path = db_path
+        self.api_key = api_key or os.environ.get("FINNHUB_API_KEY")
+        self.base_url = base_url.rstrip("/")
+        self.interval_seconds = interval_seconds
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(rate_limit_per_minute)
+        self.extra_symbols = extra_symbols
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="QuoteFetcher")
+
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._stats = {
+            "cycles": 0,
+            "upstream_calls": 0,
+            "failures": 0,
+            "rate_limited": 0,
+            "stored": 0,
+            "duplicates": 0,
+            "last_cycle_at": None,
+            "last_cycle_seconds": 0.0
+        }
+
+    def start(self):
+        """Start the background fetch thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="QuoteFetcher", daemon=True)
+        self._thread.start()
+        logging.info(f"Quote fetcher started (every {self.interval_seconds}s from {self.base_url})")
+
+    def stop(self):
+        """Stop the fetcher after the current cycle, letting in-flight requests finish before the session closes."""
+        if self._thread:
+            self._stopping.set()
+            self._thread.join(self.timeout * 2 + 5)
+            self._thread = None
+        # A worker takes at most timeout for a token plus timeout for the request; shutdown() itself
+        # can't be bounded, so it is waited for on a helper thread
+        stopper = threading.Thread(
+            target=self.executor.shutdown, kwargs={"wait": True, "cancel_futures": True},
+            name="QuoteFetcherStop", daemon=True
+        )
+        stopper.start()
+        stopper.join(self.timeout * 2 + 1)
+        if stopper.is_alive():
+            logging.warning("Quote requests still running after stop; closing the session anyway")
+        self.session.close()
+
+    def get_stats(self):
+        """Return upstream call and storage counters."""
+        with self._lock:
+            return dict(self._stats)
+
+    def run_once(self):
+        """Fetch every known symbol once and store the prices in one batch."""
+        started = time.perf_counter()
+        now = datetime.datetime.now()
+        symbols = list(fetch_stock_symbols(self.db_path))
+        if self.extra_symbols:
+            symbols += [symbol for symbol in self.extra_symbols() if symbol not in symbols]
+
+        samples = [
+            {"type": "stock", "symbol": symbol, "price": price, "timestamp": now}
+            for symbol, price in zip(symbols, self.executor.map(self.fetch_quote, symbols))
+            if price
+        ]
+        results = ingest_batch(self.db_path, samples) if samples else []
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._stats["cycles"] += 1
+            self._stats["stored"] += sum(1 for result in results if result["status"] == "stored")
+            self._stats["duplicates"] += sum(1 for result in results if result["status"] == "duplicate")
+            self._stats["last_cycle_at"] = now.isoformat()
+            self._stats["last_cycle_seconds"] = elapsed
+        logging.debug(f"Quote fetcher stored {len(samples)}/{len(symbols)} prices in {elapsed:.2f}s")
+
+    def fetch_quote(self, symbol):
+        """
+        Fetch the current price of a symbol from the upstream API.
+
+        Returns:
+            Price, or None if the request was skipped or failed
+        """
+        if not self.rate_limiter.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["rate_limited"] += 1
+            logging.warning(f"Skipping {symbol} this cycle: upstream rate limit reached")
+            return None
+
+        with self._lock:
+            self._stats["upstream_calls"] += 1
+        try:
+            response = self.session.get(
+                f"{self.base_url}/quote",
+                params={"symbol": symbol, "token": self.api_key},
+                timeout=self.timeout
+            )
+            if response.status_code == 200:
+                return response.json().get("c")
+            logging.warning(f"Failed to fetch quote for {symbol}: {response.status_code}")
+        except Exception as e:
+            logging.warning(f"Error fetching quote for {symbol}: {e}")
+        with self._lock:
+            self._stats["failures"] += 1
+        return None
+
+    def _run(self):
+        """Fetcher loop: fetch every symbol, then wait for the next interval."""
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Quote fetch cycle failed: {e}")
+            self._stopping.wait(self.interval_seconds)
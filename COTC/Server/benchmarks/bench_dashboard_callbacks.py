@@ -0,0 +1,146 @@
+"""
+Benchmark: dashboard callback requests per minute per viewer
+
+Loads the dashboard as server.py does and replays one minute of an idle
+viewer the way the Dash renderer would: every dcc.Interval in the layout
+ticks at its interval, each tick fires the callbacks taking its n_intervals
+as input, and their outputs fire the callbacks that depend on them in turn.
+Server callbacks cost one POST to _dash-update-component each; clientside
+callbacks run in the browser. Callbacks that end in PreventUpdate or
+no_update are still counted, so the figures are an upper bound.
+
+Each checkout is measured twice: as configured, where live updates stretch
+the data intervals to the fallback interval (requests caused by pushed
+events depend on the data rate and are not counted), and with live updates
+off, where every interval polls at its default rate.
+
+To compare against another checkout (e.g. before the cosmetic callbacks
+moved to the browser), pass its COTC/Server directory:
+
+    git worktree add /tmp/before <commit>
+    python benchmarks/bench_dashboard_callbacks.py --tree /tmp/before/COTC/Server
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+import common
+
+
+def callback_graph(polling_only=False):
+    """Load the dashboard from sys.path and return (callbacks, intervals)."""
+    from flask import Flask
+    from dash import dcc
+    from dashboard.app import create_dash_app, set_app
+    dash_app = create_dash_app(server=Flask(__name__))
+    set_app(dash_app)
+    from dashboard.layouts import main_layout
+    if polling_only:
+        main_layout.FALLBACK_INTERVAL = None
+    dash_app.layout = main_layout.create_layout()
+    from dashboard.callbacks import (  # noqa: F401 - importing registers the callbacks
+        device_callbacks, system_metrics_callbacks, history_callbacks, page_callbacks, stock_callbacks
+    )
+
+    callbacks = []
+    for callback in dash_app._callback_list:
+        # Multi-output ids look like "..a.prop...b.prop.."; duplicate outputs carry an "@hash" suffix
+        outputs = callback["output"].strip(".").split("...")
+        callbacks.append({
+            "name": outputs[0].split("@")[0],
+            "outputs": [output.split("@")[0] for output in outputs],
+            "inputs": [f"{item['id']}.{item['property']}" for item in callback["inputs"]],
+            "clientside": bool(callback.get("clientside_function")),
+            "initial": not callback.get("prevent_initial_call")
+        })
+    intervals = {
+        component.id: component.interval
+        for component in dash_app.layout._traverse()
+        if isinstance(component, dcc.Interval) and not getattr(component, "disabled", False)
+    }
+    return callbacks, intervals
+
+def fire(callbacks, changed, counts):
+    """Fire every callback depending on the changed properties, following chains once per callback."""
+    fired = set()
+    while changed:
+        triggered = [
+            index for index, callback in enumerate(callbacks)
+            if index not in fired and any(prop in changed for prop in callback["inputs"])
+        ]
+        changed = set()
+        for index in triggered:
+            fired.add(index)
+            callback = callbacks[index]
+            counts["client" if callback["clientside"] else "server"] += 1
+            if not callback["clientside"]:
+                counts[callback["name"]] += 1
+            changed.update(callback["outputs"])
+
+def simulate(seconds=60, polling_only=False):
+    """Count callback runs for one page load and for seconds of an idle viewer."""
+    callbacks, intervals = callback_graph(polling_only)
+
+    page_load = sum(1 for callback in callbacks if callback["initial"] and not callback["clientside"])
+    counts = Counter()
+    for interval_id, interval_ms in intervals.items():
+        for _ in range(int(seconds * 1000 // interval_ms)):
+            fire(callbacks, {f"{interval_id}.n_intervals"}, counts)
+
+    return {
+        "server_callbacks": sum(1 for callback in callbacks if not callback["clientside"]),
+        "clientside_callbacks": sum(1 for callback in callbacks if callback["clientside"]),
+        "page_load_requests": page_load,
+        "server_requests": counts.pop("server", 0),
+        "browser_runs": counts.pop("client", 0),
+        "per_callback": dict(counts.most_common())
+    }
+
+def collect(tree, seconds, polling_only):
+    """Run the simulation for a checkout in a fresh interpreter, so module state does not mix."""
+    command = [sys.executable, os.path.abspath(__file__), "--collect", tree, "--seconds", str(seconds)]
+    if polling_only:
+        command.append("--polling-only")
+    output = subprocess.run(command, cwd=tree, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tree", action="append", default=[], help="COTC/Server directory of another checkout")
+    parser.add_argument("--seconds", type=float, default=60, help="Length of the simulated session")
+    parser.add_argument("--collect", help=argparse.SUPPRESS)
+    parser.add_argument("--polling-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.collect:
+        # Load the dashboard from the requested checkout rather than the one common.py added
+        sys.path.insert(0, args.collect)
+        print(json.dumps(simulate(args.seconds, args.polling_only)))
+        return
+
+    trees = [os.path.abspath(tree) for tree in args.tree] + [common.SERVER_ROOT]
+    results = [
+        (tree, mode, collect(tree, args.seconds, polling_only))
+        for tree in trees
+        for mode, polling_only in (("as configured", False), ("live updates off", True))
+    ]
+
+    common.print_table(
+        ["tree", "mode", "server cbs", "clientside cbs", "page load req", "server req/min", "browser runs/min"],
+        [[
+            tree, mode, result["server_callbacks"], result["clientside_callbacks"], result["page_load_requests"],
+            f"{result['server_requests'] * 60 / args.seconds:.0f}", f"{result['browser_runs'] * 60 / args.seconds:.0f}"
+        ] for tree, mode, result in results]
+    )
+    for tree, mode, result in results:
+        print(f"\n{tree} ({mode}): server requests per minute by callback")
+        common.print_table(
+            ["callback", "req/min"],
+            [[name, f"{count * 60 / args.seconds:.0f}"] for name, count in result["per_callback"].items()]
+        )
+
+
+if __name__ == "__main__":
+    main()
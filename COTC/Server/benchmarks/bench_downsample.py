@@ -0,0 +1,69 @@
+"""
+Benchmark: chart downsampling over long series
+
+Times LTTB and the min/max envelope reducing a synthetic series to the
+chart's point budget, with and without a zoomed visible range, and shows how
+much smaller the JSON sent to the browser becomes:
+
+    python benchmarks/bench_downsample.py
+    python benchmarks/bench_downsample.py --points 1000000 --max-points 2000
+"""
+import argparse
+import datetime
+import json
+import math
+import random
+import common
+from dashboard.utils.downsample import downsample_columns
+
+
+def synthetic_columns(points):
+    """One sample a minute: a daily cycle with noise and the occasional spike."""
+    generator = random.Random(0)
+    start = datetime.datetime(2024, 1, 1)
+    epoch_start = (start - datetime.datetime(1970, 1, 1)).total_seconds()
+    epochs = [epoch_start + 60 * index for index in range(points)]
+    values = [
+        50 + 20 * math.sin(index / 720 * math.pi) + generator.gauss(0, 3) + (40 if generator.random() < 0.001 else 0)
+        for index in range(points)
+    ]
+    timestamps = [(start + datetime.timedelta(minutes=index)).strftime('%Y-%m-%d %H:%M:%S') for index in range(points)]
+    return {"timestamp": timestamps, "epoch": epochs, "price": values}
+
+def json_size(columns):
+    """Bytes of the JSON a chart figure would carry for these columns."""
+    return len(json.dumps({"x": columns["timestamp"], "y": columns["price"]}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=1000000, help="Length of the synthetic series")
+    parser.add_argument("--max-points", type=int, default=2000, help="Chart point budget")
+    args = parser.parse_args()
+
+    columns = synthetic_columns(args.points)
+    full_size = json_size(columns)
+    # Zoom into the last tenth of the series
+    zoom = (
+        datetime.datetime.strptime(columns["timestamp"][args.points * 9 // 10], '%Y-%m-%d %H:%M:%S'),
+        datetime.datetime.strptime(columns["timestamp"][-1], '%Y-%m-%d %H:%M:%S')
+    )
+
+    rows = [["none", "-", args.points, f"{full_size / 1e6:.2f}", "-"]]
+    for method in ("lttb", "minmax"):
+        for label, x_range in (("full", None), ("zoomed", zoom)):
+            result = {}
+
+            def run():
+                result["columns"] = downsample_columns(columns, args.max_points, "price", method=method, x_range=x_range)
+
+            elapsed = common.best_time(run)
+            reduced = result["columns"]
+            rows.append([
+                method, label, len(reduced["price"]), f"{json_size(reduced) / 1e6:.3f}", f"{elapsed * 1000:.0f}"
+            ])
+
+    common.print_table(["method", "range", "points", "JSON MB", "ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark: stock history callback wall time against history length
+
+For each history length, a scratch database gets one price a minute and its
+rollups. Three ways of building the stock table and chart are then timed,
+with the query cache bypassed:
+
+    per-row    the previous callbacks: get_stock_history dicts, timestamps
+               split and prices formatted row by row, the table sorted by
+               the formatted strings, the chart downsampled from ISO strings
+    columnar   get_stock_history_columns over the raw rows, the table built
+               by reversing the columns, the chart downsampled on the epochs
+    callbacks  display_latest_stock_data_and_table and update_stock_chart
+               as they run now, i.e. reading rollups for long histories
+
+    python benchmarks/bench_history_callbacks.py
+    python benchmarks/bench_history_callbacks.py --rows 10000 100000 1000000
+"""
+import argparse
+import datetime
+import random
+import common
+from database.ingestion import ingest_batch
+from database.models import get_stock_history, get_stock_history_columns
+from database.query_cache import get_query_cache
+from database.rollups import rebuild_rollups
+from database.schema import get_engine, StockData
+
+SYMBOL = "BENCH"
+
+# Rows per INSERT statement when filling the database
+INSERT_BATCH = 100000
+
+
+def fill_database(db_path, rows):
+    """Store one price a minute for SYMBOL, ending now, and build its rollups."""
+    now = datetime.datetime.now().replace(microsecond=0)
+    ingest_batch(db_path, [{"type": "stock", "symbol": SYMBOL, "price": 100.0, "timestamp": now.isoformat()}])
+    engine = get_engine(db_path)
+    with engine.connect() as conn:
+        symbol_id = conn.exec_driver_sql("SELECT id FROM stock_symbols WHERE symbol = ?", (SYMBOL,)).scalar()
+
+    generator = random.Random(0)
+    price = 100.0
+    for start in range(1, rows, INSERT_BATCH):
+        batch = []
+        for index in range(start, min(start + INSERT_BATCH, rows)):
+            price = max(1.0, price + generator.gauss(0, 0.5))
+            batch.append({"symbol_id": symbol_id, "price": price,
+                          "timestamp": now - datetime.timedelta(minutes=index)})
+        with engine.begin() as conn:
+            conn.execute(StockData.__table__.insert(), batch)
+    rebuild_rollups(engine, "stock")
+
+def per_row_path(db_path, downsample_series, max_points):
+    """The table and chart as they were built before the columnar history."""
+    get_query_cache(db_path).clear()
+    history = get_stock_history(db_path, SYMBOL)
+    table_data = []
+    for item in history:
+        timestamp = item['timestamp']
+        if 'T' in timestamp:
+            date_part, time_part = timestamp.split('T')
+            timestamp = f"{date_part} {time_part.split('.')[0]}"
+        table_data.append({"timestamp": timestamp, "price": f"${float(item['price']):.2f}"})
+    table_data = sorted(table_data, key=lambda row: row['timestamp'], reverse=True)
+
+    get_query_cache(db_path).clear()
+    history = get_stock_history(db_path, SYMBOL)
+    dates = [item['timestamp'] for item in history]
+    prices = [float(item['price']) for item in history]
+    downsample_series(dates, prices, max_points)
+    return table_data
+
+def columnar_path(db_path, downsample_columns, max_points):
+    """The table and chart from raw columnar history."""
+    get_query_cache(db_path).clear()
+    history = get_stock_history_columns(db_path, SYMBOL)
+    table_data = [
+        {"timestamp": timestamp, "price": price}
+        for timestamp, price in zip(reversed(history['timestamp']), reversed(history['price']))
+    ]
+    get_query_cache(db_path).clear()
+    history = get_stock_history_columns(db_path, SYMBOL)
+    downsample_columns(history, max_points, 'price')
+    return table_data
+
+def load_callbacks(db_path):
+    """Register the dashboard callbacks against db_path and return the stock callback module."""
+    from flask import Flask
+    from dashboard.app import create_dash_app, set_app
+    set_app(create_dash_app(server=Flask(__name__)))
+    from dashboard.callbacks import stock_callbacks
+    stock_callbacks.DATABASE_PATH = db_path
+    return stock_callbacks
+
+def callbacks_path(stock_callbacks, db_path):
+    """Run the current table and chart callbacks with a cold query cache."""
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    get_query_cache(db_path).clear()
+    with stock_callbacks.app.server.test_request_context():
+        context_value.set(AttributeDict(triggered_inputs=[{"prop_id": "stock-symbol-dropdown.value", "value": SYMBOL}]))
+        stock_callbacks.display_latest_stock_data_and_table(SYMBOL, None)
+        stock_callbacks.update_stock_chart(SYMBOL, None, None)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000], help="History lengths")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (fastest is kept)")
+    args = parser.parse_args()
+
+    from dashboard.utils.downsample import downsample_series, downsample_columns
+    stock_callbacks = None
+    results = []
+    for rows in args.rows:
+        db_path = common.scratch_database()
+        fill_database(db_path, rows)
+        if stock_callbacks is None:
+            stock_callbacks = load_callbacks(db_path)
+        stock_callbacks.DATABASE_PATH = db_path
+        max_points = stock_callbacks.CHART_MAX_POINTS
+
+        per_row = common.best_time(lambda: per_row_path(db_path, downsample_series, max_points), args.repeat)
+        columnar = common.best_time(lambda: columnar_path(db_path, downsample_columns, max_points), args.repeat)
+        callbacks = common.best_time(lambda: callbacks_path(stock_callbacks, db_path), args.repeat)
+        results.append([
+            rows, f"{per_row:.3f}", f"{columnar:.3f}", f"{callbacks:.3f}", f"{per_row / callbacks:.1f}x"
+        ])
+
+    common.print_table(["rows", "per-row s", "columnar s", "callbacks s", "speedup"], results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark: PUT /metrics/system throughput under many concurrent agents
+
+Each simulated agent has its own device identity and keep-alive connection
+and sends its metrics in a loop; the benchmark reports requests per second
+and latency percentiles.
+
+Without --url the server is started in-process on a scratch database, and
+the benchmark also counts the SQLite commits per request (each one an fsync
+of the WAL under synchronous=FULL) and the SELECTs per request, with those
+reading the devices table (the lookups the device cache saves) on their
+own. --tree serves the API from another checkout's COTC/Server directory
+instead of this one, so before and after a change can be compared on the
+same machine:
+
+    python benchmarks/bench_metrics_system.py --clients 300 --duration 20
+    git worktree add /tmp/before <commit>
+    python benchmarks/bench_metrics_system.py --tree /tmp/before/COTC/Server
+    python benchmarks/bench_metrics_system.py --url http://localhost:5000 --clients 300
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import common
+
+
+class StatementCounter:
+    """Counts commits and SELECTs (all, and those reading devices) on every SQLAlchemy engine in the process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commits = 0
+        self.selects = 0
+        self.device_selects = 0
+        event.listen(Engine, "commit", self.on_commit)
+        event.listen(Engine, "before_cursor_execute", self.on_execute)
+
+    def on_commit(self, conn):
+        with self.lock:
+            self.commits += 1
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith("SELECT"):
+            return
+        with self.lock:
+            self.selects += 1
+            if "FROM devices" in statement:
+                self.device_selects += 1
+
+
+def start_local_server(db_path):
+    """Serve this tree's API on a free local port and return its base URL."""
+    from flask import Flask
+    from werkzeug.serving import make_server
+    from api.endpoints import register_routes
+
+    app = Flask(__name__)
+    register_routes(app, {
+        "database_path": db_path,
+        "system_metrics": ["cpu_usage", "ram_usage"],
+        "live_updates": {"enabled": False}
+    })
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="BenchmarkServer", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+def run_agent(base_url, deadline, latencies, errors, lock):
+    """Send PUT /metrics/system as one device until the deadline."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+    identity = uuid.uuid4().hex
+    payload = {
+        "device_id": identity,
+        "mac_address": ":".join(identity[i:i + 2] for i in range(0, 12, 2)),
+        "hostname": f"bench-{identity[:8]}"
+    }
+    local_latencies = []
+    local_errors = 0
+
+    while time.perf_counter() < deadline:
+        payload["metrics"] = {"cpu_usage": random.uniform(0, 100), "ram_usage": random.uniform(0, 100)}
+        started = time.perf_counter()
+        try:
+            response = session.put(f"{base_url}/metrics/system", json=payload, timeout=30)
+            if response.status_code != 200:
+                local_errors += 1
+        except requests.RequestException:
+            local_errors += 1
+        local_latencies.append(time.perf_counter() - started)
+
+    session.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running server (default: start one from this tree)")
+    parser.add_argument("--clients", type=int, default=200, help="Concurrent simulated agents")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds to send requests for")
+    parser.add_argument("--tree", help="Serve the API from this COTC/Server directory instead of this tree")
+    args = parser.parse_args()
+
+    counter = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        if args.tree:
+            sys.path.insert(0, os.path.abspath(args.tree))
+        base_url = start_local_server(common.scratch_database())
+        counter = StatementCounter()
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    agents = [
+        threading.Thread(target=run_agent, args=(base_url, deadline, latencies, errors, lock), daemon=True)
+        for _ in range(args.clients)
+    ]
+    started = time.perf_counter()
+    for agent in agents:
+        agent.start()
+    for agent in agents:
+        agent.join()
+    elapsed = time.perf_counter() - started
+
+    stats = common.percentiles(latencies)
+    requests_sent = max(len(latencies), 1)
+    common.print_table(
+        [
+            "clients", "requests", "errors", "req/s", "mean ms", "p50 ms", "p90 ms", "p99 ms",
+            "commits/req", "selects/req", "device selects/req"
+        ],
+        [[
+            args.clients,
+            len(latencies),
+            sum(errors),
+            f"{len(latencies) / elapsed:.1f}",
+            f"{sum(latencies) / requests_sent * 1000:.1f}",
+            *(f"{stats.get(key, 0) * 1000:.1f}" for key in ("p50", "p90", "p99")),
+            *((
+                f"{counter.commits / requests_sent:.2f}",
+                f"{counter.selects / requests_sent:.2f}",
+                f"{counter.device_selects / requests_sent:.2f}"
+            ) if counter else ("-", "-", "-"))
+        ]]
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark: upstream quote calls against fleet size
+
+Each simulated agent watches a few symbols from a shared pool. For every
+fleet size the same number of collection cycles is run twice against a
+local stub of the quote API that counts the calls it gets:
+
+    agents   every agent's own StockCollector fetches its symbols
+    server   one QuoteFetcher fetches every stored symbol for the fleet
+
+    python benchmarks/bench_quote_upstream_calls.py
+    python benchmarks/bench_quote_upstream_calls.py --agents 1 10 100 500 --symbols 50 --per-agent 5
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import common
+from api.quote_fetcher import QuoteFetcher
+from database.ingestion import ingest_batch
+
+CLIENT_ROOT = os.path.join(os.path.dirname(common.SERVER_ROOT), "Client")
+if CLIENT_ROOT not in sys.path:
+    sys.path.insert(0, CLIENT_ROOT)
+
+from collectors import stock_collector  # noqa: E402 - needs CLIENT_ROOT on sys.path
+
+# Effectively no upstream quota, so every wanted quote is requested
+UNLIMITED_RATE = 10 ** 9
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        with self.server.lock:
+            self.server.calls += 1
+        body = json.dumps({"c": 100.0}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections from a full worker pool, adding 1s SYN retries
+    request_queue_size = 128
+
+
+def start_stub_server():
+    """Serve a counting /quote stub on a free local port."""
+    server = StubServer(("127.0.0.1", 0), CountingHandler)
+    server.lock = threading.Lock()
+    server.calls = 0
+    threading.Thread(target=server.serve_forever, name="QuoteStub", daemon=True).start()
+    return server
+
+def count_calls(server, function):
+    """Run function and return (upstream calls it caused, seconds taken)."""
+    before = server.calls
+    started = time.perf_counter()
+    function()
+    return server.calls - before, time.perf_counter() - started
+
+def watched_symbols(agents, pool, per_agent):
+    """Symbols each agent watches: per_agent consecutive symbols of the pool, staggered by agent."""
+    return [[pool[(agent + offset) % len(pool)] for offset in range(per_agent)] for agent in range(agents)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, nargs="+", default=[1, 10, 50, 200], help="Fleet sizes")
+    parser.add_argument("--symbols", type=int, default=20, help="Size of the shared symbol pool")
+    parser.add_argument("--per-agent", type=int, default=5, help="Symbols watched by each agent")
+    parser.add_argument("--cycles", type=int, default=3, help="Collection cycles per run")
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    stock_collector.FINNHUB_QUOTE_URL = f"{base_url}/quote"
+    pool = [f"SYM{index}" for index in range(args.symbols)]
+
+    rows = []
+    for agents in args.agents:
+        watched = watched_symbols(agents, pool, args.per_agent)
+
+        collectors = [
+            stock_collector.StockCollector("bench", symbols, max_workers=4, rate_limit_per_minute=UNLIMITED_RATE)
+            for symbols in watched
+        ]
+
+        def run_agents():
+            for _ in range(args.cycles):
+                for collector in collectors:
+                    collector.collect_stock_data()
+
+        agent_calls, agent_seconds = count_calls(server, run_agents)
+        for collector in collectors:
+            collector.close()
+
+        # The agents' symbols are what the server has stored, and so what the fetcher covers
+        db_path = common.scratch_database()
+        ingest_batch(db_path, [
+            {"type": "stock", "symbol": symbol, "price": 1.0} for symbols in watched for symbol in symbols
+        ])
+        fetcher = QuoteFetcher(db_path, api_key="bench", base_url=base_url, rate_limit_per_minute=UNLIMITED_RATE)
+
+        def run_server():
+            for _ in range(args.cycles):
+                fetcher.run_once()
+
+        server_calls, server_seconds = count_calls(server, run_server)
+        fetcher.stop()
+
+        unique = len({symbol for symbols in watched for symbol in symbols})
+        rows.append([
+            agents, unique, agent_calls, server_calls, f"{agent_calls / max(server_calls, 1):.1f}x",
+            f"{agent_seconds:.2f}", f"{server_seconds:.2f}"
+        ])
+
+    print(f"{args.cycles} cycles, {args.per_agent} symbols per agent from a pool of {args.symbols}")
+    common.print_table(
+        ["agents", "symbols", "agent calls", "server calls", "reduction", "agents s", "server s"], rows
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
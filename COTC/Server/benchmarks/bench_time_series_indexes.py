@@ -0,0 +1,190 @@
+"""
+Benchmark: time-series queries with and without the composite indexes
+
+Fills a scratch database with a synthetic fleet (one sample per device and
+metric a minute, plus per-symbol prices) and times the history and latest
+value queries twice: with ix_system_metrics_device_type_ts and
+ix_stock_data_symbol_ts in place, and after dropping them, which is how the
+queries ran before the indexes existed. Each query's plan is printed too.
+
+The default of 10M system_metrics rows takes about a minute to generate and
+about 1 GB of disk, removed afterwards; use --rows for a quicker run:
+
+    python benchmarks/bench_time_series_indexes.py
+    python benchmarks/bench_time_series_indexes.py --rows 1000000 --devices 50 --symbols 20
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import time
+from sqlalchemy import event
+import common
+from database.models import get_stock_history, get_system_metrics_history
+from database.schema import dispose_engines, get_engine
+
+INDEXES = ("ix_system_metrics_device_type_ts", "ix_stock_data_symbol_ts")
+METRICS = ("cpu_usage", "ram_usage")
+CHUNK = 100000
+
+LATEST_STOCK_PRICE = """
+    SELECT stock_data.price, stock_data.timestamp
+    FROM stock_data JOIN stock_symbols ON stock_symbols.id = stock_data.symbol_id
+    WHERE stock_symbols.symbol = ?
+    ORDER BY stock_data.timestamp DESC
+    LIMIT 1
+"""
+
+
+def populate(db_path, rows, stock_rows, devices, symbols):
+    """
+    Bulk-insert the synthetic fleet and return the newest timestamp.
+
+    The indexes are dropped for the load and rebuilt once afterwards, which is
+    much faster than maintaining them row by row.
+    """
+    generator = random.Random(0)
+    samples_per_series = max(1, rows // (devices * len(METRICS)))
+    prices_per_symbol = max(1, stock_rows // symbols)
+    end = datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=max(samples_per_series, prices_per_symbol))
+
+    connection = get_engine(db_path).raw_connection()
+    try:
+        cursor = connection.cursor()
+        for index in INDEXES:
+            cursor.execute(f"DROP INDEX {index}")
+        cursor.executemany("INSERT OR IGNORE INTO metric_types (name) VALUES (?)", [(name,) for name in METRICS])
+        metric_type_ids = [
+            cursor.execute("SELECT id FROM metric_types WHERE name = ?", (name,)).fetchone()[0] for name in METRICS
+        ]
+        cursor.executemany(
+            "INSERT INTO devices (id, device_id, mac_address, hostname, last_seen) VALUES (?, ?, ?, ?, ?)",
+            [
+                (pk, f"device-{pk}", f"02:00:00:00:{pk // 256:02x}:{pk % 256:02x}", f"host-{pk}", end.strftime("%Y-%m-%d %H:%M:%S.%f"))
+                for pk in range(1, devices + 1)
+            ]
+        )
+        cursor.executemany(
+            "INSERT INTO stock_symbols (id, symbol) VALUES (?, ?)",
+            [(pk, f"SYM{pk}") for pk in range(1, symbols + 1)]
+        )
+
+        def timestamps(count):
+            return [(end - datetime.timedelta(minutes=count - minute)).strftime("%Y-%m-%d %H:%M:%S.%f") for minute in range(count)]
+
+        # Interleave devices within each minute, as live ingestion would
+        metric_times = timestamps(samples_per_series)
+        batch = []
+        for timestamp in metric_times:
+            for device in range(1, devices + 1):
+                for metric_type in metric_type_ids:
+                    batch.append((metric_type, device, generator.uniform(0, 100), timestamp))
+            if len(batch) >= CHUNK:
+                cursor.executemany("INSERT INTO system_metrics (metric_type_id, device_id, metric_value, timestamp) VALUES (?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            cursor.executemany("INSERT INTO system_metrics (metric_type_id, device_id, metric_value, timestamp) VALUES (?, ?, ?, ?)", batch)
+
+        price_times = timestamps(prices_per_symbol)
+        batch = []
+        for timestamp in price_times:
+            for symbol in range(1, symbols + 1):
+                batch.append((symbol, generator.uniform(10, 500), timestamp))
+            if len(batch) >= CHUNK:
+                cursor.executemany("INSERT INTO stock_data (symbol_id, price, timestamp) VALUES (?, ?, ?)", batch)
+                batch = []
+        if batch:
+            cursor.executemany("INSERT INTO stock_data (symbol_id, price, timestamp) VALUES (?, ?, ?)", batch)
+        connection.commit()
+    finally:
+        connection.close()
+    create_indexes(db_path)
+    return end
+
+def create_indexes(db_path):
+    with get_engine(db_path).begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX ix_system_metrics_device_type_ts ON system_metrics (device_id, metric_type_id, timestamp)")
+        conn.exec_driver_sql("CREATE INDEX ix_stock_data_symbol_ts ON stock_data (symbol_id, timestamp)")
+        conn.exec_driver_sql("ANALYZE")
+
+def drop_indexes(db_path):
+    with get_engine(db_path).begin() as conn:
+        for index in INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX {index}")
+        conn.exec_driver_sql("ANALYZE")
+
+def query_plan(db_path, function):
+    """EXPLAIN QUERY PLAN of the first SELECT function issues, as one line."""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if not statements and statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    engine = get_engine(db_path)
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        function()
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    with engine.connect() as conn:
+        statement, parameters = statements[0]
+        return " | ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+
+def latest_stock_price(db_path, symbol):
+    with get_engine(db_path).connect() as conn:
+        return conn.exec_driver_sql(LATEST_STOCK_PRICE, (symbol,)).first()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000000, help="system_metrics rows to generate")
+    parser.add_argument("--stock-rows", type=int, help="stock_data rows to generate (default: rows / 4)")
+    parser.add_argument("--devices", type=int, default=100, help="Devices in the synthetic fleet")
+    parser.add_argument("--symbols", type=int, default=50, help="Stock symbols")
+    parser.add_argument("--window", type=int, default=60, help="Minutes of history the range queries ask for")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query; the fastest is reported")
+    args = parser.parse_args()
+    stock_rows = args.stock_rows if args.stock_rows is not None else args.rows // 4
+
+    db_path = common.scratch_database()
+    started = time.perf_counter()
+    end = populate(db_path, args.rows, stock_rows, args.devices, args.symbols)
+    print(f"Generated {args.rows} system_metrics and {stock_rows} stock_data rows in {time.perf_counter() - started:.0f}s")
+
+    since = end - datetime.timedelta(minutes=args.window)
+    device = f"device-{args.devices // 2}"
+    symbol = f"SYM{args.symbols // 2}"
+    queries = [
+        (f"system history, last {args.window} min", lambda: get_system_metrics_history(db_path, "cpu_usage", device, since=since)),
+        ("system history, full", lambda: get_system_metrics_history(db_path, "cpu_usage", device)),
+        (f"stock history, last {args.window} min", lambda: get_stock_history(db_path, symbol, since=since)),
+        ("stock history, full", lambda: get_stock_history(db_path, symbol)),
+        ("latest stock price (raw)", lambda: latest_stock_price(db_path, symbol)),
+    ]
+
+    results = {}
+    for label, indexed in (("indexed", True), ("no index", False)):
+        if not indexed:
+            drop_indexes(db_path)
+        for name, function in queries:
+            results[(name, label)] = (common.best_time(function, args.repeat), query_plan(db_path, function))
+
+    common.print_table(
+        ["query", "indexed ms", "no index ms", "speedup"],
+        [[
+            name,
+            f"{results[(name, 'indexed')][0] * 1000:.1f}",
+            f"{results[(name, 'no index')][0] * 1000:.1f}",
+            f"{results[(name, 'no index')][0] / results[(name, 'indexed')][0]:.0f}x"
+        ] for name, _ in queries]
+    )
+    for (name, label), (_, plan) in results.items():
+        print(f"\n{name} ({label}): {plan}")
+
+    dispose_engines()
+    shutil.rmtree(os.path.dirname(db_path), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
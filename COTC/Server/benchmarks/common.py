@@ -0,0 +1,60 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks are run from COTC/Server, e.g. python benchmarks/bench_downsample.py;
+importing this module puts the server packages on sys.path.
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+# Keep per-request warnings (e.g. new devices) out of the results
+logging.basicConfig(level=logging.ERROR)
+
+SERVER_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_ROOT not in sys.path:
+    sys.path.insert(0, SERVER_ROOT)
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """
+    Nearest-rank percentiles of a list of numbers.
+
+    Returns:
+        Dict like {"p50": ..., "p90": ..., "p99": ...}, empty if there are no samples
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {
+        f"p{point}": ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))]
+        for point in points
+    }
+
+def scratch_database():
+    """Create and initialise an empty database in a new temporary directory and return its path."""
+    from database.models import init_database
+    db_path = os.path.join(tempfile.mkdtemp(prefix="cotc-bench-"), "benchmark.db")
+    init_database(db_path)
+    return db_path
+
+def best_time(function, repeat=3):
+    """Run function repeat times and return the fastest wall time in seconds."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def print_table(headers, rows):
+    """Print rows as an aligned plain-text table."""
+    cells = [[str(header) for header in headers]] + [[str(cell) for cell in row] for row in rows]
+    widths = [max(len(row[column]) for row in cells) for column in range(len(headers))]
+    for position, row in enumerate(cells):
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+        if position == 0:
+            print("  ".join("-" * width for width in widths))
@@ -0,0 +1,125 @@
+/*
+ * Client-side callbacks
+ *
+ * Purely cosmetic callbacks that need no data access run in the browser
+ * instead of making a round-trip to the server. Registered from the
+ * callback modules with ClientsideFunction('dashboard', <name>).
+ */
+(function () {
+    // Must match COLORS in dashboard/utils/config.py
+    var COLORS = {
+        success: '#28a745',
+        warning: '#ffc107',
+        danger: '#dc3545',
+        secondary: '#6c757d'
+    };
+
+    // Same thresholds as get_color_based_on_value in components/charts.py
+    function colorForValue(value) {
+        if (value === null || value === undefined) {
+            return COLORS.secondary;
+        }
+        value = parseFloat(value);
+        if (value > 80) {
+            return COLORS.danger;
+        }
+        if (value > 50) {
+            return COLORS.warning;
+        }
+        return COLORS.success;
+    }
+
+    // Client-side equivalent of create_gauge_figure / create_error_gauge
+    function gaugeFigure(title, value, error) {
+        var color = error ? COLORS.danger : colorForValue(value);
+        var number = {font: {size: error ? 24 : 28, color: color}};
+        if (error) {
+            number.suffix = ' Error';
+        }
+        return {
+            data: [{
+                type: 'indicator',
+                mode: 'gauge+number',
+                value: error ? 0 : Math.round((value || 0) * 10) / 10,
+                number: number,
+                title: {text: title, font: {size: 16}},
+                gauge: {
+                    axis: {range: [0, 100], tickwidth: 1, tickcolor: 'gray'},
+                    bar: {color: color},
+                    bgcolor: 'white',
+                    borderwidth: 2,
+                    bordercolor: 'gray'
+                }
+            }],
+            layout: {
+                margin: {l: 20, r: 20, t: 70, b: 20},
+                height: 280,
+                paper_bgcolor: 'rgba(0,0,0,0)',
+                plot_bgcolor: 'rgba(0,0,0,0)'
+            }
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        dashboard: {
+            // Render the CPU and RAM gauges from the values fetched by update_system_metrics
+            render_gauges: function (values) {
+                if (!values || values.error) {
+                    var suffix = values && values.error ? values.error : 'No Device';
+                    return [
+                        gaugeFigure('CPU Usage - ' + suffix, 0, true),
+                        gaugeFigure('RAM Usage - ' + suffix, 0, true)
+                    ];
+                }
+                return [
+                    gaugeFigure('CPU Usage', values.cpu_usage, false),
+                    gaugeFigure('RAM Usage', values.ram_usage, false)
+                ];
+            },
+
+            // Show the time of the last metrics update
+            update_time: function (timestamp) {
+                return 'Last Updated: ' + timestamp;
+            },
+
+            // Convert the stock symbol input to uppercase as the user types
+            uppercase: function (value) {
+                if (!value) {
+                    return window.dash_clientside.no_update;
+                }
+                var upper = value.toUpperCase();
+                return upper === value ? window.dash_clientside.no_update : upper;
+            },
+
+            // Spin the refresh icon and disable the button while the page reloads
+            refresh_ui: function (n_clicks) {
+                if (n_clicks) {
+                    return ['fas fa-sync-alt fa-spin', true];
+                }
+                return ['fas fa-sync-alt', false];
+            },
+
+            // Show whether stock polling is active
+            polling_status: function (n_intervals) {
+                if (n_intervals) {
+                    return [
+                        {namespace: 'dash_html_components', type: 'Span', props: {children: '✓', className: 'text-success me-2'}},
+                        'Polling active (every ' + n_intervals + ' intervals)'
+                    ];
+                }
+                return [
+                    {namespace: 'dash_html_components', type: 'Span', props: {children: '○', className: 'text-muted me-2'}},
+                    'Polling inactive'
+                ];
+            },
+
+            // Bump the refresh interval so every interval-driven callback fires for the new device
+            refresh_on_device_selection: function (selected_device) {
+                if (selected_device) {
+                    return Math.floor(Math.random() * 10000) + 1;
+                }
+                return 0;
+            }
+        }
+    });
+})();
@@ -0,0 +1,70 @@
+/*
+ * Live updates
+ *
+ * Listens to the server's /events stream and clicks the hidden trigger
+ * buttons in the layout, so the matching Dash callbacks only run when new
+ * data has actually been stored. The stream is scoped to the selected device
+ * and stock symbol and reopened when the selection changes (see watch below),
+ * so other devices' and symbols' writes don't refresh this page. The
+ * dcc.Interval components remain as a slow fallback if the stream is
+ * unavailable.
+ */
+(function () {
+    // Event topic (without its ":<key>" scope) -> id of the hidden button whose callbacks refresh that data
+    var TRIGGERS = {
+        system_metrics: 'live-system-trigger',
+        stock_data: 'live-stock-trigger',
+        stock_symbols: 'live-symbols-trigger',
+        devices: 'live-devices-trigger'
+    };
+
+    var source = null;
+    var url = null;
+
+    function handleUpdate(event) {
+        var topics;
+        try {
+            topics = JSON.parse(event.data).topics || [];
+        } catch (e) {
+            return;
+        }
+
+        var clicked = {};
+        topics.forEach(function (topic) {
+            var id = TRIGGERS[topic.split(':')[0]];
+            if (!id || clicked[id]) {
+                return;
+            }
+            clicked[id] = true;
+            var button = document.getElementById(id);
+            if (button) {
+                button.click();
+            }
+        });
+    }
+
+    function connect(target) {
+        if (!window.EventSource || target === url) {
+            return;
+        }
+        if (source) {
+            source.close();
+        }
+        url = target;
+        // EventSource reconnects on its own; a 204 from the server (live updates disabled) stops it
+        source = new EventSource(url);
+        source.addEventListener('update', handleUpdate);
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        live_updates: {
+            // Reopen the stream for the selected device ('none' or empty watches none) and symbol
+            watch: function (device_id, symbol) {
+                var device = device_id && device_id !== 'none' ? device_id : '';
+                connect('/events?device_id=' + encodeURIComponent(device) +
+                        '&symbol=' + encodeURIComponent(symbol || ''));
+                return {device_id: device, symbol: symbol || ''};
+            }
+        }
+    });
+})();
@@ -1,13 +1,11 @@
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import logging
-import random
 from dashboard.app import app
-from database.models import get_session
+from database.models import get_session, fetch_devices
 from database.schema import Device
-from sqlalchemy import create_engine
+from database.last_seen import get_last_seen_tracker
 import json
 import os
-from sqlalchemy.orm import sessionmaker
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -27,32 +25,32 @@ if not os.path.isabs(config['database_path']):
 else:
     DATABASE_PATH = config['database_path']
 
-# Create database engine
-engine = create_engine(f'sqlite:///{DATABASE_PATH}')
-Session = sessionmaker(bind=engine)
+# In-memory last_seen values that haven't been written to the database yet
+last_seen_tracker = get_last_seen_tracker(DATABASE_PATH)
 
 # Callback to update the device selector dropdown
 @app.callback(
     Output('device-selector', 'options'),
     [Input('device-update-interval', 'n_intervals'),
+     Input('live-devices-trigger', 'n_clicks'),
      Input('refresh-button', 'n_clicks')]
 )
-def update_device_list(n_intervals, n_clicks):
+def update_device_list(n_intervals, live_updates, n_clicks):
     """Fetch all registered devices from the database and update the dropdown"""
     logger.warning("Updating device list")
     
     try:
-        session = Session()
-        devices = session.query(Device).all()
+        # Shared across viewers through the query cache
+        devices = fetch_devices(DATABASE_PATH)
         logger.warning(f"Found {len(devices)} devices in database at {DATABASE_PATH}")
         
         # Create dropdown options
         options = []
         for device in devices:
             # Create a more detailed and formatted label
-            hostname = device.hostname or 'Unknown'
-            os_info = device.os_info or ''
-            device_id = device.device_id[:8]  # First 8 chars of UUID
+            hostname = device['hostname'] or 'Unknown'
+            os_info = device['os_info'] or ''
+            device_id = device['device_id'][:8]  # First 8 chars of UUID
             
             # Format the label with more details
             if os_info:
@@ -62,7 +60,7 @@ def update_device_list(n_intervals, n_clicks):
             
             options.append({
                 'label': label,
-                'value': device.device_id
+                'value': device['device_id']
             })
         
         # Add a "None" option with a string value instead of null
@@ -72,8 +70,6 @@ def update_device_list(n_intervals, n_clicks):
     except Exception as e:
         logger.error(f"Error fetching devices: {e}")
         return [{'label': 'No Device Selected', 'value': 'none'}]
-    finally:
-        session.close()
 
 # Callback to handle device selection and update the device store
 @app.callback(
@@ -89,7 +85,7 @@ def update_selected_device(selected_device_id):
         return {'device_id': None, 'hostname': None}
     
     try:
-        session = Session()
+        session = get_session(DATABASE_PATH)
         device = session.query(Device).filter_by(device_id=selected_device_id).first()
         
         if device:
@@ -107,17 +103,12 @@ def update_selected_device(selected_device_id):
     finally:
         session.close()
 
-# Callback to trigger data refresh on device selection
-@app.callback(
+# Trigger an immediate refresh of all data when a device is selected, in the browser
+app.clientside_callback(
+    ClientsideFunction(namespace='dashboard', function_name='refresh_on_device_selection'),
     Output('interval-component', 'n_intervals'),
     Input('device-selector', 'value')
 )
-def trigger_refresh_on_device_selection(selected_device):
-    """Trigger an immediate refresh of all data when a device is selected"""
-    if selected_device:
-        logger.warning(f"Device selected: {selected_device}, triggering refresh")
-        return random.randint(1, 10000)
-    return 0 
 
 @app.callback(
     [Output('device-info', 'children'),
@@ -130,7 +121,7 @@ def update_selected_device_info(selected_device_id):
         return "No device selected", {'display': 'none'}
     
     try:
-        session = Session()
+        session = get_session(DATABASE_PATH)
         device = session.query(Device).filter_by(device_id=selected_device_id).first()
         
         if device:
@@ -138,7 +129,7 @@ def update_selected_device_info(selected_device_id):
                 f"Device ID: {device.device_id}",
                 f"Hostname: {device.hostname}",
                 f"OS: {device.os_info}",
-                f"Last Seen: {device.last_seen.strftime('%Y-%m-%d %H:%M:%S')}"
+                f"Last Seen: {last_seen_tracker.get(device.id, device.last_seen).strftime('%Y-%m-%d %H:%M:%S')}"
             ]
             return "\n".join(info), {'display': 'block', 'whiteSpace': 'pre-line'}
         else:
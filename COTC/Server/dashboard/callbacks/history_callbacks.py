@@ -1,13 +1,14 @@
 import dash
 from dash.dependencies import Input, Output, State
-from dash import html, dash_table
+from dash import Patch
 import logging
 import json
 import os
 from dashboard.app import app
-from dashboard.utils.config import TABLE_STYLE
-from database.models import get_system_metrics_history
-from datetime import datetime
+from dashboard.utils.downsample import downsample_columns
+from database.models import (
+    get_device_metrics_history_columns, get_system_metrics_resolution, get_last_system_metric_id
+)
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -27,248 +28,160 @@ if not os.path.isabs(config['database_path']):
 else:
     DATABASE_PATH = config['database_path']
 
-# Callback to update CPU history data
-@app.callback(
-    Output('cpu-history-data-store', 'data'),
-    [Input('history-update-interval', 'n_intervals'),
-     Input('device-store', 'data')],
-    prevent_initial_call=False
-)
-def update_cpu_history_data(n_intervals, device_data):
-    """Update the CPU history data store"""
-    if not device_data or not device_data.get('device_id'):
-        logger.warning("No device selected for CPU history")
-        return []
+# History tables keep at most HISTORY_RING_SIZE rows in the browser; a full
+# load is downsampled to HISTORY_MAX_POINTS and later refreshes only append new rows
+CHART_DOWNSAMPLING = config.get('chart_downsampling', {})
+HISTORY_RING_SIZE = config.get('history_ring_size', 5000)
+HISTORY_MAX_POINTS = min(CHART_DOWNSAMPLING.get('max_points', 2000), HISTORY_RING_SIZE)
+CHART_DOWNSAMPLING_METHOD = CHART_DOWNSAMPLING.get('method', 'lttb')
+
+# History panels in the layout: metric name -> (component id prefix, label).
+# Only metrics listed in config['system_metrics'] are queried and refreshed.
+HISTORY_PANELS = {
+    'cpu_usage': ('cpu', 'CPU Usage'),
+    'ram_usage': ('ram', 'RAM Usage'),
+}
+HISTORY_METRICS = [
+    (name, HISTORY_PANELS[name][0], HISTORY_PANELS[name][1])
+    for name in config.get('system_metrics', [])
+    if name in HISTORY_PANELS
+]
+
+def history_records(history):
+    """Turn columnar history into the records shown in a history table"""
+    return [
+        {'timestamp': timestamp, 'metric_value': value}
+        for timestamp, value in zip(history['timestamp'], history['metric_value'])
+    ]
+
+def history_title(label, hostname, count):
+    """Title shown above a history table"""
+    if not count:
+        return f"No {label} history data available for {hostname}"
+    return f"{label} History - {hostname} ({count} entries)"
+
+def refresh_histories(device_data, cursor):
+    """
+    Refresh every metric's history table from a single query.
+
+    When the client already holds this device's history, only rows stored
+    after the cursor are fetched and appended with a Patch, dropping the
+    oldest rows beyond HISTORY_RING_SIZE. Otherwise the full history is loaded
+    and downsampled, from the rollups when it spans long enough to fill
+    HISTORY_MAX_POINTS buckets.
+
+    Returns:
+        Tuple (list of (table data or Patch, title) per HISTORY_METRICS entry, new cursor)
+    """
+    metric_names = tuple(name for name, _, _ in HISTORY_METRICS)
+    device_id = device_data.get('device_id') if device_data else None
+    if not device_id or device_id == 'none':
+        logger.warning("No device selected for history")
+        return [([], "No device selected") for _ in HISTORY_METRICS], None
     
-    device_id = device_data.get('device_id')
-    logger.warning(f"Fetching CPU history for device {device_id}")
+    hostname = device_data.get('hostname') or 'Unknown Device'
     
-    try:
-        # Fetch CPU history data directly from database
-        history_data = get_system_metrics_history(db_path=DATABASE_PATH, metric_name='cpu_usage', device_id=device_id)
-        logger.warning(f"Retrieved {len(history_data)} CPU history records")
-        return history_data
+    if cursor and cursor.get('device_id') == device_id:
+        history = get_device_metrics_history_columns(
+            DATABASE_PATH, device_id, metric_names, inserted_after=cursor['last_id']
+        )
+        new_rows = {name: len(history[name]['id']) for name in metric_names}
+        if not any(new_rows.values()):
+            return [(dash.no_update, dash.no_update) for _ in HISTORY_METRICS], dash.no_update
+        
+        if max(new_rows.values()) <= HISTORY_RING_SIZE:
+            panels = []
+            counts = {}
+            for name, _, label in HISTORY_METRICS:
+                count = cursor['counts'].get(name, 0)
+                if not new_rows[name]:
+                    counts[name] = count
+                    panels.append((dash.no_update, dash.no_update))
+                    continue
+                
+                overflow = max(count + new_rows[name] - HISTORY_RING_SIZE, 0)
+                patch = Patch()
+                for _ in range(overflow):
+                    del patch[0]
+                patch.extend(history_records(history[name]))
+                
+                counts[name] = count + new_rows[name] - overflow
+                panels.append((patch, history_title(label, hostname, counts[name])))
             
-    except Exception as e:
-        logger.error(f"Error fetching CPU history data: {e}")
-        return []
+            last_id = max(max(history[name]['id']) for name in metric_names if new_rows[name])
+            return panels, {'device_id': device_id, 'last_id': last_id, 'counts': counts}
+    
+    # New device, first load or too many new rows: send the whole (downsampled) history
+    logger.debug(f"Loading full history for device {device_id}")
+    resolution = get_system_metrics_resolution(DATABASE_PATH, metric_names, device_id, min_points=HISTORY_MAX_POINTS)
+    if resolution:
+        # Read the cursor first: rows stored meanwhile are appended later rather than missed
+        last_id = get_last_system_metric_id(DATABASE_PATH)
+        history = get_device_metrics_history_columns(DATABASE_PATH, device_id, metric_names, resolution=resolution)
+    else:
+        history = get_device_metrics_history_columns(DATABASE_PATH, device_id, metric_names)
+        last_id = max((max(history[name]['id']) for name in metric_names if history[name]['id']), default=0)
+    
+    panels = []
+    counts = {}
+    for name, _, label in HISTORY_METRICS:
+        columns = downsample_columns(history[name], HISTORY_MAX_POINTS, 'metric_value', method=CHART_DOWNSAMPLING_METHOD)
+        records = history_records(columns)
+        counts[name] = len(records)
+        panels.append((records, history_title(label, hostname, len(records))))
+    
+    return panels, {'device_id': device_id, 'last_id': last_id, 'counts': counts}
+
+def toggle_history(current_style):
+    """Flip a history container between shown and hidden"""
+    is_visible = current_style and current_style.get("display") != "none"
+    if is_visible:
+        return {"display": "none"}, "Show History"
+    return {"display": "block"}, "Hide History"
 
-# Callback to update RAM history data
+# One callback refreshes every history table, so all metrics of the device cost a single query
 @app.callback(
-    Output('ram-history-data-store', 'data'),
+    [Output(f'{key}-history-table', 'data') for _, key, _ in HISTORY_METRICS] +
+    [Output(f'{key}-history-title', 'children') for _, key, _ in HISTORY_METRICS] +
+    [Output('history-cursor-store', 'data')],
     [Input('history-update-interval', 'n_intervals'),
+     Input('live-system-trigger', 'n_clicks'),
      Input('device-store', 'data')],
+    [State('history-cursor-store', 'data')],
     prevent_initial_call=False
 )
-def update_ram_history_data(n_intervals, device_data):
-    """Update the RAM history data store"""
-    if not device_data or not device_data.get('device_id'):
-        logger.warning("No device selected for RAM history")
-        return []
-    
-    device_id = device_data.get('device_id')
-    logger.warning(f"Fetching RAM history for device {device_id}")
-    
+def update_history_data(n_intervals, live_updates, device_data, cursor):
+    """Append new history rows to each metric's table, or reload them when the device changes"""
     try:
-        # Fetch RAM history data directly from database
-        history_data = get_system_metrics_history(db_path=DATABASE_PATH, metric_name='ram_usage', device_id=device_id)
-        logger.warning(f"Retrieved {len(history_data)} RAM history records")
-        return history_data
-            
+        panels, new_cursor = refresh_histories(device_data, cursor)
     except Exception as e:
-        logger.error(f"Error fetching RAM history data: {e}")
-        return []
+        logger.error(f"Error fetching history data: {e}")
+        return [dash.no_update] * (2 * len(HISTORY_METRICS) + 1)
+    
+    tables = [data for data, _ in panels]
+    titles = [title for _, title in panels]
+    return tables + titles + [new_cursor]
 
 # Callback to toggle CPU history table visibility
 @app.callback(
     [Output('cpu-history-container', 'style'),
-     Output('cpu-history-container', 'children'),
      Output('toggle-cpu-history', 'children')],
-    [Input('toggle-cpu-history', 'n_clicks'),
-     Input('cpu-history-data-store', 'data')],
-    [State('cpu-history-container', 'style'),
-     State('device-store', 'data')]
+    [Input('toggle-cpu-history', 'n_clicks')],
+    [State('cpu-history-container', 'style')],
+    prevent_initial_call=True
 )
-def toggle_cpu_history(n_clicks, history_data, current_style, device_data):
-    """Toggle visibility of CPU history data and update the table"""
-    ctx = dash.callback_context
-    trigger_id = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else None
-    
-    # Get device information
-    device_id = device_data.get('device_id') if device_data else None
-    device_hostname = device_data.get('hostname', 'No Device Selected') if device_data else 'No Device Selected'
-    
-    # If toggle button wasn't clicked and we're just updating data, maintain current visibility
-    if trigger_id != 'toggle-cpu-history' and current_style:
-        is_visible = current_style.get("display") != "none"
-        if not is_visible:
-            return current_style, [], "Show History"
-    else:
-        # Check if the container is currently visible
-        is_visible = current_style and current_style.get("display") != "none"
-        if is_visible and trigger_id == 'toggle-cpu-history':
-            return {"display": "none"}, [], "Show History"
-    
-    # If no device is selected, show a message
-    if not device_id:
-        no_device_message = html.Div([
-            html.H5("No device selected"),
-            html.P("Please select a device to view CPU usage history.")
-        ], className="text-center p-3")
-        return {"display": "block"}, no_device_message, "Hide History"
-    
-    # Create a DataTable with the history data
-    if history_data:
-        # Format the data for the table
-        formatted_data = []
-        for entry in history_data:
-            formatted_data.append({
-                'timestamp': entry.get('timestamp', ''),
-                'metric_value': entry.get('metric_value', 0)
-            })
-        
-        # Create the table
-        table = dash_table.DataTable(
-            id='cpu-history-table',
-            columns=[
-                {'name': 'Time', 'id': 'timestamp'},
-                {
-                    'name': 'CPU Usage (%)', 
-                    'id': 'metric_value',
-                    'type': 'numeric',
-                    'format': {'specifier': '.2f'}
-                }
-            ],
-            data=formatted_data,
-            page_size=10,
-            style_table=TABLE_STYLE,
-            style_cell={
-                'textAlign': 'left',
-                'padding': '8px',
-                'fontFamily': 'Arial, sans-serif'
-            },
-            style_header={
-                'fontWeight': 'bold',
-                'backgroundColor': '#f8f9fa',
-                'borderBottom': '1px solid #dee2e6'
-            },
-            style_data_conditional=[
-                {'if': {'row_index': 'odd'}, 'backgroundColor': '#f9f9f9'}
-            ],
-            sort_action='native',
-            filter_action='native',
-            sort_by=[{'column_id': 'timestamp', 'direction': 'desc'}]
-        )
-        
-        # Create the container with the table
-        container = html.Div([
-            html.H5(f"CPU Usage History - {device_hostname} ({len(formatted_data)} entries)"),
-            table
-        ], className="mt-4")
-        
-        return {"display": "block"}, container, "Hide History"
-    else:
-        # No history data available
-        no_data_message = html.Div([
-            html.H5(f"No CPU Usage History"),
-            html.P(f"No CPU usage history data available for {device_hostname}.")
-        ], className="text-center p-3")
-        
-        return {"display": "block"}, no_data_message, "Hide History"
+def toggle_cpu_history(n_clicks, current_style):
+    """Toggle visibility of the CPU history table"""
+    return toggle_history(current_style)
 
 # Callback to toggle RAM history table visibility
 @app.callback(
     [Output('ram-history-container', 'style'),
-     Output('ram-history-container', 'children'),
      Output('toggle-ram-history', 'children')],
-    [Input('toggle-ram-history', 'n_clicks'),
-     Input('ram-history-data-store', 'data')],
-    [State('ram-history-container', 'style'),
-     State('device-store', 'data')]
+    [Input('toggle-ram-history', 'n_clicks')],
+    [State('ram-history-container', 'style')],
+    prevent_initial_call=True
 )
-def toggle_ram_history(n_clicks, history_data, current_style, device_data):
-    """Toggle visibility of RAM history data and update the table"""
-    ctx = dash.callback_context
-    trigger_id = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else None
-    
-    # Get device information
-    device_id = device_data.get('device_id') if device_data else None
-    device_hostname = device_data.get('hostname', 'No Device Selected') if device_data else 'No Device Selected'
-    
-    # If toggle button wasn't clicked and we're just updating data, maintain current visibility
-    if trigger_id != 'toggle-ram-history' and current_style:
-        is_visible = current_style.get("display") != "none"
-        if not is_visible:
-            return current_style, [], "Show History"
-    else:
-        # Check if the container is currently visible
-        is_visible = current_style and current_style.get("display") != "none"
-        if is_visible and trigger_id == 'toggle-ram-history':
-            return {"display": "none"}, [], "Show History"
-    
-    # If no device is selected, show a message
-    if not device_id:
-        no_device_message = html.Div([
-            html.H5("No device selected"),
-            html.P("Please select a device to view RAM usage history.")
-        ], className="text-center p-3")
-        return {"display": "block"}, no_device_message, "Hide History"
-    
-    # Create a DataTable with the history data
-    if history_data:
-        # Format the data for the table
-        formatted_data = []
-        for entry in history_data:
-            formatted_data.append({
-                'timestamp': entry.get('timestamp', ''),
-                'metric_value': entry.get('metric_value', 0)
-            })
-        
-        # Create the table
-        table = dash_table.DataTable(
-            id='ram-history-table',
-            columns=[
-                {'name': 'Time', 'id': 'timestamp'},
-                {
-                    'name': 'RAM Usage (%)', 
-                    'id': 'metric_value',
-                    'type': 'numeric',
-                    'format': {'specifier': '.2f'}
-                }
-            ],
-            data=formatted_data,
-            page_size=10,
-            style_table=TABLE_STYLE,
-            style_cell={
-                'textAlign': 'left',
-                'padding': '8px',
-                'fontFamily': 'Arial, sans-serif'
-            },
-            style_header={
-                'fontWeight': 'bold',
-                'backgroundColor': '#f8f9fa',
-                'borderBottom': '1px solid #dee2e6'
-            },
-            style_data_conditional=[
-                {'if': {'row_index': 'odd'}, 'backgroundColor': '#f9f9f9'}
-            ],
-            sort_action='native',
-            filter_action='native',
-            sort_by=[{'column_id': 'timestamp', 'direction': 'desc'}]
-        )
-        
-        # Create the container with the table
-        container = html.Div([
-            html.H5(f"RAM Usage History - {device_hostname} ({len(formatted_data)} entries)"),
-            table
-        ], className="mt-4")
-        
-        return {"display": "block"}, container, "Hide History"
-    else:
-        # No history data available
-        no_data_message = html.Div([
-            html.H5(f"No RAM Usage History"),
-            html.P(f"No RAM usage history data available for {device_hostname}.")
-        ], className="text-center p-3")
-        
-        return {"display": "block"}, no_data_message, "Hide History"
\ No newline at end of file
+def toggle_ram_history(n_clicks, current_style):
+    """Toggle visibility of the RAM history table"""
+    return toggle_history(current_style)
@@ -27,8 +27,9 @@ if not os.path.isabs(config['database_path']):
 else:
     DATABASE_PATH = config['database_path']
 
-# Callback to update UI refresh animation
-@app.callback(
+# Spin the refresh icon and disable the button in the browser while the page reloads
+app.clientside_callback(
+    ClientsideFunction(namespace='dashboard', function_name='refresh_ui'),
     [
         Output('refresh-spinner', 'className'),
         Output('refresh-button', 'disabled')
@@ -36,19 +37,18 @@ else:
     [
         Input('refresh-button', 'n_clicks'),
     ],
-    [
-        State('refresh-spinner', 'className')
-    ],
     prevent_initial_call=True
 )
-def update_refresh_ui(n_clicks, current_class):
-    """Update refresh button UI animation"""
-    if n_clicks:
-        # Start spinning animation
-        return "fas fa-sync-alt fa-spin", True
-    
-    # Default (non-spinning)
-    return "fas fa-sync-alt", False
+
+# Scope the live update stream to the selected device and symbol, reconnecting in the browser
+app.clientside_callback(
+    ClientsideFunction(namespace='live_updates', function_name='watch'),
+    Output('live-updates-filter', 'data'),
+    [
+        Input('device-selector', 'value'),
+        Input('stock-symbol-dropdown', 'value'),
+    ]
+)
 
 # Callback to check database connectivity
 @app.callback(
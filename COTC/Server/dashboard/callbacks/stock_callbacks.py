@@ -1,7 +1,8 @@
 import dash
 from dashboard.app import app
 from dashboard.utils.config import COLORS, TABLE_STYLE
-from dash import dcc, html, Input, Output, dash_table, State
+from dash import dcc, html, Input, Output, dash_table, State, ClientsideFunction
+from dash.dash_table import FormatTemplate
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 from datetime import datetime
@@ -11,9 +12,11 @@ import os
 from database.models import (
     fetch_stock_symbols,
     fetch_latest_stock_data,
-    get_stock_history
+    get_stock_history_columns,
+    get_stock_resolution
 )
 from api.endpoints import set_pending_stock_symbol_direct
+from dashboard.utils.downsample import downsample_columns, replace_range, visible_range
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -33,6 +36,20 @@ if not os.path.isabs(config['database_path']):
 else:
     DATABASE_PATH = config['database_path']
 
+# Charts are downsampled to at most this many points per trace
+CHART_DOWNSAMPLING = config.get('chart_downsampling', {})
+CHART_MAX_POINTS = CHART_DOWNSAMPLING.get('max_points', 2000)
+CHART_DOWNSAMPLING_METHOD = CHART_DOWNSAMPLING.get('method', 'lttb')
+
+# How rows read from the rollups are described in titles, by resolution in seconds
+RESOLUTION_LABELS = {60: "1-minute", 3600: "hourly", 86400: "daily"}
+
+def history_description(count, resolution, noun):
+    """Describe a number of history rows, e.g. "1200 hourly averages" or "340 entries" for raw rows"""
+    if resolution:
+        return f"{count} {RESOLUTION_LABELS.get(resolution, f'{resolution}s')} averages"
+    return f"{count} {noun}"
+
 # Combined callback to set initial stock symbols, add new symbols, and periodically update dropdown
 @app.callback(
     [Output('stock-symbol-status', 'children'),
@@ -41,10 +58,11 @@ else:
      Output('stock-symbol-input', 'value', allow_duplicate=True)],
     [Input('add-symbol-button', 'n_clicks'),
      Input('update-symbols-interval', 'n_intervals'),
+     Input('live-symbols-trigger', 'n_clicks'),
      Input('stock-symbols-store', 'data')],
     [State('stock-symbol-input', 'value')]
 )
-def manage_stock_symbols(n_clicks, n_intervals, store_data, symbol):
+def manage_stock_symbols(n_clicks, n_intervals, live_updates, store_data, symbol):
     ctx = dash.callback_context
     # If this is the initial call (page load) or no specific trigger
     if not ctx.triggered or ctx.triggered[0]['prop_id'].split('.')[0] == '':
@@ -98,8 +116,8 @@ def manage_stock_symbols(n_clicks, n_intervals, store_data, symbol):
             status_div = html.Div(status_message, className="text-danger")
             return status_div, dash.no_update, dash.no_update, ""
     
-    elif triggered_input == 'update-symbols-interval':
-        # Periodically update the symbols list from the database
+    elif triggered_input in ('update-symbols-interval', 'live-symbols-trigger'):
+        # Update the symbols list from the database periodically or when a new symbol is stored
         try:
             symbols = fetch_stock_symbols(DATABASE_PATH)
             options = [{'label': sym, 'value': sym} for sym in symbols]
@@ -116,9 +134,10 @@ def manage_stock_symbols(n_clicks, n_intervals, store_data, symbol):
 @app.callback(
     [Output('current-price', 'children'),
      Output('stock-price-history', 'children')],
-    [Input('stock-symbol-dropdown', 'value')]
+    [Input('stock-symbol-dropdown', 'value'),
+     Input('live-stock-trigger', 'n_clicks')]
 )
-def display_latest_stock_data_and_table(symbol):
+def display_latest_stock_data_and_table(symbol, live_updates):
     if not symbol:
         return html.Div("Select a stock symbol to view data", className="text-muted text-center p-4"), ""
     
@@ -137,54 +156,27 @@ def display_latest_stock_data_and_table(symbol):
                 html.P(f"Last updated: {timestamp}", className="text-muted small")
             ], className="text-center py-4")
             
-            # Fetch historical data
-            history = get_stock_history(DATABASE_PATH, symbol)
+            # Fetch historical data as columns, oldest first; long histories come from the rollups
+            resolution = get_stock_resolution(DATABASE_PATH, symbol, min_points=CHART_MAX_POINTS)
+            history = get_stock_history_columns(DATABASE_PATH, symbol, resolution=resolution)
             
-            if history:
-                # Create a data table with the history
-                table_data = []
-                for item in history:
-                    try:
-                        # Try to parse the timestamp and format it nicely
-                        if isinstance(item['timestamp'], str):
-                            if 'T' in item['timestamp']:
-                                # Parse ISO format timestamp
-                                timestamp_parts = item['timestamp'].split('T')
-                                date_part = timestamp_parts[0]
-                                time_part = timestamp_parts[1].split('.')[0] if '.' in timestamp_parts[1] else timestamp_parts[1]
-                                formatted_timestamp = f"{date_part} {time_part}"
-                            else:
-                                # Already a simple format
-                                formatted_timestamp = item['timestamp']
-                        else:
-                            # Handle datetime object
-                            formatted_timestamp = item['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-                            
-                        # Format the price with dollar sign and 2 decimal places
-                        formatted_price = f"${float(item['price']):.2f}"
-                        
-                        table_data.append({
-                            "timestamp": formatted_timestamp,
-                            "price": formatted_price
-                        })
-                    except Exception as e:
-                        logger.error(f"Error formatting history item: {e}")
-                        # Skip this item if there's an error
-                        continue
-                
-                # Sort the data by timestamp (newest first) but show all entries
-                table_data = sorted(table_data, key=lambda x: x['timestamp'], reverse=True)
+            if history['timestamp']:
+                # Newest first; prices are formatted as money by the table itself
+                table_data = [
+                    {"timestamp": timestamp, "price": price}
+                    for timestamp, price in zip(reversed(history['timestamp']), reversed(history['price']))
+                ]
                 
                 # Count the total number of entries
                 total_entries = len(table_data)
                 
                 table = html.Div([
-                    html.H4(f"Price History ({total_entries} entries)", className="mb-3"),
+                    html.H4(f"Price History ({history_description(total_entries, resolution, 'entries')})", className="mb-3"),
                     dash_table.DataTable(
                         id='stock-history-table',
                         columns=[
                             {"name": "Timestamp", "id": "timestamp"},
-                            {"name": "Price", "id": "price"}
+                            {"name": "Price", "id": "price", "type": "numeric", "format": FormatTemplate.money(2)}
                         ],
                         data=table_data,
                         style_table=TABLE_STYLE['table'],
@@ -225,9 +217,11 @@ def display_latest_stock_data_and_table(symbol):
 # Callback to update the stock price chart
 @app.callback(
     Output('stock-price-chart', 'figure'),
-    [Input('stock-symbol-dropdown', 'value')]
+    [Input('stock-symbol-dropdown', 'value'),
+     Input('stock-price-chart', 'relayoutData'),
+     Input('live-stock-trigger', 'n_clicks')]
 )
-def update_stock_chart(symbol):
+def update_stock_chart(symbol, relayout_data, live_updates):
     if not symbol:
         # Return empty figure
         fig = go.Figure()
@@ -242,36 +236,37 @@ def update_stock_chart(symbol):
         return fig
     
     try:
-        # Fetch stock history directly from the database
-        history = get_stock_history(DATABASE_PATH, symbol)
+        # Fetch stock history directly from the database as columns, from the rollups
+        # at the coarsest resolution that still fills the chart when the history is long
+        resolution = get_stock_resolution(DATABASE_PATH, symbol, min_points=CHART_MAX_POINTS)
+        history = get_stock_history_columns(DATABASE_PATH, symbol, resolution=resolution)
         
-        if history:
-            # Extract data for plotting
-            dates = []
-            prices = []
+        if history['timestamp']:
+            # Zooming or new prices re-run the callback, adding detail inside the visible
+            # range; a new symbol always starts from the full range
+            ctx = dash.callback_context
+            trigger_id = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else None
+            x_range = visible_range(relayout_data) if trigger_id in ('stock-price-chart', 'live-stock-trigger') else None
             
-            for item in history:
-                try:
-                    # Try to convert timestamp to datetime
-                    if isinstance(item['timestamp'], str):
-                        # Parse the timestamp
-                        dates.append(item['timestamp'])
-                    else:
-                        # Already a datetime object
-                        dates.append(item['timestamp'].isoformat())
-                    
-                    # Convert price to float
-                    prices.append(float(item['price']))
-                except Exception as e:
-                    logger.error(f"Error processing history item for chart: {e}")
-                    # Skip this item if there's an error
-                    continue
+            if x_range and resolution:
+                # The visible range alone may support a finer resolution
+                detail_resolution = get_stock_resolution(
+                    DATABASE_PATH, symbol, since=x_range[0], until=x_range[1], min_points=CHART_MAX_POINTS
+                )
+                if detail_resolution != resolution:
+                    detail = get_stock_history_columns(
+                        DATABASE_PATH, symbol, since=x_range[0], until=x_range[1], resolution=detail_resolution
+                    )
+                    history = replace_range(history, detail, x_range)
+            
+            total_points = len(history['timestamp'])
+            history = downsample_columns(history, CHART_MAX_POINTS, 'price', method=CHART_DOWNSAMPLING_METHOD, x_range=x_range)
             
             # Create the line chart
             fig = go.Figure()
             fig.add_trace(go.Scatter(
-                x=dates, 
-                y=prices,
+                x=history['timestamp'], 
+                y=history['price'],
                 mode='lines+markers',
                 name=symbol,
                 line=dict(color=COLORS['primary'], width=2),
@@ -280,7 +275,7 @@ def update_stock_chart(symbol):
             
             # Update layout
             fig.update_layout(
-                title=f"{symbol} Price History ({len(dates)} data points)",
+                title=f"{symbol} Price History ({history_description(total_points, resolution, 'data points')})",
                 xaxis_title="Date",
                 yaxis_title="Price ($)",
                 template="plotly_white",
@@ -291,6 +286,8 @@ def update_stock_chart(symbol):
                     font_family="Arial"
                 ),
                 showlegend=False,
+                # Keep the user's zoom when the figure is rebuilt for the same symbol
+                uirevision=symbol,
                 # Add range slider for easy navigation of historical data
                 xaxis=dict(
                     rangeslider=dict(visible=True),
@@ -331,22 +328,17 @@ def update_stock_chart(symbol):
         )
         return fig
 
-# Callback to handle polling for stock price updates
-@app.callback(
+# Show the polling status in the browser
+app.clientside_callback(
+    ClientsideFunction(namespace='dashboard', function_name='polling_status'),
     Output('polling-status', 'children'),
     [Input('polling-interval', 'n_intervals')]
 )
-def update_polling_status(n_intervals):
-    """
-    This callback doesn't need to be changed as it's just displaying UI elements.
-    The actual polling happens on the client side.
-    """
-    if n_intervals:
-        return [
-            html.Span("✓", className="text-success me-2"),
-            f"Polling active (every {n_intervals} intervals)"
-        ]
-    return [
-        html.Span("○", className="text-muted me-2"),
-        "Polling inactive"
-    ]
\ No newline at end of file
+
+# Convert the stock symbol input to uppercase as the user types, without a server round-trip
+app.clientside_callback(
+    ClientsideFunction(namespace='dashboard', function_name='uppercase'),
+    Output('stock-symbol-input', 'value', allow_duplicate=True),
+    [Input('stock-symbol-input', 'value')],
+    prevent_initial_call=True
+)
\ No newline at end of file
@@ -1,12 +1,11 @@
 import dash
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 from dash import html
 import logging
 import datetime
 import json
 import os
 from dashboard.app import app
-from dashboard.components.charts import create_gauge_figure, create_error_gauge, get_color_based_on_value
 from database.models import fetch_latest_system_metrics
 
 # Set up logging
@@ -27,17 +26,17 @@ if not os.path.isabs(config['database_path']):
 else:
     DATABASE_PATH = config['database_path']
 
-# Callback to update CPU and RAM gauges
+# Callback to fetch the CPU and RAM values; the gauges are drawn client-side
 @app.callback(
-    [Output('cpu-gauge', 'figure'),
-     Output('ram-gauge', 'figure'),
+    [Output('gauge-values-store', 'data'),
      Output('last-update-time-store', 'data')],
     [Input('interval-component', 'n_intervals'),
+     Input('live-system-trigger', 'n_clicks'),
      Input('refresh-button', 'n_clicks'),
      Input('device-store', 'data')],
 )
-def update_system_metrics(n_intervals, n_clicks, device_data):
-    """Update the CPU and RAM gauges with current system metrics"""
+def update_system_metrics(n_intervals, live_updates, n_clicks, device_data):
+    """Fetch the current CPU and RAM values for the gauges"""
     ctx = dash.callback_context
     trigger = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else 'no trigger'
     
@@ -46,13 +45,12 @@ def update_system_metrics(n_intervals, n_clicks, device_data):
     
     # Get the device ID if available
     device_id = device_data.get('device_id') if device_data else None
+    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     # If no device is selected, show error gauges
     if not device_id:
         logger.warning("No device selected, returning error gauges")
-        cpu_figure = create_error_gauge("CPU Usage - No Device")
-        ram_figure = create_error_gauge("RAM Usage - No Device")
-        return cpu_figure, ram_figure, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return {"error": "No Device"}, current_time
     
     # Fetch metrics from database
     try:
@@ -62,38 +60,30 @@ def update_system_metrics(n_intervals, n_clicks, device_data):
         
         if not metrics:
             logger.warning("No metrics found for device")
-            cpu_figure = create_error_gauge("CPU Usage - No Data")
-            ram_figure = create_error_gauge("RAM Usage - No Data")
-            return cpu_figure, ram_figure, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            return {"error": "No Data"}, current_time
         
         # Extract CPU and RAM values
         cpu_value = metrics.get('cpu_usage', 0)
         ram_value = metrics.get('ram_usage', 0)
         
         logger.warning(f"CPU Usage: {cpu_value}%, RAM Usage: {ram_value}%")
-        
-        # Create CPU gauge
-        cpu_color = get_color_based_on_value(cpu_value)
-        cpu_figure = create_gauge_figure("CPU Usage", cpu_value, cpu_color)
-        
-        # Create RAM gauge
-        ram_color = get_color_based_on_value(ram_value)
-        ram_figure = create_gauge_figure("RAM Usage", ram_value, ram_color)
-        
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        return cpu_figure, ram_figure, current_time
+        return {"cpu_usage": cpu_value, "ram_usage": ram_value}, current_time
         
     except Exception as e:
         logger.error(f"Error updating system metrics: {e}")
-        cpu_figure = create_error_gauge("CPU Usage - Error")
-        ram_figure = create_error_gauge("RAM Usage - Error")
-        return cpu_figure, ram_figure, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return {"error": "Error"}, current_time
 
-# Callback to update the last update time display
-@app.callback(
+# Draw the gauges in the browser, coloured by value (see assets/clientside.js)
+app.clientside_callback(
+    ClientsideFunction(namespace='dashboard', function_name='render_gauges'),
+    [Output('cpu-gauge', 'figure'),
+     Output('ram-gauge', 'figure')],
+    [Input('gauge-values-store', 'data')]
+)
+
+# Update the last update time display in the browser
+app.clientside_callback(
+    ClientsideFunction(namespace='dashboard', function_name='update_time'),
     Output('last-update-time', 'children'),
     [Input('last-update-time-store', 'data')]
-)
-def update_time(timestamp):
-    """Update the last update time display"""
-    return f"Last Updated: {timestamp}" 
\ No newline at end of file
+)
\ No newline at end of file
@@ -0,0 +1,48 @@
+from dash import html, dash_table
+from dashboard.utils.config import TABLE_STYLE
+
+def create_history_table(metric_key, value_label):
+    """
+    Create the title and data table for a metric's history.
+
+    The table stays in the layout (inside its hidden container) so refreshes
+    can patch its data with new rows instead of re-rendering it.
+
+    Args:
+        metric_key: Prefix of the component ids, e.g. 'cpu'
+        value_label: Column header for the metric value
+    """
+    return [
+        html.H5(id=f'{metric_key}-history-title'),
+        dash_table.DataTable(
+            id=f'{metric_key}-history-table',
+            columns=[
+                {'name': 'Time', 'id': 'timestamp'},
+                {
+                    'name': value_label,
+                    'id': 'metric_value',
+                    'type': 'numeric',
+                    'format': {'specifier': '.2f'}
+                }
+            ],
+            data=[],
+            page_size=10,
+            style_table=TABLE_STYLE,
+            style_cell={
+                'textAlign': 'left',
+                'padding': '8px',
+                'fontFamily': 'Arial, sans-serif'
+            },
+            style_header={
+                'fontWeight': 'bold',
+                'backgroundColor': '#f8f9fa',
+                'borderBottom': '1px solid #dee2e6'
+            },
+            style_data_conditional=[
+                {'if': {'row_index': 'odd'}, 'backgroundColor': '#f9f9f9'}
+            ],
+            sort_action='native',
+            filter_action='native',
+            sort_by=[{'column_id': 'timestamp', 'direction': 'desc'}]
+        )
+    ]
@@ -2,7 +2,16 @@ import dash_bootstrap_components as dbc
 from dash import dcc, html
 from dashboard.app import LAST_UPDATE_TIME
 from dashboard.components.header import create_header
-from dashboard.utils.config import CARD_STYLE
+from dashboard.components.history_table import create_history_table
+from dashboard.utils.config import CARD_STYLE, CONFIG
+
+# With live updates the server pushes changes, so the intervals are only a slow fallback
+LIVE_UPDATES = CONFIG.get('live_updates', {})
+FALLBACK_INTERVAL = LIVE_UPDATES.get('fallback_interval', 300) * 1000 if LIVE_UPDATES.get('enabled') else None
+
+def refresh_interval(default_ms):
+    """Interval for a data poll: the default, or the fallback when live updates are enabled"""
+    return max(default_ms, FALLBACK_INTERVAL) if FALLBACK_INTERVAL else default_ms
 
 def create_layout():
     """Create the main dashboard layout"""
@@ -12,17 +21,25 @@ def create_layout():
             dcc.Store(id='device-store', storage_type='memory'),
             dcc.Store(id='stock-symbols-store', storage_type='memory'),
             dcc.Store(id='last-update-time-store', storage_type='memory'),
+            dcc.Store(id='gauge-values-store', storage_type='memory'),
             dcc.Store(id='refresh-animation-store', data={'animating': False}, storage_type='memory'),
-            dcc.Store(id='cpu-history-data-store', storage_type='memory'),
-            dcc.Store(id='ram-history-data-store', storage_type='memory'),
+            # Delta-refresh cursor shared by the history tables: device, last row id and per-metric row counts
+            dcc.Store(id='history-cursor-store', storage_type='memory'),
+            # Device and symbol the live update stream is scoped to, set by assets/live_updates.js
+            dcc.Store(id='live-updates-filter', storage_type='memory'),
+            # Clicked by assets/live_updates.js when the server reports new data
+            html.Button(id='live-system-trigger', n_clicks=0),
+            html.Button(id='live-stock-trigger', n_clicks=0),
+            html.Button(id='live-symbols-trigger', n_clicks=0),
+            html.Button(id='live-devices-trigger', n_clicks=0),
         ], style={'display': 'none'}),
         
         # Intervals for auto-refresh
-        dcc.Interval(id='interval-component', interval=30*1000, n_intervals=0),  # Auto-refresh every 30 seconds
-        dcc.Interval(id='update-symbols-interval', interval=60*1000, n_intervals=0),  # Update symbols every 60 seconds
+        dcc.Interval(id='interval-component', interval=refresh_interval(30*1000), n_intervals=0),  # Auto-refresh every 30 seconds
+        dcc.Interval(id='update-symbols-interval', interval=refresh_interval(60*1000), n_intervals=0),  # Update symbols every 60 seconds
         dcc.Interval(id='clock-interval', interval=1000, n_intervals=0),  # Clock update every second
-        dcc.Interval(id='device-update-interval', interval=60*1000, n_intervals=0),  # Update devices list every minute
-        dcc.Interval(id='history-update-interval', interval=30*1000, n_intervals=0),  # Update history data every 30 seconds
+        dcc.Interval(id='device-update-interval', interval=refresh_interval(60*1000), n_intervals=0),  # Update devices list every minute
+        dcc.Interval(id='history-update-interval', interval=refresh_interval(30*1000), n_intervals=0),  # Update history data every 30 seconds
         dcc.Interval(id='polling-interval', interval=10*1000, n_intervals=0),  # Polling interval for stock symbols
         
         # Add a store for page reload
@@ -86,6 +103,7 @@ def create_layout():
             dbc.Row([
                 dbc.Col([
                     html.Div(
+                        create_history_table('cpu', 'CPU Usage (%)'),
                         id='cpu-history-container',
                         className="mt-3",
                         style={'display': 'none'}
@@ -97,6 +115,7 @@ def create_layout():
             dbc.Row([
                 dbc.Col([
                     html.Div(
+                        create_history_table('ram', 'RAM Usage (%)'),
                         id='ram-history-container',
                         className="mt-3",
                         style={'display': 'none'}
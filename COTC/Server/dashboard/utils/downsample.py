@@ -0,0 +1,233 @@
+"""
+Chart downsampling utilities.
+
+Reduces long time series to a bounded number of points before they are sent
+to the browser. Largest-Triangle-Three-Buckets keeps the visual shape of a
+line, while the min/max envelope keeps every spike in each bucket.
+"""
+import bisect
+from datetime import datetime
+
+# Share of the point budget given to each side outside the visible range,
+# so the range slider still shows an overview of the whole series
+OUTSIDE_RANGE_SHARE = 0.1
+
+METHODS = ('lttb', 'minmax')
+
+UNIX_EPOCH = datetime(1970, 1, 1)
+
+
+def lttb(xs, ys, threshold):
+    """
+    Select points with the Largest-Triangle-Three-Buckets algorithm.
+
+    Args:
+        xs: Ascending numeric x values
+        ys: Numeric y values
+        threshold: Maximum number of points to keep
+
+    Returns:
+        Ascending list of indices into xs/ys
+    """
+    length = len(xs)
+    if threshold >= length or length <= 2:
+        return list(range(length))
+    if threshold < 3:
+        return [0, length - 1][:max(threshold, 0)]
+
+    # First and last points are always kept; the rest is split into equal buckets
+    bucket_size = (length - 2) / (threshold - 2)
+    indices = [0]
+    selected = 0
+
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Average of the next bucket is the third vertex of the triangle
+        next_end = min(int((bucket + 2) * bucket_size) + 1, length)
+        next_count = next_end - end
+        avg_x = sum(xs[end:next_end]) / next_count
+        avg_y = sum(ys[end:next_end]) / next_count
+
+        ax = xs[selected]
+        ay = ys[selected]
+        max_area = -1.0
+        for index in range(start, end):
+            area = abs((ax - avg_x) * (ys[index] - ay) - (ax - xs[index]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                selected = index
+        indices.append(selected)
+
+    indices.append(length - 1)
+    return indices
+
+def min_max_envelope(xs, ys, threshold):
+    """
+    Keep the minimum and maximum of each bucket so no spike is lost.
+
+    Args:
+        xs: Ascending numeric x values
+        ys: Numeric y values
+        threshold: Maximum number of points to keep
+
+    Returns:
+        Ascending list of indices into xs/ys
+    """
+    length = len(xs)
+    if threshold >= length or length <= 2:
+        return list(range(length))
+    if threshold < 4:
+        return lttb(xs, ys, threshold)
+
+    # Two points per bucket, plus the first and last points
+    buckets = max((threshold - 2) // 2, 1)
+    bucket_size = (length - 2) / buckets
+    indices = [0]
+
+    for bucket in range(buckets):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        if start >= end:
+            continue
+        low = high = start
+        for index in range(start + 1, end):
+            if ys[index] < ys[low]:
+                low = index
+            elif ys[index] > ys[high]:
+                high = index
+        indices.extend(sorted({low, high}))
+
+    indices.append(length - 1)
+    return indices
+
+def _select(xs, ys, threshold, method):
+    """Run the chosen downsampling method over numeric xs/ys."""
+    if method == 'minmax':
+        return min_max_envelope(xs, ys, threshold)
+    return lttb(xs, ys, threshold)
+
+def _to_epoch(value):
+    """
+    Convert an ISO timestamp string or datetime to epoch seconds.
+
+    Naive timestamps are read as UTC, matching the "epoch" column of the
+    columnar history functions in database.models.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return (value - UNIX_EPOCH).total_seconds()
+
+def downsample_series(timestamps, values, max_points, method='lttb', x_range=None, epochs=None):
+    """
+    Reduce a time series to at most max_points points.
+
+    With an x_range, points inside the range get most of the budget and the
+    parts outside it are kept at a coarse resolution.
+
+    Args:
+        timestamps: Ascending ISO timestamp strings or datetimes
+        values: Numeric values
+        max_points: Maximum number of points to return
+        method: 'lttb' or 'minmax'
+        x_range: Optional (start, end) datetimes of the visible range
+        epochs: Optional precomputed epoch seconds for timestamps, avoiding per-row parsing
+
+    Returns:
+        Tuple (timestamps, values) with the selected points, in the original types
+    """
+    indices = _select_range(timestamps, values, max_points, method, x_range, epochs)
+    if indices is None:
+        return list(timestamps), list(values)
+    return [timestamps[index] for index in indices], [values[index] for index in indices]
+
+def downsample_columns(columns, max_points, value_key, timestamp_key='timestamp', method='lttb', x_range=None):
+    """
+    Downsample columnar history (as returned by the *_history_columns functions in database.models).
+
+    Every column is reduced to the same selected rows. The "epoch" column is
+    used for the x axis when present.
+
+    Returns:
+        Dictionary with the same keys and at most max_points values per column
+    """
+    indices = _select_range(
+        columns[timestamp_key], columns[value_key], max_points, method, x_range, columns.get('epoch')
+    )
+    if indices is None:
+        return columns
+    return {key: [column[index] for index in indices] for key, column in columns.items()}
+
+def _select_range(timestamps, values, max_points, method, x_range, epochs):
+    """
+    Choose the indices to keep, giving the visible range most of the budget.
+
+    Returns:
+        Ascending list of indices, or None when no reduction is needed
+    """
+    if len(timestamps) <= max_points:
+        return None
+
+    xs = epochs if epochs is not None else [_to_epoch(timestamp) for timestamp in timestamps]
+
+    if x_range is None:
+        segments = [(0, len(xs), max_points)]
+    else:
+        # Split into before / inside / after the visible range
+        left = bisect.bisect_left(xs, _to_epoch(x_range[0]))
+        right = bisect.bisect_right(xs, _to_epoch(x_range[1]))
+        outside_points = max(int(max_points * OUTSIDE_RANGE_SHARE), 2)
+        segments = [
+            (0, left, outside_points),
+            (left, right, max(max_points - 2 * outside_points, 3)),
+            (right, len(xs), outside_points)
+        ]
+
+    indices = []
+    for start, end, budget in segments:
+        if start >= end:
+            continue
+        selected = _select(xs[start:end], values[start:end], budget, method)
+        indices.extend(start + index for index in selected)
+    return indices
+
+def replace_range(columns, detail, x_range):
+    """
+    Replace the rows of columnar history inside x_range with more detailed rows covering it.
+
+    Both inputs need an "epoch" column; only the columns they share are kept.
+
+    Returns:
+        Dictionary of columns, still in ascending time order
+    """
+    epochs = columns['epoch']
+    left = bisect.bisect_left(epochs, _to_epoch(x_range[0]))
+    right = bisect.bisect_right(epochs, _to_epoch(x_range[1]))
+    return {
+        key: list(column[:left]) + list(detail[key]) + list(column[right:])
+        for key, column in columns.items()
+        if key in detail
+    }
+
+def visible_range(relayout_data, axis='xaxis'):
+    """
+    Extract the visible date range of an axis from a graph's relayoutData.
+
+    Returns:
+        Tuple (start, end) of datetimes, or None when the axis is autoranged
+    """
+    if not relayout_data or relayout_data.get(f'{axis}.autorange'):
+        return None
+
+    bounds = relayout_data.get(f'{axis}.range')
+    if bounds is None and f'{axis}.range[0]' in relayout_data:
+        bounds = [relayout_data[f'{axis}.range[0]'], relayout_data.get(f'{axis}.range[1]')]
+    if not bounds or len(bounds) != 2:
+        return None
+
+    try:
+        start, end = (datetime.fromisoformat(str(bound)) for bound in bounds)
+    except ValueError:
+        return None
+    return (start, end) if start <= end else (end, start)
@@ -0,0 +1,94 @@
+"""
+Device Identity Cache
+
+Thread-safe in-memory map from a device's MAC address and device_id to its
+integer devices.id primary key, so the ingest path can resolve known devices
+without a SELECT. Entries are dropped whenever a registration changes a
+device's identifiers.
+"""
+import threading
+
+
+class DeviceCache:
+    def __init__(self):
+        """Initialize an empty cache."""
+        self._by_mac = {}
+        self._by_device_id = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def lookup(self, mac_address=None, device_id=None):
+        """
+        Look up a device's primary key.
+
+        The MAC address is authoritative when given, matching how the
+        endpoints resolve devices; device_id is only used without one.
+
+        Returns:
+            devices.id or None on a miss
+        """
+        with self._lock:
+            if mac_address:
+                pk = self._by_mac.get(mac_address)
+            elif device_id:
+                pk = self._by_device_id.get(device_id)
+            else:
+                pk = None
+
+            if pk is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return pk
+
+    def store(self, pk, mac_address=None, device_id=None):
+        """Remember the identifiers of a device loaded from the database."""
+        with self._lock:
+            if mac_address:
+                self._by_mac[mac_address] = pk
+            if device_id:
+                self._by_device_id[device_id] = pk
+
+    def invalidate(self, mac_address=None, device_id=None, pk=None):
+        """Forget the given identifiers, and every identifier mapped to pk if given."""
+        with self._lock:
+            if mac_address:
+                self._by_mac.pop(mac_address, None)
+            if device_id:
+                self._by_device_id.pop(device_id, None)
+            if pk is not None:
+                for mapping in (self._by_mac, self._by_device_id):
+                    for key in [key for key, value in mapping.items() if value == pk]:
+                        del mapping[key]
+
+    def clear(self):
+        """Forget every device."""
+        with self._lock:
+            self._by_mac.clear()
+            self._by_device_id.clear()
+
+    def get_stats(self):
+        """Return hit/miss counters and the number of cached identifiers."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "mac_entries": len(self._by_mac),
+                "device_id_entries": len(self._by_device_id)
+            }
+
+
+# One cache per database path, shared process-wide
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_device_cache(db_path):
+    """Return the shared device cache for db_path."""
+    cache = _caches.get(db_path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(db_path, DeviceCache())
+    return cache
@@ -0,0 +1,127 @@
+"""
+Live Update Events
+
+In-process publish/subscribe used to push "new data" notifications from the
+ingestion path to connected dashboards over Server-Sent Events. Events carry
+only topic names, the same tags used by the query cache: table-wide ones
+such as "devices", and per-key ones such as "system_metrics:<devices.id>" or
+"stock_data:<symbol>" for samples stored. A subscriber can watch only some
+keys of a table, so a viewer is not woken by devices or symbols it doesn't
+display. Each subscriber keeps the set of topics changed since it last woke
+up, so bursts of writes coalesce into a single notification and memory per
+subscriber stays bounded.
+"""
+import threading
+
+
+class Subscription:
+    def __init__(self, keys=None):
+        """
+        Initialize a subscription with no pending topics.
+
+        Args:
+            keys: Optional {table tag: keys} limiting the per-key topics delivered for those tags;
+                tags not listed deliver every key
+        """
+        self._topics = set()
+        self._keys = {tag: {str(key) for key in tag_keys} for tag, tag_keys in (keys or {}).items()}
+        self._condition = threading.Condition()
+
+    def wants(self, topic):
+        """Whether a topic is delivered to this subscriber."""
+        tag, _, key = topic.partition(":")
+        return not key or tag not in self._keys or key in self._keys[tag]
+
+    def notify(self, topics):
+        """Add the wanted changed topics and wake the waiting consumer."""
+        topics = [topic for topic in topics if self.wants(topic)]
+        if not topics:
+            return
+        with self._condition:
+            self._topics.update(topics)
+            self._condition.notify()
+
+    def wait(self, timeout):
+        """
+        Wait for changed topics.
+
+        Returns:
+            Set of topics changed since the last call, or None on timeout
+        """
+        with self._condition:
+            if not self._topics:
+                self._condition.wait(timeout)
+            topics, self._topics = self._topics, set()
+        return topics or None
+
+
+class EventBroker:
+    def __init__(self, max_subscribers=100):
+        """
+        Initialize the broker.
+
+        Args:
+            max_subscribers: Maximum number of concurrent subscribers (each holds a server thread)
+        """
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._published = 0
+        self._rejected = 0
+
+    def subscribe(self, keys=None):
+        """
+        Register a new subscriber.
+
+        Args:
+            keys: Optional {table tag: keys} to watch (see Subscription)
+
+        Returns:
+            Subscription, or None when max_subscribers are already connected
+        """
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self._rejected += 1
+                return None
+            subscription = Subscription(keys)
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscriber."""
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, topics):
+        """Notify every subscriber that the given topics changed."""
+        topics = set(topics)
+        if not topics:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._published += 1
+        for subscription in subscribers:
+            subscription.notify(topics)
+
+    def get_stats(self):
+        """Return the number of subscribers and published events."""
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "max_subscribers": self.max_subscribers,
+                "published": self._published,
+                "rejected": self._rejected
+            }
+
+
+# One broker per database path, shared process-wide
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+def get_event_broker(db_path):
+    """Return the shared event broker for db_path."""
+    broker = _brokers.get(db_path)
+    if broker is None:
+        with _brokers_lock:
+            broker = _brokers.setdefault(db_path, EventBroker())
+    return broker
@@ -0,0 +1,561 @@
+"""
+Hot Tier
+
+Keeps the most recent samples of each (device, metric) and stock symbol in
+memory as columnar arrays, so dashboard reads of the last few hours and of
+the latest values need no SQLite query. Series are loaded lazily the first
+time a device or symbol is read, appended to by the ingest path after each
+commit, and dropped (to be reloaded on the next read) when a sample arrives
+out of timestamp order.
+
+Each series holds three parallel arrays (row id, epoch seconds, value) of 8
+bytes each, i.e. 24 bytes per point. A series keeps at most
+max_points_per_series points (plus 1/8 slack before it is trimmed) and no
+points older than window_hours (plus 1/8 slack), so a series holds at most
+about 27 * max_points_per_series bytes of samples (plus the arrays' growth
+headroom) and ~400 bytes of overhead; with the defaults that is ~120 KB.
+At most max_series series are kept; the least recently read device or
+symbol is evicted beyond that.
+
+A read is only answered from memory when the series holds every row it asks
+for; anything reaching further back falls through to SQLite.
+
+Loading a device or symbol does not block ingestion: rows committed while
+its series are read from SQLite are buffered by the ingest path and merged
+into the loaded series by row id before they are installed.
+"""
+import datetime
+import logging
+import math
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from sqlalchemy import func
+from .schema import (
+    get_session_factory, MetricType, SystemMetric, StockSymbol, StockData,
+    LatestMetric, LatestStockPrice
+)
+
+HOT_TIER_OPTIONS = {
+    "enabled": True,
+    "window_hours": 6,
+    "max_points_per_series": 4320,
+    "max_series": 500
+}
+
+# Naive timestamps are converted to epoch seconds as if they were UTC, like the history queries
+UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+HISTORY_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SYSTEM = "system"
+STOCK = "stock"
+
+
+def configure_hot_tier(options):
+    """Override HOT_TIER_OPTIONS (e.g. from the "hot_tier" section of config.json) before first use."""
+    if options:
+        HOT_TIER_OPTIONS.update(options)
+
+def to_epoch(timestamp):
+    """Convert a naive datetime to epoch seconds."""
+    return (timestamp - UNIX_EPOCH).total_seconds()
+
+def from_epoch(epoch):
+    """Convert epoch seconds back to a naive datetime."""
+    return UNIX_EPOCH + datetime.timedelta(seconds=epoch)
+
+
+class Series:
+    __slots__ = ("ids", "epochs", "values", "complete_since", "floor_id", "latest_epoch", "latest_value")
+
+    def __init__(self, complete_since=-math.inf, floor_id=None):
+        """
+        Initialize an empty series.
+
+        Args:
+            complete_since: Every stored row at or after this epoch is held in memory
+            floor_id: Largest id of a stored row that is not held in memory, or None if all are
+        """
+        self.ids = array("q")
+        self.epochs = array("d")
+        self.values = array("d")
+        self.complete_since = complete_since
+        self.floor_id = floor_id
+        self.latest_epoch = None
+        self.latest_value = None
+
+    def append(self, row_id, epoch, value):
+        """
+        Append a point.
+
+        Returns:
+            False if the point is older than the newest one held (the series must be reloaded)
+        """
+        if self.epochs and epoch < self.epochs[-1]:
+            return False
+        self.ids.append(row_id)
+        self.epochs.append(epoch)
+        self.values.append(value)
+        # The latest value may be newer than every held point (e.g. all of them trimmed)
+        if self.latest_epoch is None or epoch >= self.latest_epoch:
+            self.latest_epoch = epoch
+            self.latest_value = value
+        return True
+
+    def trim(self, max_points, window_seconds, force=False):
+        """
+        Drop the oldest points beyond max_points or outside the window.
+
+        Unless force is set, nothing is dropped until the series exceeds its
+        limits by 1/8, so the O(n) delete from the front is amortised.
+        """
+        size = len(self.epochs)
+        if not size:
+            return
+        cutoff = self.epochs[-1] - window_seconds
+        if not force and size <= max_points + max_points // 8 and self.epochs[0] >= cutoff - window_seconds / 8:
+            return
+
+        drop = max(bisect_left(self.epochs, cutoff), size - max_points)
+        # Never split points sharing a timestamp, so complete_since stays exact
+        while 0 < drop < size and self.epochs[drop] == self.epochs[drop - 1]:
+            drop += 1
+        if drop <= 0:
+            return
+
+        dropped_max_id = max(self.ids[:drop])
+        self.floor_id = dropped_max_id if self.floor_id is None else max(self.floor_id, dropped_max_id)
+        if drop < size:
+            self.complete_since = self.epochs[drop]
+        else:
+            self.complete_since = math.nextafter(self.epochs[-1], math.inf)
+        del self.ids[:drop]
+        del self.epochs[:drop]
+        del self.values[:drop]
+
+    def covers(self, since=None, inserted_after=None):
+        """Whether every stored row at/after since and with an id above inserted_after is held."""
+        if self.floor_id is None:
+            return True
+        if inserted_after is not None and inserted_after >= self.floor_id:
+            return True
+        return since is not None and since >= self.complete_since
+
+    def columns(self, value_key, since=None, until=None, inserted_after=None):
+        """
+        Return the held points in a range as parallel columns, oldest first.
+
+        Returns:
+            Dictionary with "id", "timestamp", "epoch" and value_key lists
+        """
+        start = bisect_left(self.epochs, since) if since is not None else 0
+        end = bisect_right(self.epochs, until) if until is not None else len(self.epochs)
+        points = zip(self.ids[start:end], self.epochs[start:end], self.values[start:end])
+        if inserted_after is not None:
+            points = [point for point in points if point[0] > inserted_after]
+        else:
+            points = list(points)
+
+        ids = [point[0] for point in points]
+        epochs = [point[1] for point in points]
+        return {
+            "id": ids,
+            "timestamp": [from_epoch(epoch).strftime(HISTORY_TIMESTAMP_FORMAT) for epoch in epochs],
+            "epoch": epochs,
+            value_key: [point[2] for point in points]
+        }
+
+    def memory_bytes(self):
+        """Bytes held by the point arrays."""
+        return sum(column.buffer_info()[1] * column.itemsize for column in (self.ids, self.epochs, self.values))
+
+
+class HotTier:
+    def __init__(self, db_path, window_hours=6, max_points_per_series=4320, max_series=500, enabled=True):
+        """
+        Initialize an empty hot tier.
+
+        Args:
+            db_path: Path to the SQLite database
+            window_hours: Hours of recent samples kept per series
+            max_points_per_series: Maximum points kept per series
+            max_series: Series kept before the least recently read device or symbol is evicted
+            enabled: When False every read falls through to SQLite and ingest is ignored
+        """
+        self.db_path = db_path
+        self.window_seconds = window_hours * 3600.0
+        self.max_points_per_series = max_points_per_series
+        self.max_series = max_series
+        self.enabled = enabled
+
+        # (SYSTEM, devices.id) -> {metric name: Series}, (STOCK, symbol) -> {symbol: Series}
+        self._units = OrderedDict()
+        self._series_count = 0
+        self._lock = threading.Lock()
+        # Held by writers across commit + append, so rows reach memory in id order
+        self.ingest_lock = threading.Lock()
+        # Unit keys being loaded -> rows recorded for them meanwhile, or None once invalidated
+        self._pending = {}
+
+        self._hits = 0
+        self._misses = 0
+        self._warmups = 0
+        self._invalidations = 0
+        self._evictions = 0
+
+    # Reads
+
+    def latest_metrics(self, device_pk, metric_name=None):
+        """
+        Latest value of each metric of a device.
+
+        Returns:
+            Dict of metric name -> value, or None if not served from memory
+        """
+        def read(unit):
+            return {
+                name: series.latest_value
+                for name, series in unit.items()
+                if series.latest_value is not None and (metric_name is None or name == metric_name)
+            }
+        return self._read((SYSTEM, device_pk), read)
+
+    def metric_columns(self, device_pk, metric_names, since=None, until=None, inserted_after=None):
+        """
+        History of several metrics of a device as parallel columns.
+
+        Returns:
+            Dict of metric name -> {"id", "timestamp", "epoch", "metric_value"},
+            or None if any metric reaches past what is held in memory
+        """
+        since, until = self._epoch_range(since, until)
+        
+        def read(unit):
+            # Every metric the device has stored is in the unit, so a missing one has no rows
+            empty = Series()
+            series = {name: unit.get(name, empty) for name in metric_names}
+            if not all(item.covers(since, inserted_after) for item in series.values()):
+                return None
+            return {
+                name: item.columns("metric_value", since, until, inserted_after)
+                for name, item in series.items()
+            }
+        return self._read((SYSTEM, device_pk), read)
+
+    def latest_stock(self, symbol):
+        """
+        Latest price of a symbol.
+
+        Returns:
+            Dict with "symbol", "price" and "timestamp" (ISO string), or None if not served from memory
+        """
+        def read(unit):
+            series = unit.get(symbol)
+            if series is None or series.latest_value is None:
+                return None
+            return {
+                "symbol": symbol,
+                "price": series.latest_value,
+                "timestamp": from_epoch(series.latest_epoch).isoformat()
+            }
+        return self._read((STOCK, symbol), read)
+
+    def stock_columns(self, symbol, since=None, until=None):
+        """
+        Price history of a symbol as parallel columns.
+
+        Returns:
+            Dict with "timestamp", "epoch" and "price" lists, or None if not served from memory
+        """
+        since, until = self._epoch_range(since, until)
+        
+        def read(unit):
+            series = unit.get(symbol)
+            if series is None or not series.covers(since):
+                return None
+            columns = series.columns("price", since, until)
+            del columns["id"]
+            return columns
+        return self._read((STOCK, symbol), read)
+
+    # Writes
+
+    def record_metrics(self, rows):
+        """
+        Append stored system metrics to the series of devices already in memory.
+
+        Must be called with ingest_lock held, right after the rows were committed.
+
+        Args:
+            rows: Iterable of (devices.id, metric name, row id, timestamp, value) in id order
+        """
+        self._record(((SYSTEM, device_pk), name, row_id, timestamp, value)
+                     for device_pk, name, row_id, timestamp, value in rows)
+
+    def record_stock(self, rows):
+        """
+        Append stored stock prices to the series of symbols already in memory.
+
+        Must be called with ingest_lock held, right after the rows were committed.
+
+        Args:
+            rows: Iterable of (symbol, row id, timestamp, price) in id order
+        """
+        self._record(((STOCK, symbol), symbol, row_id, timestamp, price)
+                     for symbol, row_id, timestamp, price in rows)
+
+    def invalidate(self, kind=None, key=None):
+        """Drop one device or symbol (or everything) from memory."""
+        with self._lock:
+            if kind is None:
+                self._units.clear()
+                self._series_count = 0
+                self._pending = dict.fromkeys(self._pending)
+            else:
+                self._drop((kind, key))
+                if (kind, key) in self._pending:
+                    self._pending[(kind, key)] = None
+            self._invalidations += 1
+
+    def get_stats(self):
+        """Return hit/miss counters and memory held."""
+        with self._lock:
+            reads = self._hits + self._misses
+            points = 0
+            memory_bytes = 0
+            for unit in self._units.values():
+                for series in unit.values():
+                    points += len(series.epochs)
+                    memory_bytes += series.memory_bytes()
+            return {
+                "enabled": self.enabled,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / reads if reads else 0.0,
+                "warmups": self._warmups,
+                "invalidations": self._invalidations,
+                "evictions": self._evictions,
+                "units": len(self._units),
+                "series": self._series_count,
+                "points": points,
+                "memory_bytes": memory_bytes
+            }
+
+    # Internals
+
+    def _epoch_range(self, since, until):
+        """Convert optional datetime bounds to epoch seconds."""
+        return (
+            to_epoch(since) if since is not None else None,
+            to_epoch(until) if until is not None else None
+        )
+
+    def _read(self, key, read):
+        """
+        Answer a read from the series of a device or symbol, loading them from SQLite on first use.
+
+        Args:
+            key: (SYSTEM, devices.id) or (STOCK, symbol)
+            read: Called with the unit while the lock is held; returns the result or None to fall through
+
+        Returns:
+            The result of read, or None if the read must go to SQLite
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            unit = self._units.get(key)
+            if unit is not None:
+                self._units.move_to_end(key)
+                return self._count(read(unit))
+            if key in self._pending:
+                # Another reader is loading it; answer this one from SQLite
+                return self._count(None)
+            self._pending[key] = []
+
+        # Loaded without blocking writers; what they commit meanwhile is buffered in _pending
+        try:
+            unit = self._load(key)
+        except Exception as e:
+            logging.error(f"Error loading hot tier series for {key}: {e}")
+            unit = None
+        with self._lock:
+            recorded = self._pending.pop(key)
+            if unit is None or recorded is None or not self._merge(unit, recorded):
+                return self._count(None)
+            self._install(key, unit)
+            self._warmups += 1
+            return self._count(read(unit))
+
+    def _count(self, result):
+        """Count a read as a hit or a miss; called with the lock held."""
+        if result is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return result
+
+    def _load(self, key):
+        """
+        Load the recent samples and latest value of a device or symbol.
+
+        Returns:
+            Dict of series name -> Series, or None if nothing is stored for it
+        """
+        kind, unit_key = key
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=self.window_seconds)
+        cutoff_epoch = to_epoch(cutoff)
+        session = get_session_factory(self.db_path)()
+        try:
+            if kind == SYSTEM:
+                latest = session.query(
+                    MetricType.name, LatestMetric.metric_value, LatestMetric.timestamp
+                ).join(
+                    MetricType, LatestMetric.metric_type_id == MetricType.id
+                ).filter(LatestMetric.device_id == unit_key).all()
+                recent = session.query(
+                    MetricType.name, SystemMetric.id, SystemMetric.timestamp, SystemMetric.metric_value
+                ).join(
+                    MetricType, SystemMetric.metric_type_id == MetricType.id
+                ).filter(
+                    SystemMetric.device_id == unit_key,
+                    SystemMetric.timestamp >= cutoff
+                ).order_by(SystemMetric.timestamp.asc(), SystemMetric.id.asc()).all()
+                older = session.query(
+                    MetricType.name, func.max(SystemMetric.id)
+                ).join(
+                    MetricType, SystemMetric.metric_type_id == MetricType.id
+                ).filter(
+                    SystemMetric.device_id == unit_key,
+                    SystemMetric.timestamp < cutoff
+                ).group_by(MetricType.name).all()
+            else:
+                latest = session.query(
+                    StockSymbol.symbol, LatestStockPrice.price, LatestStockPrice.timestamp
+                ).join(
+                    StockSymbol, LatestStockPrice.symbol_id == StockSymbol.id
+                ).filter(StockSymbol.symbol == unit_key).all()
+                recent = session.query(
+                    StockSymbol.symbol, StockData.id, StockData.timestamp, StockData.price
+                ).join(
+                    StockSymbol, StockData.symbol_id == StockSymbol.id
+                ).filter(
+                    StockSymbol.symbol == unit_key,
+                    StockData.timestamp >= cutoff
+                ).order_by(StockData.timestamp.asc(), StockData.id.asc()).all()
+                older = session.query(
+                    StockSymbol.symbol, func.max(StockData.id)
+                ).join(
+                    StockSymbol, StockData.symbol_id == StockSymbol.id
+                ).filter(
+                    StockSymbol.symbol == unit_key,
+                    StockData.timestamp < cutoff
+                ).group_by(StockSymbol.symbol).all()
+        finally:
+            session.close()
+
+        if not latest and not recent:
+            return None
+
+        older = dict(older)
+        unit = {name: Series() for name in older}
+        for name, value, timestamp in latest:
+            series = unit.setdefault(name, Series())
+            series.latest_epoch = to_epoch(timestamp)
+            series.latest_value = value
+        for name, row_id, timestamp, value in recent:
+            # append keeps latest_* from the latest-value table if it holds a newer out-of-order sample
+            unit.setdefault(name, Series()).append(row_id, to_epoch(timestamp), value)
+        for name, series in unit.items():
+            if name in older:
+                series.complete_since = cutoff_epoch
+                series.floor_id = older[name]
+            series.trim(self.max_points_per_series, self.window_seconds, force=True)
+        return unit
+
+    def _merge(self, unit, recorded):
+        """
+        Add the rows recorded while a unit was loading that the load did not see.
+
+        Returns:
+            False if one of them is out of order, leaving the unit to be loaded again later
+        """
+        loaded = {name: set(series.ids) for name, series in unit.items()}
+        for name, row_id, timestamp, value in sorted(recorded, key=lambda row: row[1]):
+            if row_id in loaded.get(name, ()):
+                continue
+            series = unit.setdefault(name, Series())
+            if not series.append(row_id, to_epoch(timestamp), value):
+                self._invalidations += 1
+                return False
+        for series in unit.values():
+            series.trim(self.max_points_per_series, self.window_seconds, force=True)
+        return True
+
+    def _install(self, key, unit):
+        """Add a loaded unit, evicting the least recently read ones beyond max_series."""
+        self._drop(key)
+        self._units[key] = unit
+        self._series_count += len(unit)
+        self._evict()
+
+    def _drop(self, key):
+        """Remove a unit if present."""
+        unit = self._units.pop(key, None)
+        if unit is not None:
+            self._series_count -= len(unit)
+
+    def _evict(self):
+        """Evict least recently read units until at most max_series series are held."""
+        while self._series_count > self.max_series and len(self._units) > 1:
+            _, unit = self._units.popitem(last=False)
+            self._series_count -= len(unit)
+            self._evictions += 1
+
+    def _record(self, rows):
+        """Append (unit key, series name, row id, timestamp, value) rows to units in memory."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if not self._units and not self._pending:
+                return
+            for key, name, row_id, timestamp, value in rows:
+                unit = self._units.get(key)
+                if unit is None:
+                    if self._pending.get(key) is not None:
+                        self._pending[key].append((name, row_id, timestamp, value))
+                    continue
+                series = unit.get(name)
+                if series is None:
+                    # First sample of a new metric for a device that is already held
+                    series = unit[name] = Series()
+                    self._series_count += 1
+                if not series.append(row_id, to_epoch(timestamp), value):
+                    logging.debug(f"Out-of-order sample for {key} {name}, dropping it from the hot tier")
+                    self._drop(key)
+                    self._invalidations += 1
+                    continue
+                series.trim(self.max_points_per_series, self.window_seconds)
+            self._evict()
+
+
+# One hot tier per database path, shared process-wide
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+def get_hot_tier(db_path):
+    """Return the shared hot tier for db_path, created with HOT_TIER_OPTIONS."""
+    tier = _tiers.get(db_path)
+    if tier is None:
+        with _tiers_lock:
+            tier = _tiers.get(db_path)
+            if tier is None:
+                tier = _tiers[db_path] = HotTier(
+                    db_path,
+                    window_hours=HOT_TIER_OPTIONS["window_hours"],
+                    max_points_per_series=HOT_TIER_OPTIONS["max_points_per_series"],
+                    max_series=HOT_TIER_OPTIONS["max_series"],
+                    enabled=HOT_TIER_OPTIONS["enabled"]
+                )
+    return tier
@@ -0,0 +1,531 @@
+"""
+Ingestion Service
+
+Writes incoming samples to the database. Devices, metric types and stock
+symbols are resolved once per request, rows go in with a single executemany
+INSERT per table, the latest-value and rollup tables are upserted alongside,
+and the whole request is committed in one transaction. Committed rows are
+then appended to the in-memory hot tier.
+
+Samples are plain dicts, either a system sample:
+    {"type": "system", "mac_address": str, "device_id": str, "hostname": str,
+     "metrics": {name: value}, "timestamp": ISO-8601 string or epoch seconds}
+or a stock sample:
+    {"type": "stock", "symbol": str, "price": float, "timestamp": ...}
+"timestamp" is optional and defaults to the time of ingestion.
+
+A stock sample within stock_dedup_seconds of a price already stored (or
+accepted earlier in the same batch) for its symbol is dropped as a duplicate,
+so agents watching the same symbols don't store the same quote repeatedly.
+"""
+import logging
+import datetime
+from sqlalchemy import insert, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .schema import (
+    get_session_factory, Device, MetricType, SystemMetric, StockSymbol, StockData,
+    LatestMetric, LatestStockPrice, get_or_create_device
+)
+from .device_cache import get_device_cache
+from .last_seen import get_last_seen_tracker
+from .query_cache import get_query_cache, key_tag, SYSTEM_METRICS, STOCK_DATA, STOCK_SYMBOLS, DEVICES
+from .events import get_event_broker
+from .hot_tier import get_hot_tier
+from .rollups import upsert_rollups
+
+SAMPLE_TYPES = ("system", "stock")
+
+INGESTION_OPTIONS = {
+    "stock_dedup_seconds": 0  # 0 disables stock de-duplication
+}
+
+# Share of the stock interval used as the de-duplication window, leaving room for timestamp jitter
+STOCK_DEDUP_TOLERANCE = 0.9
+
+
+def configure_ingestion(options):
+    """Override INGESTION_OPTIONS (e.g. stock_dedup_seconds from config.json's stock_interval)."""
+    if options:
+        INGESTION_OPTIONS.update(options)
+
+
+def parse_timestamp(value, default):
+    """
+    Convert an ISO-8601 string or epoch seconds into a naive local datetime.
+
+    Datetimes pass through unchanged, so normalised samples can be re-validated.
+
+    Returns:
+        datetime, the default if value is None, or None if value is invalid
+    """
+    if value is None:
+        return default
+    if isinstance(value, datetime.datetime):
+        return value
+    try:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.datetime.fromtimestamp(value)
+        if isinstance(value, str):
+            timestamp = datetime.datetime.fromisoformat(value)
+            # Stored timestamps are naive local time, like datetime.now()
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone().replace(tzinfo=None)
+            return timestamp
+    except (ValueError, OverflowError, OSError):
+        pass
+    return None
+
+def validate_sample(sample, now, allowed_metrics=None):
+    """
+    Validate and normalise a single sample without touching the database.
+
+    Returns:
+        Tuple (normalised sample dict, None) or (None, error message)
+    """
+    if not isinstance(sample, dict):
+        return None, "Sample must be an object"
+
+    sample_type = sample.get("type")
+    if sample_type is None:
+        sample_type = "system" if "metrics" in sample else "stock" if "symbol" in sample else None
+    if sample_type not in SAMPLE_TYPES:
+        return None, f"Sample type must be one of {', '.join(SAMPLE_TYPES)}"
+
+    timestamp = parse_timestamp(sample.get("timestamp"), now)
+    if timestamp is None:
+        return None, "Invalid timestamp"
+
+    if sample_type == "system":
+        mac_address = sample.get("mac_address")
+        device_id = sample.get("device_id")
+        if not mac_address and not device_id:
+            return None, "Either mac_address or device_id is required"
+
+        metrics = sample.get("metrics")
+        if not isinstance(metrics, dict):
+            return None, "Metrics must be an object"
+
+        # Keep only configured metrics with a numeric value
+        values = {}
+        for metric_name, metric_value in metrics.items():
+            if allowed_metrics is not None and metric_name not in allowed_metrics:
+                continue
+            try:
+                values[metric_name] = float(metric_value)
+            except (ValueError, TypeError):
+                logging.warning(f"Skipping non-numeric value for {metric_name}: {metric_value!r}")
+
+        return {
+            "type": "system",
+            "mac_address": mac_address,
+            "device_id": device_id,
+            "hostname": sample.get("hostname"),
+            "metrics": values,
+            "timestamp": timestamp
+        }, None
+
+    symbol = sample.get("symbol")
+    if not isinstance(symbol, str) or not symbol.strip():
+        return None, "Symbol is required"
+    try:
+        price = float(sample.get("price"))
+    except (ValueError, TypeError):
+        return None, "Price must be a valid number"
+    if price <= 0:
+        return None, "Price must be a positive number"
+
+    return {
+        "type": "stock",
+        "symbol": symbol.upper().strip(),
+        "price": price,
+        "timestamp": timestamp
+    }, None
+
+def resolve_devices(session, samples, cache=None):
+    """
+    Resolve the devices.id of each normalised system sample.
+
+    Known devices are answered from the identity cache; the rest are looked up
+    with one SELECT, and unknown devices are created when a MAC address was
+    supplied. Created devices are only flushed, so they are committed (or
+    rolled back) with the caller's transaction, and are added to the cache by
+    cache_created_devices once that commit succeeded.
+
+    Returns:
+        List with the devices.id (or None) for each sample, in order
+    """
+    device_pks = [None] * len(samples)
+    misses = []
+    for position, sample in enumerate(samples):
+        pk = cache.lookup(sample["mac_address"], sample["device_id"]) if cache else None
+        if pk is None:
+            misses.append(position)
+        else:
+            device_pks[position] = pk
+
+    if not misses:
+        return device_pks
+
+    mac_addresses = {samples[p]["mac_address"] for p in misses if samples[p]["mac_address"]}
+    device_ids = {samples[p]["device_id"] for p in misses if samples[p]["device_id"]}
+
+    by_mac = {}
+    by_device_id = {}
+    for device in session.query(Device).filter(or_(
+        Device.mac_address.in_(mac_addresses),
+        Device.device_id.in_(device_ids)
+    )):
+        by_mac[device.mac_address] = device
+        by_device_id[device.device_id] = device
+
+    for position in misses:
+        sample = samples[position]
+        mac_address = sample["mac_address"]
+        device = by_mac.get(mac_address) if mac_address else None
+        if not device and sample["device_id"]:
+            device = by_device_id.get(sample["device_id"])
+
+        # If still not found but we have MAC, create a new device
+        if not device and mac_address:
+            logging.warning(f"Creating new device for MAC: {mac_address}")
+            device = get_or_create_device(session, device_id=None, mac_address=mac_address, hostname=sample["hostname"])
+            session.info.setdefault("changed_tags", set()).add(DEVICES)
+            session.info.setdefault("created_devices", []).append((device.id, device.mac_address, device.device_id))
+            by_mac[device.mac_address] = device
+            by_device_id[device.device_id] = device
+            device_pks[position] = device.id
+            continue
+
+        if device:
+            device_pks[position] = device.id
+            if cache:
+                cache.store(device.id, mac_address=device.mac_address, device_id=device.device_id)
+
+    return device_pks
+
+def cache_created_devices(session, cache):
+    """Add the devices created by resolve_devices to the identity cache, after the session committed."""
+    for pk, mac_address, device_id in session.info.pop("created_devices", []):
+        cache.store(pk, mac_address=mac_address, device_id=device_id)
+
+def resolve_device_pk(db_path, device_id=None, mac_address=None, hostname=None):
+    """
+    Resolve (or create, when a MAC address is given) a single device.
+
+    Returns:
+        devices.id or None if the device can't be found or created
+    """
+    cache = get_device_cache(db_path)
+    pk = cache.lookup(mac_address, device_id)
+    if pk is not None:
+        return pk
+
+    session = get_session_factory(db_path)()
+    try:
+        sample = {"mac_address": mac_address, "device_id": device_id, "hostname": hostname}
+        pk = resolve_devices(session, [sample], cache)[0]
+        session.commit()
+        cache_created_devices(session, cache)
+        if session.info.pop("changed_tags", None):
+            get_query_cache(db_path).invalidate(DEVICES)
+            get_event_broker(db_path).publish([DEVICES])
+        return pk
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def resolve_metric_types(session, metric_names):
+    """
+    Map metric names to metric_types ids with a single SELECT, creating any missing types.
+
+    Returns:
+        Dict of metric name -> metric type id
+    """
+    names = set(metric_names)
+    if not names:
+        return {}
+
+    metric_type_ids = {
+        name: type_id
+        for type_id, name in session.query(MetricType.id, MetricType.name).filter(MetricType.name.in_(names))
+    }
+
+    missing = names - set(metric_type_ids)
+    if missing:
+        new_types = [MetricType(name=name) for name in missing]
+        session.add_all(new_types)
+        session.flush()  # Flush to generate the IDs
+        metric_type_ids.update({metric_type.name: metric_type.id for metric_type in new_types})
+
+    return metric_type_ids
+
+def resolve_stock_symbols(session, symbols):
+    """
+    Map stock symbols to stock_symbols ids with a single SELECT, creating any missing symbols.
+
+    Returns:
+        Dict of symbol -> stock symbol id
+    """
+    symbols = set(symbols)
+    if not symbols:
+        return {}
+
+    symbol_ids = {
+        symbol: symbol_id
+        for symbol_id, symbol in session.query(StockSymbol.id, StockSymbol.symbol).filter(StockSymbol.symbol.in_(symbols))
+    }
+
+    missing = symbols - set(symbol_ids)
+    if missing:
+        new_symbols = [StockSymbol(symbol=symbol) for symbol in missing]
+        session.add_all(new_symbols)
+        session.flush()  # Flush to generate the IDs
+        symbol_ids.update({stock_symbol.symbol: stock_symbol.id for stock_symbol in new_symbols})
+        session.info.setdefault("changed_tags", set()).add(STOCK_SYMBOLS)
+        logging.info(f"Added new stock symbols: {sorted(missing)}")
+
+    return symbol_ids
+
+def latest_stock_timestamps(session, symbol_ids):
+    """
+    Look up the timestamp of the latest stored price of each symbol with one SELECT.
+
+    Returns:
+        Dict of stock symbol id -> list holding that timestamp
+    """
+    return {
+        symbol_id: [timestamp]
+        for symbol_id, timestamp in session.query(LatestStockPrice.symbol_id, LatestStockPrice.timestamp)
+        .filter(LatestStockPrice.symbol_id.in_(set(symbol_ids)))
+    }
+
+def _is_duplicate(timestamp, known_timestamps, window_seconds):
+    """Whether timestamp is within window_seconds of any known timestamp."""
+    return any(abs((timestamp - known).total_seconds()) < window_seconds for known in known_timestamps)
+
+def _newest_per_key(rows, key_columns):
+    """Keep only the newest row (by timestamp) for each key."""
+    newest = {}
+    for row in rows:
+        key = tuple(row[column] for column in key_columns)
+        current = newest.get(key)
+        if current is None or row["timestamp"] >= current["timestamp"]:
+            newest[key] = row
+    return list(newest.values())
+
+def upsert_latest_metrics(session, metric_rows):
+    """Upsert latest_metrics with the newest value per (device, metric type), ignoring older samples."""
+    rows = _newest_per_key(metric_rows, ("device_id", "metric_type_id"))
+    table = LatestMetric.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.device_id, table.c.metric_type_id],
+        set_={"metric_value": statement.excluded.metric_value, "timestamp": statement.excluded.timestamp},
+        where=statement.excluded.timestamp >= table.c.timestamp
+    )
+    session.execute(statement, rows)
+
+def upsert_latest_stock_prices(session, stock_rows):
+    """Upsert latest_stock_prices with the newest price per symbol, ignoring older samples."""
+    rows = _newest_per_key(stock_rows, ("symbol_id",))
+    table = LatestStockPrice.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.symbol_id],
+        set_={"price": statement.excluded.price, "timestamp": statement.excluded.timestamp},
+        where=statement.excluded.timestamp >= table.c.timestamp
+    )
+    session.execute(statement, rows)
+
+def ingest_batch(db_path, samples, allowed_metrics=None):
+    """
+    Validate and store a batch of system and stock samples in one transaction.
+
+    Args:
+        db_path: Path to the SQLite database
+        samples: List of sample dicts (see module docstring)
+        allowed_metrics: Optional list of metric names to accept; others are ignored
+
+    Returns:
+        List with one result dict per sample, in order:
+        {"index": i, "status": "stored", "stored": row count},
+        {"index": i, "status": "duplicate"} (stock price already stored within the de-duplication window) or
+        {"index": i, "status": "rejected", "error": message}
+    """
+    now = datetime.datetime.now()
+    results = [None] * len(samples)
+    system_samples = []
+    stock_samples = []
+
+    # Validate everything before opening a session
+    for index, sample in enumerate(samples):
+        normalised, error = validate_sample(sample, now, allowed_metrics)
+        if error:
+            results[index] = {"index": index, "status": "rejected", "error": error}
+        elif normalised["type"] == "system":
+            system_samples.append((index, normalised))
+        else:
+            stock_samples.append((index, normalised))
+
+    if not system_samples and not stock_samples:
+        return results
+
+    session = get_session_factory(db_path)()
+    try:
+        metric_rows = []
+        stock_rows = []
+
+        device_cache = get_device_cache(db_path)
+        if system_samples:
+            device_pks = resolve_devices(
+                session,
+                [sample for _, sample in system_samples],
+                device_cache
+            )
+            metric_type_ids = resolve_metric_types(
+                session,
+                {name for _, sample in system_samples for name in sample["metrics"]}
+            )
+
+            touched_devices = set()
+            for (index, sample), device_pk in zip(system_samples, device_pks):
+                if device_pk is None:
+                    results[index] = {
+                        "index": index,
+                        "status": "rejected",
+                        "error": "Device not found and insufficient information to create one"
+                    }
+                    continue
+
+                for metric_name, metric_value in sample["metrics"].items():
+                    metric_rows.append({
+                        "metric_type_id": metric_type_ids[metric_name],
+                        "device_id": device_pk,
+                        "metric_value": metric_value,
+                        "timestamp": sample["timestamp"]
+                    })
+                results[index] = {"index": index, "status": "stored", "stored": len(sample["metrics"])}
+                touched_devices.add(device_pk)
+
+        if stock_samples:
+            symbol_ids = resolve_stock_symbols(session, {sample["symbol"] for _, sample in stock_samples})
+            dedup_window = INGESTION_OPTIONS["stock_dedup_seconds"]
+            known_timestamps = latest_stock_timestamps(session, symbol_ids.values()) if dedup_window else {}
+            for index, sample in stock_samples:
+                if dedup_window:
+                    symbol_timestamps = known_timestamps.setdefault(symbol_ids[sample["symbol"]], [])
+                    if _is_duplicate(sample["timestamp"], symbol_timestamps, dedup_window):
+                        results[index] = {"index": index, "status": "duplicate"}
+                        continue
+                    symbol_timestamps.append(sample["timestamp"])
+                stock_rows.append({
+                    "symbol_id": symbol_ids[sample["symbol"]],
+                    "price": sample["price"],
+                    "timestamp": sample["timestamp"]
+                })
+                results[index] = {"index": index, "status": "stored", "stored": 1}
+
+        # The hot tier needs the new row ids, returned in parameter order by one multi-row INSERT
+        hot_tier = get_hot_tier(db_path)
+        metric_ids = stock_ids = None
+        if metric_rows:
+            if hot_tier.enabled:
+                metric_ids = session.execute(
+                    insert(SystemMetric).returning(SystemMetric.id, sort_by_parameter_order=True),
+                    metric_rows
+                ).scalars().all()
+            else:
+                session.execute(insert(SystemMetric), metric_rows)
+            upsert_latest_metrics(session, metric_rows)
+            upsert_rollups(session, metric_rows, "system")
+        if stock_rows:
+            if hot_tier.enabled:
+                stock_ids = session.execute(
+                    insert(StockData).returning(StockData.id, sort_by_parameter_order=True),
+                    stock_rows
+                ).scalars().all()
+            else:
+                session.execute(insert(StockData), stock_rows)
+            upsert_latest_stock_prices(session, stock_rows)
+            upsert_rollups(session, stock_rows, "stock")
+
+        if hot_tier.enabled:
+            # Commit and append under one lock so the hot tier sees rows in id order
+            with hot_tier.ingest_lock:
+                session.commit()
+                if metric_ids:
+                    metric_names = {type_id: name for name, type_id in metric_type_ids.items()}
+                    hot_tier.record_metrics(
+                        (row["device_id"], metric_names[row["metric_type_id"]], row_id, row["timestamp"], row["metric_value"])
+                        for row, row_id in zip(metric_rows, metric_ids)
+                    )
+                if stock_ids:
+                    symbols = {symbol_id: symbol for symbol, symbol_id in symbol_ids.items()}
+                    hot_tier.record_stock(
+                        (symbols[row["symbol_id"]], row_id, row["timestamp"], row["price"])
+                        for row, row_id in zip(stock_rows, stock_ids)
+                    )
+        else:
+            session.commit()
+        cache_created_devices(session, device_cache)
+
+        # Drop cached dashboard queries that read the devices and symbols just written
+        query_cache = get_query_cache(db_path)
+        changed_tags = session.info.pop("changed_tags", set())
+        if changed_tags:
+            query_cache.invalidate(*changed_tags)
+        if metric_rows:
+            written_devices = {row["device_id"] for row in metric_rows}
+            query_cache.invalidate_keys(SYSTEM_METRICS, written_devices)
+            changed_tags.update(key_tag(SYSTEM_METRICS, pk) for pk in written_devices)
+        if stock_rows:
+            written_symbols = {
+                sample["symbol"] for index, sample in stock_samples if results[index]["status"] == "stored"
+            }
+            query_cache.invalidate_keys(STOCK_DATA, written_symbols)
+            changed_tags.update(key_tag(STOCK_DATA, symbol) for symbol in written_symbols)
+        if changed_tags:
+            # Tell connected dashboards which devices and symbols changed
+            get_event_broker(db_path).publish(changed_tags)
+
+        # last_seen is kept in memory and written back periodically in one batched UPDATE
+        if system_samples and touched_devices:
+            get_last_seen_tracker(db_path).touch(touched_devices, now)
+
+        logging.debug(f"Ingested {len(metric_rows)} system metrics and {len(stock_rows)} stock prices")
+        return results
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def ingest_system_metrics(db_path, metrics, device_id=None, mac_address=None, hostname=None, allowed_metrics=None):
+    """
+    Store one device's metrics in a single transaction.
+
+    Args:
+        db_path: Path to the SQLite database
+        metrics: Dict of metric name -> value
+        device_id: Device identifier (used if the MAC address is unknown)
+        mac_address: Device MAC address (preferred identifier)
+        hostname: Hostname used if a new device has to be created
+        allowed_metrics: Optional list of metric names to accept; others are ignored
+
+    Returns:
+        Dict with "success" and either "stored" (row count) or "error"
+    """
+    sample = {
+        "type": "system",
+        "device_id": device_id,
+        "mac_address": mac_address,
+        "hostname": hostname,
+        "metrics": metrics
+    }
+    result = ingest_batch(db_path, [sample], allowed_metrics)[0]
+
+    if result["status"] != "stored":
+        return {"success": False, "error": result["error"]}
+    return {"success": True, "stored": result["stored"]}
@@ -0,0 +1,136 @@
+"""
+Last-Seen Tracker
+
+Keeps each device's last_seen timestamp in memory and writes the changed
+ones back periodically as a single executemany UPDATE, instead of issuing an
+UPDATE on the devices table for every metrics request. Readers that need a
+fresh value overlay the in-memory timestamp on the stored one.
+"""
+import logging
+import threading
+from sqlalchemy import update
+from .schema import get_session_factory, Device
+
+
+class LastSeenTracker:
+    def __init__(self, db_path, flush_interval=15):
+        """
+        Initialize the tracker.
+
+        Args:
+            db_path: Path to the SQLite database
+            flush_interval: Seconds between writes of pending timestamps
+        """
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+
+        self._latest = {}   # devices.id -> most recent last_seen known in memory
+        self._pending = {}  # devices.id -> last_seen not yet written to the database
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._flushes = 0
+        self._rows_written = 0
+
+    def touch(self, device_pks, timestamp):
+        """Record that the given devices were seen at timestamp."""
+        with self._lock:
+            for pk in device_pks:
+                current = self._latest.get(pk)
+                if current is None or timestamp > current:
+                    self._latest[pk] = timestamp
+                    self._pending[pk] = timestamp
+        self.start()
+
+    def get(self, pk, stored=None):
+        """
+        Return the freshest last_seen for a device.
+
+        Args:
+            pk: devices.id
+            stored: last_seen value read from the database, if any
+        """
+        with self._lock:
+            in_memory = self._latest.get(pk)
+        if in_memory is None or (stored is not None and stored > in_memory):
+            return stored
+        return in_memory
+
+    def start(self):
+        """Start the background flusher if it isn't running yet."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="LastSeenFlusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write any pending timestamps."""
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            thread.join(self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        """Write all pending timestamps with one executemany UPDATE by primary key."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        session = get_session_factory(self.db_path)()
+        try:
+            session.execute(
+                update(Device),
+                [{"id": pk, "last_seen": timestamp} for pk, timestamp in pending.items()]
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logging.error(f"Error writing last_seen for {len(pending)} devices: {e}")
+            # Put the timestamps back unless newer ones arrived meanwhile
+            with self._lock:
+                for pk, timestamp in pending.items():
+                    self._pending.setdefault(pk, timestamp)
+            return 0
+        finally:
+            session.close()
+
+        with self._lock:
+            self._flushes += 1
+            self._rows_written += len(pending)
+        return len(pending)
+
+    def get_stats(self):
+        """Return the number of pending timestamps and flush counters."""
+        with self._lock:
+            return {
+                "tracked_devices": len(self._latest),
+                "pending": len(self._pending),
+                "flushes": self._flushes,
+                "rows_written": self._rows_written,
+                "flush_interval": self.flush_interval
+            }
+
+    def _run(self):
+        """Flusher loop."""
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+
+
+# One tracker per database path, shared process-wide
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+def get_last_seen_tracker(db_path):
+    """Return the shared last_seen tracker for db_path."""
+    tracker = _trackers.get(db_path)
+    if tracker is None:
+        with _trackers_lock:
+            tracker = _trackers.setdefault(db_path, LastSeenTracker(db_path))
+    return tracker
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Migration script to add composite indexes for the time-series query paths:
+(device_id, metric_type_id, timestamp) on system_metrics and
+(symbol_id, timestamp) on stock_data. Safe to run repeatedly.
+"""
+
+import os
+import sys
+import logging
+import json
+from pathlib import Path
+from sqlalchemy import create_engine, text
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Get the project root directory
+PROJECT_ROOT = Path(__file__).parent.parent.resolve()
+
+# Load configuration
+config_path = PROJECT_ROOT / 'config' / 'config.json'
+with open(config_path) as config_file:
+    config = json.load(config_file)
+
+# Update database path to be absolute
+if not os.path.isabs(config['database_path']):
+    DATABASE_PATH = os.path.join(str(PROJECT_ROOT), config['database_path'])
+else:
+    DATABASE_PATH = config['database_path']
+
+# Create database engine
+engine = create_engine(f'sqlite:///{DATABASE_PATH}')
+
+# Index name -> (table, columns); must match the Index definitions in database/schema.py
+INDEXES = {
+    'ix_system_metrics_device_type_ts': ('system_metrics', ('device_id', 'metric_type_id', 'timestamp')),
+    'ix_stock_data_symbol_ts': ('stock_data', ('symbol_id', 'timestamp')),
+}
+
+# Representative queries from database/models.py and the index each one should use
+QUERY_PLANS = {
+    'ix_system_metrics_device_type_ts': """
+        SELECT metric_types.name, system_metrics.metric_value, system_metrics.timestamp
+        FROM system_metrics
+        JOIN metric_types ON system_metrics.metric_type_id = metric_types.id
+        JOIN devices ON system_metrics.device_id = devices.id
+        WHERE metric_types.name = 'cpu_usage' AND devices.device_id = 'example'
+        ORDER BY system_metrics.timestamp ASC
+    """,
+    'ix_stock_data_symbol_ts': """
+        SELECT stock_symbols.symbol, stock_data.price, stock_data.timestamp
+        FROM stock_data
+        JOIN stock_symbols ON stock_symbols.id = stock_data.symbol_id
+        WHERE stock_symbols.symbol = 'AAPL'
+        ORDER BY stock_data.timestamp DESC
+        LIMIT 1
+    """,
+}
+
+def check_index_exists(index_name):
+    """Check if an index exists in the database"""
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index' AND name = :name"),
+                {"name": index_name}
+            )
+            return result.first() is not None
+    except Exception as e:
+        logger.error(f"Error checking if index exists: {e}")
+        return False
+
+def create_indexes():
+    """Create any missing composite indexes"""
+    try:
+        created = False
+        for index_name, (table_name, columns) in INDEXES.items():
+            if check_index_exists(index_name):
+                logger.info(f"Index {index_name} already exists, skipping creation")
+                continue
+
+            logger.info(f"Creating index {index_name} on {table_name} ({', '.join(columns)}), this may take a while on large tables")
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(columns)})"
+                ))
+            logger.info(f"Created index {index_name}")
+            created = True
+
+        # Refresh planner statistics so the new indexes are chosen
+        if created:
+            with engine.begin() as conn:
+                conn.execute(text("ANALYZE"))
+            logger.info("Updated query planner statistics")
+        return True
+    except Exception as e:
+        logger.error(f"Error creating indexes: {e}")
+        return False
+
+def verify_query_plans():
+    """Check with EXPLAIN QUERY PLAN that the history and latest-value queries use the new indexes"""
+    all_used = True
+    try:
+        with engine.connect() as conn:
+            for index_name, query in QUERY_PLANS.items():
+                plan = [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {query}"))]
+                logger.info(f"Query plan for {index_name}: {' | '.join(plan)}")
+                if not any(index_name in step for step in plan):
+                    logger.warning(f"Query is not using index {index_name}")
+                    all_used = False
+        return all_used
+    except Exception as e:
+        logger.error(f"Error checking query plans: {e}")
+        return False
+
+def main():
+    """Run the migration"""
+    logger.info(f"Starting migration for database at {DATABASE_PATH}")
+
+    # Create the composite indexes
+    if not create_indexes():
+        logger.error("Failed to create time-series indexes, aborting")
+        return False
+
+    # Confirm the query planner picks them up
+    if not verify_query_plans():
+        logger.error("Time-series queries are not using the new indexes")
+        return False
+
+    logger.info("Migration completed successfully")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
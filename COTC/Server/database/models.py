@@ -1,9 +1,36 @@
 import logging
 import datetime
-from sqlalchemy import desc, func, create_engine, inspect
+from sqlalchemy import and_, func, or_
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import sessionmaker
-from .schema import get_session, init_db, SystemMetric, StockData, MetricType, StockSymbol, Device, get_or_create_device
+from .schema import (
+    get_session_factory, init_db, SystemMetric, StockData, MetricType, StockSymbol, Device,
+    LatestMetric, LatestStockPrice, SystemMetricRollup, StockDataRollup
+)
+from .ingestion import ingest_batch
+from .query_cache import cached_query, SYSTEM_METRICS, STOCK_DATA, STOCK_SYMBOLS, DEVICES
+from .hot_tier import get_hot_tier
+from .device_cache import get_device_cache
+from .rollups import RESOLUTIONS, SERIES, bucket_floor, choose_resolution
+
+# History reads pick the coarsest rollup resolution that still gives at least this many points
+DEFAULT_MIN_POINTS = 200
+
+# Overridable through the "history" section of config.json; "retention" is the
+# retention policy's "tables" section, so ranges it has pruned read the rollups
+HISTORY_OPTIONS = {
+    "min_points": DEFAULT_MIN_POINTS,
+    "retention": {}
+}
+
+# Resolution argument asking for the resolution to be chosen from the range
+AUTO_RESOLUTION = "auto"
+
+# Default number of rows per page for the paginated history functions
+DEFAULT_PAGE_SIZE = 1000
+
+# Columnar history: timestamps are formatted in SQL, epochs derived from the Julian day
+HISTORY_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
 
 
 # Set logging level to WARNING to reduce terminal clutter
@@ -11,114 +38,90 @@ logging.basicConfig(level=logging.WARNING)
 
 def init_database(db_path):
     """Initialize the database with required tables"""
-    engine = create_engine(f'sqlite:///{db_path}')
     init_db(db_path)
     logging.debug(f"Database initialized at {db_path}")
     
 def get_session(db_path):
-    """Create and return a session for the database"""
-    engine = create_engine(f'sqlite:///{db_path}')
-    Session = sessionmaker(bind=engine)
-    return Session()
+    """Create and return a session from the shared, pooled session factory"""
+    return get_session_factory(db_path)()
+
+def _device_scope(db_path, arguments):
+    """Scope a cached query to the one device it reads, if its devices.id is known (see cached_query)."""
+    device_id = arguments.get("device_id")
+    if not device_id or device_id == 'all':
+        return {}
+    return {SYSTEM_METRICS: get_device_cache(db_path).lookup(device_id=device_id)}
+
+def _symbol_scope(db_path, arguments):
+    """Scope a cached query to the one symbol it reads (see cached_query)."""
+    return {STOCK_DATA: arguments.get("symbol")}
 
 def insert_system_metric(db_path, metric_name, metric_value, device_id=None, mac_address=None):
     """Insert a system metric record into the database."""
-    session = get_session(db_path)
+    # We need at least device_id OR mac_address
+    if not device_id and not mac_address:
+        logging.error("Neither device_id nor mac_address provided for system metric")
+        return False
+    
     try:
-        # We need at least device_id OR mac_address
-        if not device_id and not mac_address:
-            logging.error("Neither device_id nor mac_address provided for system metric")
-            return False
-        
-        # Try to find the device first by MAC address if provided
-        device = None
-        if mac_address:
-            device = session.query(Device).filter_by(mac_address=mac_address).first()
-            
-            # If found by MAC but device_id is different, log but don't override
-            if device and device_id and device.device_id != device_id:
-                logging.warning(f"Device found by MAC {mac_address} has different device_id: {device.device_id} vs {device_id}")
+        # Go through the ingestion path so the device is resolved from the identity cache
+        result = ingest_batch(db_path, [{
+            "type": "system",
+            "device_id": device_id,
+            "mac_address": mac_address,
+            "metrics": {metric_name: metric_value}
+        }])[0]
         
-        # If not found by MAC, try to find by device_id
-        if not device and device_id:
-            device = session.query(Device).filter_by(device_id=device_id).first()
-        
-        # Only create the device if it doesn't exist
-        if not device:
-            # This should rarely happen since devices should be registered first
-            logging.warning(f"Device with ID {device_id} or MAC {mac_address} not found, creating a new one")
-            device = get_or_create_device(session, device_id, mac_address=mac_address)
-        
-        # Get or create the metric type
-        metric_type = session.query(MetricType).filter_by(name=metric_name).first()
-        if not metric_type:
-            metric_type = MetricType(name=metric_name)
-            session.add(metric_type)
-            session.flush()  # Flush to generate the ID
+        if result["status"] != "stored" or not result["stored"]:
+            logging.error(f"Error inserting system metric: {result.get('error', 'invalid metric value')}")
+            return False
         
-        # Create the system metric record
-        metric = SystemMetric(
-            metric_type_id=metric_type.id,
-            device_id=device.id,
-            metric_value=float(metric_value),
-            timestamp=datetime.datetime.now()
-        )
-        session.add(metric)
-        session.commit()
-        logging.debug(f"Inserted system metric for device {device.hostname}: {metric_name}={metric_value}")
+        logging.debug(f"Inserted system metric: {metric_name}={metric_value}")
         return True
     except Exception as e:
-        session.rollback()
         logging.error(f"Error inserting system metric: {e}")
         return False
-    finally:
-        session.close()
 
 def insert_stock_data(db_path, symbol, price):
     """Insert stock data record into the database."""
-    session = get_session(db_path)
     try:
-        # Get or create the stock symbol
-        stock_symbol = session.query(StockSymbol).filter_by(symbol=symbol).first()
-        if not stock_symbol:
-            stock_symbol = StockSymbol(symbol=symbol)
-            session.add(stock_symbol)
-            session.flush()  # Flush to generate the ID
+        # Go through the ingestion path so the symbol and latest price are maintained too
+        result = ingest_batch(db_path, [{"type": "stock", "symbol": symbol, "price": price}])[0]
+        
+        # A duplicate means the symbol already has a price for this interval
+        if result["status"] == "rejected":
+            logging.error(f"Error inserting stock data: {result['error']}")
+            return False
         
-        # Create the stock data record
-        stock_data = StockData(
-            symbol_id=stock_symbol.id,
-            price=float(price),
-            timestamp=datetime.datetime.now()
-        )
-        session.add(stock_data)
-        session.commit()
         logging.debug(f"Inserted stock data: {symbol}={price}")
         return True
     except Exception as e:
-        session.rollback()
         logging.error(f"Error inserting stock data: {e}")
         return False
-    finally:
-        session.close()
 
+@cached_query(SYSTEM_METRICS, DEVICES, scope=_device_scope)
 def fetch_latest_system_metrics(db_path=None, metric_name=None, device_id=None):
     """Fetch the latest system metrics from the database, optionally filtered by metric name and device."""
+    # A single device's latest values are usually in the hot tier
+    if device_id and device_id != 'all':
+        device_pk = get_device_cache(db_path).lookup(device_id=device_id)
+        if device_pk is not None:
+            metrics = get_hot_tier(db_path).latest_metrics(device_pk, metric_name)
+            if metrics is not None:
+                return metrics
+    
     session = get_session(db_path)
     try:
-        # Build the query
+        # Read the latest-value table: one row per (device, metric type)
         query = session.query(
             MetricType.name,
-            SystemMetric.metric_value,
-            SystemMetric.timestamp,
-            Device.device_id,
-            Device.hostname
+            LatestMetric.metric_value
         ).join(
             MetricType,
-            SystemMetric.metric_type_id == MetricType.id
+            LatestMetric.metric_type_id == MetricType.id
         ).join(
             Device,
-            SystemMetric.device_id == Device.id
+            LatestMetric.device_id == Device.id
         )
         
         # Apply device filter if provided
@@ -129,19 +132,8 @@ def fetch_latest_system_metrics(db_path=None, metric_name=None, device_id=None):
         if metric_name:
             query = query.filter(MetricType.name == metric_name)
         
-        # Order by timestamp desc to get the most recent
-        query = query.order_by(desc(SystemMetric.timestamp))
-        
-        # Get latest for each metric type (for the specified device if provided)
-        subq = query.subquery()
-        
-        results = session.query(
-            subq.c.name,
-            subq.c.metric_value,
-            subq.c.timestamp,
-            subq.c.device_id,
-            subq.c.hostname
-        ).all()
+        # Oldest first, so across several devices the most recent value wins
+        results = query.order_by(LatestMetric.timestamp.asc()).all()
         
         # Format results as a dictionary
         metrics = {}
@@ -157,18 +149,26 @@ def fetch_latest_system_metrics(db_path=None, metric_name=None, device_id=None):
     finally:
         session.close()
 
+@cached_query(STOCK_DATA, scope=_symbol_scope)
 def fetch_latest_stock_data(db_path, symbol):
     """Fetch the latest stock data for a specific symbol."""
+    latest_data = get_hot_tier(db_path).latest_stock(symbol)
+    if latest_data is not None:
+        return latest_data
+    
     session = get_session(db_path)
     try:
-        # Query with join to get the symbol name
+        # Read the single latest-price row for the symbol
         latest_data = session.query(
             StockSymbol.symbol,
-            StockData.price,
-            StockData.timestamp
-        ).join(StockSymbol).filter(
+            LatestStockPrice.price,
+            LatestStockPrice.timestamp
+        ).join(
+            StockSymbol,
+            LatestStockPrice.symbol_id == StockSymbol.id
+        ).filter(
             StockSymbol.symbol == symbol
-        ).order_by(desc(StockData.timestamp)).first()
+        ).first()
         
         if latest_data:
             return {
@@ -183,6 +183,7 @@ def fetch_latest_stock_data(db_path, symbol):
     finally:
         session.close()
 
+@cached_query(STOCK_SYMBOLS)
 def fetch_stock_symbols(db_path):
     """Fetch all distinct stock symbols from the database."""
     session = get_session(db_path)
@@ -195,27 +196,130 @@ def fetch_stock_symbols(db_path):
     finally:
         session.close()
 
-def get_stock_history(db_path, symbol):
-    """Get historical stock data for a specific symbol."""
+@cached_query(DEVICES)
+def fetch_devices(db_path):
+    """
+    Fetch every registered device.
+
+    Returns:
+        List of dictionaries with id, device_id, hostname, os_info and last_seen (as stored)
+    """
+    session = get_session(db_path)
+    try:
+        devices = session.query(
+            Device.id, Device.device_id, Device.hostname, Device.os_info, Device.last_seen
+        ).all()
+        return [
+            {
+                "id": pk,
+                "device_id": device_id,
+                "hostname": hostname,
+                "os_info": os_info,
+                "last_seen": last_seen
+            }
+            for pk, device_id, hostname, os_info, last_seen in devices
+        ]
+    except SQLAlchemyError as e:
+        logging.error(f"Database error fetching devices: {e}")
+        return []
+    finally:
+        session.close()
+
+def _apply_history_window(query, timestamp_column, id_column, since=None, until=None,
+                          after_timestamp=None, after_id=None, limit=None):
+    """
+    Restrict a history query to a time range and keyset cursor, ordered by (timestamp, id).
+
+    Args:
+        query: Query selecting raw history rows
+        timestamp_column: Timestamp column of the raw table
+        id_column: Primary key column of the raw table, used to break timestamp ties
+        since: Only rows at or after this datetime
+        until: Only rows at or before this datetime
+        after_timestamp: Cursor; only rows after this datetime
+        after_id: Cursor tiebreak; with after_timestamp, also rows at that timestamp with a larger id
+        limit: Maximum number of rows
+    """
+    if since is not None:
+        query = query.filter(timestamp_column >= since)
+    if until is not None:
+        query = query.filter(timestamp_column <= until)
+    if after_timestamp is not None:
+        if after_id is not None:
+            query = query.filter(or_(
+                timestamp_column > after_timestamp,
+                and_(timestamp_column == after_timestamp, id_column > after_id)
+            ))
+        else:
+            query = query.filter(timestamp_column > after_timestamp)
+    
+    query = query.order_by(timestamp_column.asc(), id_column.asc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def _paginate(fetch, limit):
+    """
+    Fetch one page of history plus a cursor for the next one.
+
+    Args:
+        fetch: Callable taking a row limit and returning history dicts with "id" and "timestamp"
+        limit: Page size
+
+    Returns:
+        Dictionary with "items" and "next_cursor" (None on the last page)
+    """
+    # Ask for one extra row to learn whether another page follows
+    rows = fetch(limit + 1)
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = {"after_timestamp": items[-1]["timestamp"], "after_id": items[-1]["id"]}
+    return {"items": items, "next_cursor": next_cursor}
+
+def get_stock_history(db_path, symbol, since=None, until=None, after_timestamp=None, after_id=None, limit=None):
+    """
+    Get historical stock data for a specific symbol.
+
+    Without range or cursor arguments the full history is returned.
+
+    Args:
+        db_path: Path to the SQLite database
+        symbol: Stock symbol
+        since: Only rows at or after this datetime
+        until: Only rows at or before this datetime
+        after_timestamp: Cursor; only rows after this datetime
+        after_id: Cursor tiebreak for rows sharing after_timestamp
+        limit: Maximum number of rows
+
+    Returns:
+        List of dictionaries ordered by timestamp
+    """
     session = get_session(db_path)
     try:
         # Query with join to get the symbol name
-        history_data = session.query(
+        query = session.query(
+            StockData.id,
             StockSymbol.symbol,
             StockData.price,
             StockData.timestamp
         ).join(StockSymbol).filter(
             StockSymbol.symbol == symbol
-        ).order_by(StockData.timestamp.asc()).all()
+        )
+        history_data = _apply_history_window(
+            query, StockData.timestamp, StockData.id,
+            since, until, after_timestamp, after_id, limit
+        ).all()
         
         # Format the results
         history = [
             {
+                "id": row_id,
                 "symbol": symbol,
                 "price": price,
                 "timestamp": timestamp.isoformat()
             }
-            for symbol, price, timestamp in history_data
+            for row_id, symbol, price, timestamp in history_data
         ]
         return history
     except SQLAlchemyError as e:
@@ -224,8 +328,41 @@ def get_stock_history(db_path, symbol):
     finally:
         session.close()
 
-def get_system_metrics_history(db_path, metric_name, device_id=None):
-    """Get historical metrics data for a specific metric type and device."""
+def get_stock_history_page(db_path, symbol, since=None, until=None, after_timestamp=None, after_id=None,
+                           limit=DEFAULT_PAGE_SIZE):
+    """
+    Get one keyset-paginated page of stock history.
+
+    Pass the returned next_cursor values as after_timestamp/after_id to get the following page.
+
+    Returns:
+        Dictionary with "items" and "next_cursor"
+    """
+    return _paginate(
+        lambda page_limit: get_stock_history(db_path, symbol, since, until, after_timestamp, after_id, page_limit),
+        limit
+    )
+
+def get_system_metrics_history(db_path, metric_name, device_id=None, since=None, until=None,
+                               after_timestamp=None, after_id=None, limit=None):
+    """
+    Get historical metrics data for a specific metric type and device.
+
+    Without range or cursor arguments the full history is returned.
+
+    Args:
+        db_path: Path to the SQLite database
+        metric_name: Metric type name
+        device_id: Device ID, or None/'all' for every device
+        since: Only rows at or after this datetime
+        until: Only rows at or before this datetime
+        after_timestamp: Cursor; only rows after this datetime
+        after_id: Cursor tiebreak for rows sharing after_timestamp
+        limit: Maximum number of rows
+
+    Returns:
+        List of dictionaries ordered by timestamp
+    """
     session = get_session(db_path)
     try:
         # Build the query
@@ -234,7 +371,8 @@ def get_system_metrics_history(db_path, metric_name, device_id=None):
             SystemMetric.metric_value,
             SystemMetric.timestamp,
             Device.device_id,
-            Device.hostname
+            Device.hostname,
+            SystemMetric.id
         ).join(
             MetricType,
             SystemMetric.metric_type_id == MetricType.id
@@ -249,8 +387,11 @@ def get_system_metrics_history(db_path, metric_name, device_id=None):
         if device_id and device_id != 'all':
             query = query.filter(Device.device_id == device_id)
         
-        # Order by timestamp
-        results = query.order_by(SystemMetric.timestamp.asc()).all()
+        # Order by timestamp, restricted to the requested window
+        results = _apply_history_window(
+            query, SystemMetric.timestamp, SystemMetric.id,
+            since, until, after_timestamp, after_id, limit
+        ).all()
         
         # Format the results
         history = []
@@ -259,6 +400,7 @@ def get_system_metrics_history(db_path, metric_name, device_id=None):
             timestamp_str = result[2].isoformat() if result[2] else ""
             
             history.append({
+                "id": result[5],
                 "metric_name": result[0],
                 "metric_value": result[1],
                 "timestamp": timestamp_str,
@@ -271,4 +413,687 @@ def get_system_metrics_history(db_path, metric_name, device_id=None):
         logging.error(f"Database error fetching system metrics history: {e}")
         return []
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+def get_system_metrics_history_page(db_path, metric_name, device_id=None, since=None, until=None,
+                                    after_timestamp=None, after_id=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Get one keyset-paginated page of system metrics history.
+
+    Pass the returned next_cursor values as after_timestamp/after_id to get the following page.
+
+    Returns:
+        Dictionary with "items" and "next_cursor"
+    """
+    return _paginate(
+        lambda page_limit: get_system_metrics_history(
+            db_path, metric_name, device_id, since, until, after_timestamp, after_id, page_limit
+        ),
+        limit
+    )
+
+# Rows per fetch when streaming history out of SQLite
+EXPORT_BATCH_SIZE = 1000
+
+SYSTEM_EXPORT_COLUMNS = ("id", "timestamp", "device_id", "hostname", "metric_name", "metric_value")
+STOCK_EXPORT_COLUMNS = ("id", "timestamp", "symbol", "price")
+
+def iter_system_metrics_history(db_path, metric_name=None, device_id=None, since=None, until=None,
+                                batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream system metrics history as tuples, ordered by (timestamp, id).
+
+    Rows are fetched batch_size at a time from a server-side cursor, so memory
+    use does not depend on how many rows match. The session stays open until
+    the generator is exhausted or closed.
+
+    Args:
+        db_path: Path to the SQLite database
+        metric_name: Metric type name, or None for every metric
+        device_id: Device ID, or None/'all' for every device
+        since: Only rows at or after this datetime
+        until: Only rows at or before this datetime
+        batch_size: Rows fetched per round-trip
+
+    Yields:
+        Tuples in SYSTEM_EXPORT_COLUMNS order
+    """
+    session = get_session(db_path)
+    try:
+        query = session.query(
+            SystemMetric.id,
+            SystemMetric.timestamp,
+            Device.device_id,
+            Device.hostname,
+            MetricType.name,
+            SystemMetric.metric_value
+        ).join(
+            MetricType,
+            SystemMetric.metric_type_id == MetricType.id
+        ).join(
+            Device,
+            SystemMetric.device_id == Device.id
+        )
+        
+        if metric_name:
+            query = query.filter(MetricType.name == metric_name)
+        if device_id and device_id != 'all':
+            query = query.filter(Device.device_id == device_id)
+        
+        query = _apply_history_window(query, SystemMetric.timestamp, SystemMetric.id, since, until)
+        for row in query.yield_per(batch_size):
+            yield tuple(row)
+    finally:
+        session.close()
+
+def iter_stock_history(db_path, symbol=None, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream stock price history as tuples, ordered by (timestamp, id).
+
+    Like iter_system_metrics_history, rows come from a server-side cursor in
+    batches of batch_size.
+
+    Args:
+        db_path: Path to the SQLite database
+        symbol: Stock symbol, or None for every symbol
+        since: Only rows at or after this datetime
+        until: Only rows at or before this datetime
+        batch_size: Rows fetched per round-trip
+
+    Yields:
+        Tuples in STOCK_EXPORT_COLUMNS order
+    """
+    session = get_session(db_path)
+    try:
+        query = session.query(
+            StockData.id,
+            StockData.timestamp,
+            StockSymbol.symbol,
+            StockData.price
+        ).join(StockSymbol)
+        
+        if symbol:
+            query = query.filter(StockSymbol.symbol == symbol)
+        
+        query = _apply_history_window(query, StockData.timestamp, StockData.id, since, until)
+        for row in query.yield_per(batch_size):
+            yield tuple(row)
+    finally:
+        session.close()
+
+# Rollup exports have one row per bucket, starting at timestamp
+SYSTEM_ROLLUP_EXPORT_COLUMNS = (
+    "timestamp", "device_id", "hostname", "metric_name", "resolution", "min", "max", "avg", "count", "last"
+)
+STOCK_ROLLUP_EXPORT_COLUMNS = ("timestamp", "symbol", "resolution", "min", "max", "avg", "count", "last")
+
+def iter_system_metrics_rollups(db_path, resolution, metric_name=None, device_id=None, since=None, until=None,
+                                batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream system metrics rollup buckets at one resolution as tuples, ordered by bucket start.
+
+    Streams like iter_system_metrics_history; used to export ranges whose
+    raw rows have been pruned by the retention policy.
+
+    Args:
+        db_path: Path to the SQLite database
+        resolution: Rollup resolution in seconds
+        metric_name: Metric type name, or None for every metric
+        device_id: Device ID, or None/'all' for every device
+        since: Only buckets overlapping or after this datetime
+        until: Only buckets starting at or before this datetime
+        batch_size: Rows fetched per round-trip
+
+    Yields:
+        Tuples in SYSTEM_ROLLUP_EXPORT_COLUMNS order
+    """
+    session = get_session(db_path)
+    try:
+        query = session.query(
+            SystemMetricRollup.bucket_start,
+            Device.device_id,
+            Device.hostname,
+            MetricType.name,
+            SystemMetricRollup.min_value,
+            SystemMetricRollup.max_value,
+            SystemMetricRollup.sum_value,
+            SystemMetricRollup.sample_count,
+            SystemMetricRollup.last_value
+        ).join(
+            MetricType,
+            SystemMetricRollup.metric_type_id == MetricType.id
+        ).join(
+            Device,
+            SystemMetricRollup.device_id == Device.id
+        )
+        
+        if metric_name:
+            query = query.filter(MetricType.name == metric_name)
+        if device_id and device_id != 'all':
+            query = query.filter(Device.device_id == device_id)
+        
+        query = _rollup_window(
+            query, SystemMetricRollup, since, until, resolution, tiebreak=SystemMetricRollup.device_id
+        ).order_by(SystemMetricRollup.metric_type_id)
+        for bucket_start, row_device_id, hostname, name, min_value, max_value, sum_value, count, last_value \
+                in query.yield_per(batch_size):
+            yield (bucket_start, row_device_id, hostname, name, resolution, min_value, max_value,
+                   _bucket_average(sum_value, count), count, last_value)
+    finally:
+        session.close()
+
+def iter_stock_rollups(db_path, resolution, symbol=None, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream stock price rollup buckets at one resolution as tuples, ordered by bucket start.
+
+    Args:
+        db_path: Path to the SQLite database
+        resolution: Rollup resolution in seconds
+        symbol: Stock symbol, or None for every symbol
+        since: Only buckets overlapping or after this datetime
+        until: Only buckets starting at or before this datetime
+        batch_size: Rows fetched per round-trip
+
+    Yields:
+        Tuples in STOCK_ROLLUP_EXPORT_COLUMNS order
+    """
+    session = get_session(db_path)
+    try:
+        query = session.query(
+            StockDataRollup.bucket_start,
+            StockSymbol.symbol,
+            StockDataRollup.min_value,
+            StockDataRollup.max_value,
+            StockDataRollup.sum_value,
+            StockDataRollup.sample_count,
+            StockDataRollup.last_value
+        ).join(StockSymbol)
+        
+        if symbol:
+            query = query.filter(StockSymbol.symbol == symbol)
+        
+        query = _rollup_window(query, StockDataRollup, since, until, resolution, tiebreak=StockDataRollup.symbol_id)
+        for bucket_start, row_symbol, min_value, max_value, sum_value, count, last_value in query.yield_per(batch_size):
+            yield (bucket_start, row_symbol, resolution, min_value, max_value,
+                   _bucket_average(sum_value, count), count, last_value)
+    finally:
+        session.close()
+
+def _empty_columns(names):
+    """Return an empty list for each column name"""
+    return {name: [] for name in names}
+
+def _fetch_columns(query, names):
+    """
+    Run a history query and transpose its rows into one list per column.
+
+    Returns:
+        Dictionary mapping each name to a list of column values
+    """
+    # Executed as Core, since the rows are plain values the ORM's per-row handling only slows down
+    rows = query.session.connection().execute(query.statement).all()
+    if not rows:
+        return _empty_columns(names)
+    return {name: list(column) for name, column in zip(names, zip(*rows))}
+
+def _rollup_columns(session, rollup, filters, value_key, since=None, until=None, resolution=None, tiebreak=None):
+    """
+    Read rollup buckets as parallel columns, oldest first.
+
+    Returns:
+        Dictionary with "timestamp" (bucket start), "epoch", value_key (bucket
+        average), "min" and "max" lists
+    """
+    query = session.query(
+        func.strftime(HISTORY_TIMESTAMP_FORMAT, rollup.bucket_start),
+        (func.julianday(rollup.bucket_start) - UNIX_EPOCH_JULIAN_DAY) * 86400.0,
+        rollup.sum_value / rollup.sample_count,
+        rollup.min_value,
+        rollup.max_value
+    ).filter(*filters)
+    query = _rollup_window(query, rollup, since, until, resolution, tiebreak=tiebreak)
+    return _fetch_columns(query, ("timestamp", "epoch", value_key, "min", "max"))
+
+@cached_query(STOCK_DATA, scope=_symbol_scope)
+def get_stock_history_columns(db_path, symbol, since=None, until=None, resolution=None):
+    """
+    Get a symbol's price history as parallel columns, oldest first.
+
+    Timestamps are formatted by SQLite, so no per-row Python work is needed
+    to display, sort or plot them. With a rollup resolution (see
+    get_stock_resolution) each row is one bucket: its start, average price
+    and added "min" and "max" columns.
+
+    Returns:
+        Dictionary with "timestamp" ("YYYY-MM-DD HH:MM:SS" strings), "epoch"
+        (seconds, naive timestamp read as UTC) and "price" lists
+    """
+    # Recent raw history is answered from the hot tier when it holds the whole range
+    if not resolution:
+        history = get_hot_tier(db_path).stock_columns(symbol, since, until)
+        if history is not None:
+            return history
+    
+    session = get_session(db_path)
+    try:
+        if resolution:
+            symbol_id = session.query(StockSymbol.id).filter(StockSymbol.symbol == symbol).scalar_subquery()
+            return _rollup_columns(
+                session, StockDataRollup, (StockDataRollup.symbol_id == symbol_id,), "price",
+                since, until, resolution, tiebreak=StockDataRollup.symbol_id
+            )
+        
+        query = session.query(
+            func.strftime(HISTORY_TIMESTAMP_FORMAT, StockData.timestamp),
+            (func.julianday(StockData.timestamp) - UNIX_EPOCH_JULIAN_DAY) * 86400.0,
+            StockData.price
+        ).join(StockSymbol).filter(
+            StockSymbol.symbol == symbol
+        )
+        query = _apply_history_window(query, StockData.timestamp, StockData.id, since, until)
+        return _fetch_columns(query, ("timestamp", "epoch", "price"))
+    except SQLAlchemyError as e:
+        logging.error(f"Database error fetching stock history columns: {e}")
+        return _empty_columns(("timestamp", "epoch", "price"))
+    finally:
+        session.close()
+
+@cached_query(SYSTEM_METRICS, DEVICES, scope=_device_scope)
+def get_device_metrics_history_columns(db_path, device_id, metric_names, inserted_after=None, resolution=None):
+    """
+    Get the history of several metrics for one device as parallel columns.
+
+    All metrics are read in a single scan and pivoted per metric, so panels
+    showing different metrics of the same device share one query.
+
+    Args:
+        db_path: Path to the SQLite database
+        device_id: Device ID
+        metric_names: Tuple of metric type names
+        inserted_after: Only rows with a larger id, i.e. stored after that row (for delta refreshes)
+        resolution: Optional rollup resolution (see get_system_metrics_resolution); each
+                    row is then one bucket with its average and "min"/"max" columns, and no "id"
+
+    Returns:
+        Dictionary mapping each metric name to its "id", "timestamp", "epoch"
+        and "metric_value" lists, oldest first
+    """
+    columns = ("id", "timestamp", "epoch", "metric_value")
+    if resolution:
+        columns = ("timestamp", "epoch", "metric_value", "min", "max")
+    history = {name: _empty_columns(columns) for name in metric_names}
+    if not metric_names:
+        return history
+    
+    # Delta refreshes and recent history are answered from the hot tier when it holds every requested row
+    device_pk = get_device_cache(db_path).lookup(device_id=device_id)
+    if device_pk is not None and not resolution:
+        served = get_hot_tier(db_path).metric_columns(device_pk, metric_names, inserted_after=inserted_after)
+        if served is not None:
+            return served
+    
+    session = get_session(db_path)
+    try:
+        if resolution:
+            query = session.query(
+                MetricType.name,
+                func.strftime(HISTORY_TIMESTAMP_FORMAT, SystemMetricRollup.bucket_start),
+                (func.julianday(SystemMetricRollup.bucket_start) - UNIX_EPOCH_JULIAN_DAY) * 86400.0,
+                SystemMetricRollup.sum_value / SystemMetricRollup.sample_count,
+                SystemMetricRollup.min_value,
+                SystemMetricRollup.max_value
+            ).join(
+                MetricType,
+                SystemMetricRollup.metric_type_id == MetricType.id
+            ).join(
+                Device,
+                SystemMetricRollup.device_id == Device.id
+            ).filter(
+                Device.device_id == device_id,
+                MetricType.name.in_(metric_names)
+            )
+            query = _rollup_window(query, SystemMetricRollup, None, None, resolution,
+                                   tiebreak=SystemMetricRollup.metric_type_id)
+            for name, *values in query.all():
+                for key, value in zip(columns, values):
+                    history[name][key].append(value)
+            return history
+        
+        query = session.query(
+            MetricType.name,
+            SystemMetric.id,
+            func.strftime(HISTORY_TIMESTAMP_FORMAT, SystemMetric.timestamp),
+            (func.julianday(SystemMetric.timestamp) - UNIX_EPOCH_JULIAN_DAY) * 86400.0,
+            SystemMetric.metric_value
+        ).join(
+            MetricType,
+            SystemMetric.metric_type_id == MetricType.id
+        ).join(
+            Device,
+            SystemMetric.device_id == Device.id
+        ).filter(
+            Device.device_id == device_id,
+            MetricType.name.in_(metric_names)
+        )
+        
+        if inserted_after is not None:
+            query = query.filter(SystemMetric.id > inserted_after)
+        
+        query = _apply_history_window(query, SystemMetric.timestamp, SystemMetric.id)
+        for name, row_id, timestamp, epoch, value in query.all():
+            metric = history[name]
+            metric["id"].append(row_id)
+            metric["timestamp"].append(timestamp)
+            metric["epoch"].append(epoch)
+            metric["metric_value"].append(value)
+        return history
+    except SQLAlchemyError as e:
+        logging.error(f"Database error fetching device metrics history columns: {e}")
+        return {name: _empty_columns(columns) for name in metric_names}
+    finally:
+        session.close()
+
+def get_last_system_metric_id(db_path):
+    """
+    Get the id of the newest stored system metric row.
+
+    Every row stored later has a larger id, so this is the inserted_after
+    cursor for delta refreshes following a load from the rollups.
+
+    Returns:
+        Row id, or 0 if there are no rows
+    """
+    session = get_session(db_path)
+    try:
+        return session.query(func.max(SystemMetric.id)).scalar() or 0
+    except SQLAlchemyError as e:
+        logging.error(f"Database error fetching the last system metric id: {e}")
+        return 0
+    finally:
+        session.close()
+
+def configure_history(options):
+    """Override HISTORY_OPTIONS (e.g. from the "history" section of config.json)."""
+    if options:
+        HISTORY_OPTIONS.update(options)
+
+def _finest_kept_resolution(kind, since, now):
+    """
+    Finest resolution at which the retention policy still keeps rows as old as since.
+
+    Args:
+        kind: "system" or "stock"
+        since: Start of the range, or None for the whole history
+        now: Current time
+
+    Returns:
+        None when raw rows are kept that long, otherwise a rollup resolution in seconds
+    """
+    policy = HISTORY_OPTIONS["retention"]
+    raw_days = policy.get(SERIES[kind]["raw_table"])
+    if raw_days is None or (since is not None and since >= now - datetime.timedelta(days=raw_days)):
+        return None
+    rollup_days = policy.get(SERIES[kind]["table"].name) or {}
+    for resolution in RESOLUTIONS:
+        days = rollup_days.get(str(resolution))
+        if days is None or (since is not None and since >= now - datetime.timedelta(days=days)):
+            return resolution
+    return RESOLUTIONS[-1]
+
+def pick_resolution(kind, since, until=None, min_points=None):
+    """
+    Choose the resolution a history range is read at.
+
+    The coarsest rollup resolution giving at least min_points buckets is
+    used, raw rows when the range is short; but never a resolution finer
+    than retention keeps for the start of the range, so ranges reaching
+    past the raw retention are read from the rollups.
+
+    Args:
+        kind: "system" or "stock"
+        since: Start of the range, or None for the whole history
+        until: End of the range (defaults to now)
+        min_points: Minimum number of buckets wanted (defaults to HISTORY_OPTIONS["min_points"]);
+            0 applies the retention policy only
+
+    Returns:
+        Resolution in seconds, or None for raw rows
+    """
+    now = datetime.datetime.now()
+    if min_points is None:
+        min_points = HISTORY_OPTIONS["min_points"]
+    resolution = None
+    if since is not None and min_points:
+        resolution = choose_resolution(since, until or now, min_points)
+    kept = _finest_kept_resolution(kind, since, now)
+    return max(resolution or 0, kept or 0) or None
+
+def _history_start(oldest_buckets):
+    """
+    Start of a series' history from the oldest bucket of each rollup resolution.
+
+    The finest resolution gives the most precise start (a daily bucket starts
+    at midnight, up to a day before the first sample). A coarser resolution
+    is only used when its oldest bucket ends before the finer one's begins,
+    i.e. retention already pruned the finer rollups that far back.
+
+    Args:
+        oldest_buckets: (resolution, oldest bucket_start) pairs
+
+    Returns:
+        Datetime, or None if there are no rollups
+    """
+    start = None
+    for resolution, bucket_start in sorted(oldest_buckets):
+        if bucket_start is None:
+            continue
+        if start is None or bucket_start + datetime.timedelta(seconds=resolution) <= start:
+            start = bucket_start
+    return start
+
+@cached_query(SYSTEM_METRICS, DEVICES, scope=_device_scope)
+def get_system_metrics_resolution(db_path, metric_names, device_id=None, since=None, until=None, min_points=None):
+    """
+    Choose the resolution for reading the history of some metrics (see pick_resolution).
+
+    Without since, the range starts where the metrics' history begins (see
+    _history_start), i.e. the whole history is covered.
+
+    Args:
+        db_path: Path to the SQLite database
+        metric_names: Tuple of metric type names
+        device_id: Device ID, or None/'all' for every device
+
+    Returns:
+        Resolution in seconds, or None for raw rows
+    """
+    if since is None:
+        session = get_session(db_path)
+        try:
+            query = session.query(
+                SystemMetricRollup.resolution, func.min(SystemMetricRollup.bucket_start)
+            ).join(
+                MetricType,
+                SystemMetricRollup.metric_type_id == MetricType.id
+            ).filter(
+                MetricType.name.in_(metric_names)
+            )
+            if device_id and device_id != 'all':
+                query = query.join(Device, SystemMetricRollup.device_id == Device.id).filter(Device.device_id == device_id)
+            since = _history_start(query.group_by(SystemMetricRollup.resolution).all())
+        except SQLAlchemyError as e:
+            logging.error(f"Database error finding the start of system metrics history: {e}")
+        finally:
+            session.close()
+    return pick_resolution("system", since, until, min_points)
+
+@cached_query(STOCK_DATA, scope=_symbol_scope)
+def get_stock_resolution(db_path, symbol, since=None, until=None, min_points=None):
+    """
+    Choose the resolution for reading a symbol's price history (see pick_resolution).
+
+    Without since, the range starts where the symbol's history begins (see _history_start).
+
+    Returns:
+        Resolution in seconds, or None for raw rows
+    """
+    if since is None:
+        session = get_session(db_path)
+        try:
+            since = _history_start(
+                session.query(StockDataRollup.resolution, func.min(StockDataRollup.bucket_start)).join(StockSymbol)
+                .filter(StockSymbol.symbol == symbol)
+                .group_by(StockDataRollup.resolution).all()
+            )
+        except SQLAlchemyError as e:
+            logging.error(f"Database error finding the start of stock history: {e}")
+        finally:
+            session.close()
+    return pick_resolution("stock", since, until, min_points)
+
+def _bucket_average(sum_value, sample_count):
+    """Average of a rollup bucket"""
+    return sum_value / sample_count if sample_count else None
+
+def _rollup_window(query, rollup, since, until, resolution, after_timestamp=None, after_id=None, limit=None,
+                   tiebreak=None):
+    """
+    Restrict a rollup query to the buckets overlapping [since, until], ordered by bucket start.
+
+    The bucket containing since is included, and tiebreak (a key column of
+    the rollup table) orders buckets sharing a start and serves as the cursor
+    tiebreak.
+    """
+    if since is not None:
+        since = bucket_floor(since, resolution)
+    return _apply_history_window(
+        query.filter(rollup.resolution == resolution), rollup.bucket_start, tiebreak,
+        since, until, after_timestamp, after_id, limit
+    )
+
+def _rollup_page(rows, limit, resolution, format_item):
+    """
+    Build a history page from rollup rows fetched with limit + 1.
+
+    Each row must start with (tiebreak key, bucket_start); format_item turns a row into an item.
+    """
+    items = [format_item(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        key, bucket_start = rows[limit - 1][:2]
+        next_cursor = {"after_timestamp": bucket_start.isoformat(), "after_id": key}
+    return {"resolution": resolution, "items": items, "next_cursor": next_cursor}
+
+def get_system_metrics_rollup_page(db_path, metric_name, resolution, device_id=None, since=None, until=None,
+                                   after_timestamp=None, after_id=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Get one keyset-paginated page of a metric's rollup buckets at one resolution.
+
+    Items have the fields of get_system_metrics_history's, with the bucket
+    start as timestamp and its average as metric_value, plus min, max, avg,
+    count and last. The next_cursor's after_id is the devices.id that orders
+    devices sharing a bucket.
+
+    Returns:
+        Dictionary with "resolution", "items" and "next_cursor"
+    """
+    session = get_session(db_path)
+    try:
+        query = session.query(
+            SystemMetricRollup.device_id,
+            SystemMetricRollup.bucket_start,
+            SystemMetricRollup.min_value,
+            SystemMetricRollup.max_value,
+            SystemMetricRollup.sum_value,
+            SystemMetricRollup.sample_count,
+            SystemMetricRollup.last_value,
+            Device.device_id,
+            Device.hostname
+        ).join(
+            MetricType,
+            SystemMetricRollup.metric_type_id == MetricType.id
+        ).join(
+            Device,
+            SystemMetricRollup.device_id == Device.id
+        ).filter(
+            MetricType.name == metric_name
+        )
+        
+        if device_id and device_id != 'all':
+            query = query.filter(Device.device_id == device_id)
+        
+        rows = _rollup_window(
+            query, SystemMetricRollup, since, until, resolution, after_timestamp, after_id, limit + 1,
+            tiebreak=SystemMetricRollup.device_id
+        ).all()
+        
+        def format_item(row):
+            _, bucket_start, min_value, max_value, sum_value, count, last_value, row_device_id, hostname = row
+            average = _bucket_average(sum_value, count)
+            return {
+                "metric_name": metric_name,
+                "metric_value": average,
+                "timestamp": bucket_start.isoformat(),
+                "device_id": row_device_id,
+                "device_hostname": hostname or "Unknown Device",
+                "min": min_value,
+                "max": max_value,
+                "avg": average,
+                "count": count,
+                "last": last_value
+            }
+        return _rollup_page(rows, limit, resolution, format_item)
+    except SQLAlchemyError as e:
+        logging.error(f"Database error fetching system metrics rollups: {e}")
+        return {"resolution": resolution, "items": [], "next_cursor": None}
+    finally:
+        session.close()
+
+def get_stock_rollup_page(db_path, symbol, resolution, since=None, until=None, after_timestamp=None, after_id=None,
+                          limit=DEFAULT_PAGE_SIZE):
+    """
+    Get one keyset-paginated page of a symbol's rollup buckets at one resolution.
+
+    Items have the fields of get_stock_history's, with the bucket start as
+    timestamp and its average as price, plus min, max, avg, count and last.
+
+    Returns:
+        Dictionary with "resolution", "items" and "next_cursor"
+    """
+    session = get_session(db_path)
+    try:
+        query = session.query(
+            StockDataRollup.symbol_id,
+            StockDataRollup.bucket_start,
+            StockDataRollup.min_value,
+            StockDataRollup.max_value,
+            StockDataRollup.sum_value,
+            StockDataRollup.sample_count,
+            StockDataRollup.last_value
+        ).join(StockSymbol).filter(
+            StockSymbol.symbol == symbol
+        )
+        rows = _rollup_window(
+            query, StockDataRollup, since, until, resolution, after_timestamp, after_id, limit + 1,
+            tiebreak=StockDataRollup.symbol_id
+        ).all()
+        
+        def format_item(row):
+            _, bucket_start, min_value, max_value, sum_value, count, last_value = row
+            average = _bucket_average(sum_value, count)
+            return {
+                "symbol": symbol,
+                "price": average,
+                "timestamp": bucket_start.isoformat(),
+                "min": min_value,
+                "max": max_value,
+                "avg": average,
+                "count": count,
+                "last": last_value
+            }
+        return _rollup_page(rows, limit, resolution, format_item)
+    except SQLAlchemyError as e:
+        logging.error(f"Database error fetching stock rollups: {e}")
+        return {"resolution": resolution, "items": [], "next_cursor": None}
+    finally:
+        session.close()
@@ -0,0 +1,263 @@
+"""
+Query Result Cache
+
+Process-wide cache for the read queries behind the dashboard callbacks, so
+every open tab polling the same data shares one SQLite query per refresh
+window. Entries are keyed by (function, arguments), expire after a TTL, are
+evicted least-recently-used beyond max_entries, and are tagged with the
+tables they read. Writers bump a tag's version after committing, which
+invalidates every entry that depends on it.
+
+Queries reading a single device or symbol can also be scoped to it with a
+per-key tag (see key_tag), so a write touching other keys of the same table
+leaves them cached: invalidate_keys() only drops the entries of the keys
+written and the unscoped entries of that table, while invalidate() still
+drops every entry of the table.
+
+Cached values are shared between callers and must be treated as read-only.
+"""
+import functools
+import inspect
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Tags naming the data a cached query depends on
+SYSTEM_METRICS = "system_metrics"
+STOCK_DATA = "stock_data"
+STOCK_SYMBOLS = "stock_symbols"
+DEVICES = "devices"
+
+# Key of the per-key tag that entries not scoped to one key depend on
+ALL_KEYS = "*"
+
+QUERY_CACHE_OPTIONS = {
+    "enabled": True,
+    "ttl_seconds": 5.0,
+    "max_entries": 256
+}
+
+_MISSING = object()
+
+# Lists and tuples longer than this are sized from an evenly spaced sample of their items
+SIZE_SAMPLE_ITEMS = 100
+
+
+def configure_query_cache(options):
+    """Override QUERY_CACHE_OPTIONS (e.g. from the "query_cache" section of config.json) before first use."""
+    if options:
+        QUERY_CACHE_OPTIONS.update(options)
+
+def key_tag(tag, key):
+    """Tag for the data of one key (a devices.id or stock symbol) of a table tag, e.g. "stock_data:ACME"."""
+    return f"{tag}:{key}"
+
+def _estimate_size(value):
+    """
+    Roughly estimate the memory held by a query result, in bytes.
+
+    Long lists and tuples, e.g. history columns, are extrapolated from a
+    sample so sizing stays cheap next to the query that built them.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_size(key) + _estimate_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        if len(value) > SIZE_SAMPLE_ITEMS:
+            step = len(value) / SIZE_SAMPLE_ITEMS
+            sample = sum(_estimate_size(value[int(index * step)]) for index in range(SIZE_SAMPLE_ITEMS))
+            size += sample * len(value) // SIZE_SAMPLE_ITEMS
+        else:
+            size += sum(_estimate_size(item) for item in value)
+    return size
+
+
+class QueryCache:
+    def __init__(self, ttl_seconds=5.0, max_entries=256, enabled=True):
+        """
+        Initialize an empty cache.
+
+        Args:
+            ttl_seconds: Maximum age of an entry
+            max_entries: Entries kept before the least recently used is evicted
+            enabled: When False every lookup goes straight to the loader
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._entries = OrderedDict()  # key -> (value, expires_at, tag versions, size)
+        self._versions = {}            # tag -> version, bumped by invalidate()
+        self._loading = {}             # key -> lock held while one caller runs the query
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._memory_bytes = 0
+
+    def get_or_load(self, key, tags, loader):
+        """
+        Return the cached result for key, running loader() on a miss.
+
+        Concurrent misses for the same key wait for a single load.
+
+        Args:
+            key: Hashable cache key
+            tags: Tags of the data the result depends on
+            loader: Callable producing the result
+        """
+        if not self.enabled:
+            return loader()
+
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        try:
+            with load_lock:
+                # Another caller may have loaded it while we waited
+                value = self._lookup(key)
+                if value is not _MISSING:
+                    return value
+
+                # Snapshot versions before querying so a concurrent write makes the result stale
+                with self._lock:
+                    self._misses += 1
+                    versions = tuple((tag, self._versions.get(tag, 0)) for tag in tags)
+                value = loader()
+                self._store(key, value, versions)
+                return value
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def invalidate(self, *tags):
+        """Invalidate every entry depending on any of the given tags."""
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+            self._invalidations += 1
+
+    def invalidate_keys(self, tag, keys):
+        """Invalidate the entries scoped to any of the given keys of tag, and those not scoped to a key."""
+        with self._lock:
+            for key in list(keys) + [ALL_KEYS]:
+                scoped = key_tag(tag, key)
+                self._versions[scoped] = self._versions.get(scoped, 0) + 1
+            self._invalidations += 1
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def get_stats(self):
+        """Return hit/miss counters, entry count and estimated memory use."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "memory_bytes": self._memory_bytes,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+    def _lookup(self, key):
+        """Return a fresh cached value (counting a hit) or _MISSING, dropping stale entries."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+
+            value, expires_at, versions, size = entry
+            if time.monotonic() >= expires_at or any(self._versions.get(tag, 0) != version for tag, version in versions):
+                del self._entries[key]
+                self._memory_bytes -= size
+                return _MISSING
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def _store(self, key, value, versions):
+        """Insert a freshly loaded value, evicting least recently used entries beyond max_entries."""
+        size = _estimate_size(value)
+        with self._lock:
+            # Don't cache a result that a write already made stale
+            if any(self._versions.get(tag, 0) != version for tag, version in versions):
+                return
+
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= previous[3]
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds, versions, size)
+            self._memory_bytes += size
+
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= evicted[3]
+                self._evictions += 1
+
+
+# One cache per database path, shared process-wide
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_query_cache(db_path):
+    """Return the shared query cache for db_path."""
+    cache = _caches.get(db_path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(db_path)
+            if cache is None:
+                cache = QueryCache(
+                    ttl_seconds=QUERY_CACHE_OPTIONS["ttl_seconds"],
+                    max_entries=QUERY_CACHE_OPTIONS["max_entries"],
+                    enabled=QUERY_CACHE_OPTIONS["enabled"]
+                )
+                _caches[db_path] = cache
+    return cache
+
+def cached_query(*tags, scope=None):
+    """
+    Cache a read function taking db_path as its first argument.
+
+    Results are keyed by the function name and its arguments and invalidated
+    through the given tags. The undecorated function is available as .uncached.
+
+    Args:
+        tags: Tags of the tables the function reads
+        scope: Optional callable taking (db_path, arguments by parameter name) and
+            returning {tag: key} for the tags this call only reads one key of
+    """
+    def decorator(function):
+        signature = inspect.signature(function) if scope else None
+
+        @functools.wraps(function)
+        def wrapper(db_path, *args, **kwargs):
+            key = (function.__name__, args, tuple(sorted(kwargs.items())))
+            keys = {}
+            if scope:
+                arguments = signature.bind(db_path, *args, **kwargs)
+                arguments.apply_defaults()
+                keys = scope(db_path, arguments.arguments)
+            entry_tags = list(tags) + [
+                key_tag(tag, keys[tag] if keys.get(tag) is not None else ALL_KEYS) for tag in tags
+            ]
+            return get_query_cache(db_path).get_or_load(
+                key, entry_tags, lambda: function(db_path, *args, **kwargs)
+            )
+        wrapper.uncached = function
+        return wrapper
+    return decorator
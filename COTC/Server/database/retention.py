@@ -0,0 +1,203 @@
+"""
+Retention Worker
+
+Background job that enforces the per-table retention policy from the
+"retention" section of config.json. Expired rows are deleted in small chunks,
+each in its own short transaction, so ingestion is never blocked for long,
+and freed pages are returned to the filesystem with incremental VACUUM.
+
+Policy format (days; null keeps rows forever):
+    "tables": {
+        "system_metrics": 7,
+        "stock_data": 7,
+        "system_metric_rollups": {"60": 90, "3600": 365, "86400": null},
+        "stock_data_rollups": {"60": 90, "3600": 365, "86400": null}
+    }
+"""
+import datetime
+import logging
+import threading
+import time
+from sqlalchemy import text
+from .schema import get_engine
+from .query_cache import get_query_cache, SYSTEM_METRICS, STOCK_DATA
+
+# Raw tables are pruned by timestamp, rollup tables by bucket_start per resolution
+RAW_TABLES = ("system_metrics", "stock_data")
+ROLLUP_TABLES = ("system_metric_rollups", "stock_data_rollups")
+
+# Cached queries that read each table
+CACHE_TAGS = {
+    "system_metrics": SYSTEM_METRICS,
+    "stock_data": STOCK_DATA,
+    "system_metric_rollups": SYSTEM_METRICS,
+    "stock_data_rollups": STOCK_DATA
+}
+
+
+class RetentionWorker:
+    def __init__(self, db_path, tables, interval_seconds=3600, chunk_size=1000, chunk_pause=0.05, vacuum_pages=1000):
+        """
+        Initialize the worker.
+
+        Args:
+            db_path: Path to the SQLite database
+            tables: Retention policy per table (see module docstring)
+            interval_seconds: Time between retention runs
+            chunk_size: Maximum rows deleted per transaction
+            chunk_pause: Seconds to sleep between chunks so writers can get the lock
+            vacuum_pages: Pages released by PRAGMA incremental_vacuum after each run (0 disables)
+        """
+        self.db_path = db_path
+        self.tables = tables or {}
+        self.interval_seconds = interval_seconds
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause
+        self.vacuum_pages = vacuum_pages
+
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._stats = {
+            "runs": 0,
+            "rows_pruned": {},
+            "total_rows_pruned": 0,
+            "last_run_at": None,
+            "last_run_seconds": 0.0,
+            "total_seconds": 0.0,
+            "vacuum_runs": 0,
+            "vacuum_pages_freed": 0,
+            "errors": 0
+        }
+
+    def start(self):
+        """Start the background retention thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="RetentionWorker", daemon=True)
+        self._thread.start()
+        logging.info(f"Retention worker started (every {self.interval_seconds}s, chunks of {self.chunk_size} rows)")
+
+    def stop(self):
+        """Stop the worker after the current chunk."""
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._thread.join(30)
+        self._thread = None
+
+    def get_stats(self):
+        """Return rows pruned per table and time spent."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["rows_pruned"] = dict(self._stats["rows_pruned"])
+        return stats
+
+    def run_once(self):
+        """Apply the retention policy to every configured table once."""
+        started = time.perf_counter()
+        now = datetime.datetime.now()
+
+        for table_name, policy in self.tables.items():
+            if table_name in RAW_TABLES:
+                if policy is not None:
+                    cutoff = now - datetime.timedelta(days=policy)
+                    self._prune(table_name, "timestamp < :cutoff", {"cutoff": cutoff}, table_name)
+            elif table_name in ROLLUP_TABLES:
+                for resolution, days in (policy or {}).items():
+                    if days is None:
+                        continue
+                    cutoff = now - datetime.timedelta(days=days)
+                    self._prune(
+                        table_name,
+                        "resolution = :resolution AND bucket_start < :cutoff",
+                        {"resolution": int(resolution), "cutoff": cutoff},
+                        f"{table_name}:{resolution}"
+                    )
+            else:
+                logging.warning(f"Ignoring retention policy for unknown table {table_name}")
+
+            if self._stopping.is_set():
+                break
+
+        self._incremental_vacuum()
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["last_run_at"] = now.isoformat()
+            self._stats["last_run_seconds"] = elapsed
+            self._stats["total_seconds"] += elapsed
+
+    def _prune(self, table_name, condition, params, stats_key):
+        """Delete rows matching condition in chunks, one short transaction per chunk."""
+        engine = get_engine(self.db_path)
+        # Timestamps are stored as text in SQLAlchemy's SQLite format
+        params = {
+            key: value.strftime('%Y-%m-%d %H:%M:%S.%f') if isinstance(value, datetime.datetime) else value
+            for key, value in params.items()
+        }
+        statement = text(
+            f"DELETE FROM {table_name} WHERE rowid IN "
+            f"(SELECT rowid FROM {table_name} WHERE {condition} LIMIT :chunk_size)"
+        )
+
+        pruned = 0
+        while not self._stopping.is_set():
+            try:
+                with engine.begin() as conn:
+                    deleted = conn.execute(statement, dict(params, chunk_size=self.chunk_size)).rowcount
+            except Exception as e:
+                logging.error(f"Error pruning {stats_key}: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+                break
+
+            pruned += deleted
+            if deleted < self.chunk_size:
+                break
+            time.sleep(self.chunk_pause)
+
+        if pruned:
+            logging.info(f"Retention pruned {pruned} rows from {stats_key}")
+            get_query_cache(self.db_path).invalidate(CACHE_TAGS[table_name])
+            with self._lock:
+                self._stats["rows_pruned"][stats_key] = self._stats["rows_pruned"].get(stats_key, 0) + pruned
+                self._stats["total_rows_pruned"] += pruned
+
+    def _incremental_vacuum(self):
+        """Release free pages, if the database was created with auto_vacuum=INCREMENTAL."""
+        if not self.vacuum_pages:
+            return
+        engine = get_engine(self.db_path)
+        try:
+            with engine.connect() as conn:
+                # 2 = INCREMENTAL; other modes need a one-off full VACUUM to switch
+                if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+                    logging.debug("auto_vacuum is not INCREMENTAL, skipping incremental vacuum")
+                    return
+                free_pages = conn.execute(text("PRAGMA freelist_count")).scalar()
+                # The pragma frees one page per step and a DBAPI execute() steps it only
+                # once; executescript() runs it to completion
+                conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});")
+                freed = free_pages - conn.execute(text("PRAGMA freelist_count")).scalar()
+                conn.commit()
+            if freed:
+                logging.info(f"Incremental vacuum released {freed} pages")
+            with self._lock:
+                self._stats["vacuum_runs"] += 1
+                self._stats["vacuum_pages_freed"] += freed
+        except Exception as e:
+            logging.error(f"Error running incremental vacuum: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+
+    def _run(self):
+        """Worker loop: run the policy, then wait for the next interval."""
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Retention run failed: {e}")
+            self._stopping.wait(self.interval_seconds)
@@ -0,0 +1,228 @@
+"""
+Rollups
+
+Maintains min/max/sum/count/last aggregates per time bucket at 1-minute,
+1-hour and 1-day resolutions for every (device, metric type) and every stock
+symbol. Buckets are upserted incrementally by the ingestion path and can be
+rebuilt from the raw tables at any time.
+"""
+import datetime
+import logging
+from sqlalchemy import case, func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .schema import SystemMetricRollup, StockDataRollup
+
+# Bucket sizes in seconds, finest first
+RESOLUTIONS = (60, 3600, 86400)
+
+# How each raw table maps onto its rollup table
+SERIES = {
+    "system": {
+        "table": SystemMetricRollup.__table__,
+        "raw_table": "system_metrics",
+        "keys": ("device_id", "metric_type_id"),
+        "value": "metric_value"
+    },
+    "stock": {
+        "table": StockDataRollup.__table__,
+        "raw_table": "stock_data",
+        "keys": ("symbol_id",),
+        "value": "price"
+    }
+}
+
+# strftime patterns that floor a stored timestamp to its bucket; the
+# ".000000" suffix matches how SQLAlchemy stores DateTime values in SQLite
+_SQL_BUCKET_FORMATS = {
+    60: '%Y-%m-%d %H:%M:00.000000',
+    3600: '%Y-%m-%d %H:00:00.000000',
+    86400: '%Y-%m-%d 00:00:00.000000'
+}
+
+
+def bucket_floor(timestamp, resolution):
+    """Return the start of the bucket of the given resolution (seconds) containing timestamp."""
+    if resolution == 86400:
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == 3600:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == 60:
+        return timestamp.replace(second=0, microsecond=0)
+    raise ValueError(f"Unsupported rollup resolution: {resolution}")
+
+def choose_resolution(since, until, min_points):
+    """
+    Pick the coarsest resolution that still yields at least min_points buckets over [since, until].
+
+    Returns:
+        Resolution in seconds, or None when even 1-minute buckets are too coarse (use raw rows)
+    """
+    span = (until - since).total_seconds()
+    for resolution in reversed(RESOLUTIONS):
+        if span / resolution >= min_points:
+            return resolution
+    return None
+
+def aggregate_rows(rows, kind):
+    """
+    Fold raw rows (dicts with key columns, value column and timestamp) into per-bucket aggregates.
+
+    Returns:
+        List of rollup row dicts, one per (key, resolution, bucket)
+    """
+    series = SERIES[kind]
+    keys = series["keys"]
+    value_column = series["value"]
+
+    aggregates = {}
+    for row in rows:
+        timestamp = row["timestamp"]
+        value = row[value_column]
+        key_values = tuple(row[key] for key in keys)
+
+        for resolution in RESOLUTIONS:
+            bucket_start = bucket_floor(timestamp, resolution)
+            aggregate = aggregates.get(key_values + (resolution, bucket_start))
+            if aggregate is None:
+                aggregate = dict(zip(keys, key_values))
+                aggregate.update({
+                    "resolution": resolution,
+                    "bucket_start": bucket_start,
+                    "min_value": value,
+                    "max_value": value,
+                    "sum_value": value,
+                    "sample_count": 1,
+                    "last_value": value,
+                    "last_timestamp": timestamp
+                })
+                aggregates[key_values + (resolution, bucket_start)] = aggregate
+                continue
+
+            aggregate["min_value"] = min(aggregate["min_value"], value)
+            aggregate["max_value"] = max(aggregate["max_value"], value)
+            aggregate["sum_value"] += value
+            aggregate["sample_count"] += 1
+            if timestamp >= aggregate["last_timestamp"]:
+                aggregate["last_value"] = value
+                aggregate["last_timestamp"] = timestamp
+
+    return list(aggregates.values())
+
+def upsert_rollups(session, rows, kind):
+    """Merge raw rows into the rollup table of the given kind ("system" or "stock")."""
+    if not rows:
+        return
+
+    series = SERIES[kind]
+    table = series["table"]
+    statement = sqlite_insert(table)
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c[key] for key in series["keys"]] + [table.c.resolution, table.c.bucket_start],
+        set_={
+            # Two-argument min()/max() are SQLite's scalar functions
+            "min_value": func.min(table.c.min_value, excluded.min_value),
+            "max_value": func.max(table.c.max_value, excluded.max_value),
+            "sum_value": table.c.sum_value + excluded.sum_value,
+            "sample_count": table.c.sample_count + excluded.sample_count,
+            "last_value": case(
+                (excluded.last_timestamp >= table.c.last_timestamp, excluded.last_value),
+                else_=table.c.last_value
+            ),
+            "last_timestamp": func.max(table.c.last_timestamp, excluded.last_timestamp)
+        }
+    )
+    session.execute(statement, aggregate_rows(rows, kind))
+
+def rebuild_rollups(engine, kind, since=None):
+    """
+    Recompute rollup buckets of the given kind from the raw table.
+
+    Buckets fully covered by the raw data are replaced. The oldest bucket of
+    each resolution may have lost raw rows to retention, so it is only
+    replaced when the raw rows hold more samples than the stored bucket
+    (e.g. it is missing or was never maintained); otherwise it is left as is.
+
+    Args:
+        engine: SQLAlchemy engine
+        kind: "system" or "stock"
+        since: Optional datetime; only rebuild buckets starting at or after it
+    """
+    series = SERIES[kind]
+    table_name = series["table"].name
+    raw_table = series["raw_table"]
+    keys = ", ".join(series["keys"])
+    value_column = series["value"]
+
+    with engine.begin() as conn:
+        first_raw = conn.execute(text(f"SELECT MIN(timestamp) FROM {raw_table}")).scalar()
+        if first_raw is None:
+            return
+        first_raw = datetime.datetime.fromisoformat(first_raw)
+
+        for resolution in RESOLUTIONS:
+            # First bucket whose start is not before the oldest raw row
+            first_bucket = bucket_floor(first_raw, resolution)
+            start = first_bucket
+            if start < first_raw:
+                start += datetime.timedelta(seconds=resolution)
+            if since is not None:
+                start = max(start, bucket_floor(since, resolution))
+            aggregate = _rebuild_statement(table_name, raw_table, keys, value_column, resolution)
+            parameters = {"resolution": resolution, "start": _sql_timestamp(start), "end": None}
+
+            conn.execute(
+                text(f"DELETE FROM {table_name} WHERE resolution = :resolution AND bucket_start >= :start"),
+                parameters
+            )
+            conn.execute(text(aggregate), parameters)
+
+            # The partial oldest bucket, merged rather than replaced
+            if first_bucket < start and (since is None or bucket_floor(since, resolution) <= first_bucket):
+                conn.execute(text(f"""
+                    {aggregate}
+                    ON CONFLICT ({keys}, resolution, bucket_start) DO UPDATE SET
+                        min_value = excluded.min_value, max_value = excluded.max_value,
+                        sum_value = excluded.sum_value, sample_count = excluded.sample_count,
+                        last_value = excluded.last_value, last_timestamp = excluded.last_timestamp
+                    WHERE excluded.sample_count > {table_name}.sample_count
+                """), {"resolution": resolution, "start": _sql_timestamp(first_bucket), "end": _sql_timestamp(start)})
+
+    logging.info(f"Rebuilt {kind} rollups from raw data")
+
+def _sql_timestamp(timestamp):
+    """Format a datetime the way SQLAlchemy stores DateTime values in SQLite."""
+    return timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def _rebuild_statement(table_name, raw_table, keys, value_column, resolution):
+    """INSERT ... SELECT aggregating the raw rows in [:start, :end) (no end if :end is NULL) into buckets."""
+    bucket_format = _SQL_BUCKET_FORMATS[resolution]
+    # LAST_VALUE over each bucket gives the value of the newest row in it; the
+    # outer WHERE keeps SQLite from reading a trailing ON CONFLICT as a join
+    return f"""
+        INSERT INTO {table_name} ({keys}, resolution, bucket_start, min_value, max_value,
+                                  sum_value, sample_count, last_value, last_timestamp)
+        SELECT {keys}, :resolution, bucket_start, MIN({value_column}), MAX({value_column}),
+               SUM({value_column}), COUNT(*), MAX(last_value), MAX(timestamp)
+        FROM (
+            SELECT {keys}, {value_column}, timestamp,
+                   strftime('{bucket_format}', timestamp) AS bucket_start,
+                   LAST_VALUE({value_column}) OVER (
+                       PARTITION BY {keys}, strftime('{bucket_format}', timestamp)
+                       ORDER BY timestamp, id
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                   ) AS last_value
+            FROM {raw_table}
+            WHERE timestamp >= :start AND (:end IS NULL OR timestamp < :end)
+        )
+        WHERE true
+        GROUP BY {keys}, bucket_start
+    """
+
+def backfill_rollups(engine):
+    """Build rollups from the raw history for any rollup table that is still empty."""
+    for kind, series in SERIES.items():
+        with engine.connect() as conn:
+            empty = conn.execute(text(f"SELECT 1 FROM {series['table'].name} LIMIT 1")).first() is None
+        if empty:
+            rebuild_rollups(engine, kind)
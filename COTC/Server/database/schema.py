@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Index, create_engine, event, text
 from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, relationship
+from sqlalchemy.pool import QueuePool
 import datetime
 import socket
+import threading
 import uuid
 import os
 
@@ -49,6 +51,10 @@ class MetricType(Base):
 # System metrics table
 class SystemMetric(Base):
     __tablename__ = 'system_metrics'
+    __table_args__ = (
+        # Serves per-device, per-metric history ordered by time and latest-value lookups
+        Index('ix_system_metrics_device_type_ts', 'device_id', 'metric_type_id', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True)
     metric_type_id = Column(Integer, ForeignKey('metric_types.id'), nullable=False)
@@ -90,6 +96,10 @@ class StockSymbol(Base):
 # Stock data table
 class StockData(Base):
     __tablename__ = 'stock_data'
+    __table_args__ = (
+        # Serves per-symbol history ordered by time and ORDER BY timestamp DESC LIMIT 1
+        Index('ix_stock_data_symbol_ts', 'symbol_id', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True)
     symbol_id = Column(Integer, ForeignKey('stock_symbols.id'), nullable=False)
@@ -109,8 +119,71 @@ class StockData(Base):
             "timestamp": self.timestamp.isoformat()
         }
 
+# Latest value per (device, metric type), upserted on ingest so gauges read one row
+class LatestMetric(Base):
+    __tablename__ = 'latest_metrics'
+    
+    device_id = Column(Integer, ForeignKey('devices.id'), primary_key=True)
+    metric_type_id = Column(Integer, ForeignKey('metric_types.id'), primary_key=True)
+    metric_value = Column(Float, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<LatestMetric(device_id={self.device_id}, metric_type_id={self.metric_type_id}, value={self.metric_value})>"
+
+# Latest price per stock symbol, upserted on ingest so the price display reads one row
+class LatestStockPrice(Base):
+    __tablename__ = 'latest_stock_prices'
+    
+    symbol_id = Column(Integer, ForeignKey('stock_symbols.id'), primary_key=True)
+    price = Column(Float, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<LatestStockPrice(symbol_id={self.symbol_id}, price={self.price})>"
+
+# Time-bucketed aggregates of system metrics (resolution in seconds: 60, 3600 or 86400)
+class SystemMetricRollup(Base):
+    __tablename__ = 'system_metric_rollups'
+    
+    device_id = Column(Integer, ForeignKey('devices.id'), primary_key=True)
+    metric_type_id = Column(Integer, ForeignKey('metric_types.id'), primary_key=True)
+    resolution = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+    sum_value = Column(Float, nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    last_value = Column(Float, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<SystemMetricRollup(device_id={self.device_id}, metric_type_id={self.metric_type_id}, resolution={self.resolution}, bucket_start={self.bucket_start})>"
+
+# Time-bucketed aggregates of stock prices (resolution in seconds: 60, 3600 or 86400)
+class StockDataRollup(Base):
+    __tablename__ = 'stock_data_rollups'
+    
+    symbol_id = Column(Integer, ForeignKey('stock_symbols.id'), primary_key=True)
+    resolution = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+    sum_value = Column(Float, nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    last_value = Column(Float, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<StockDataRollup(symbol_id={self.symbol_id}, resolution={self.resolution}, bucket_start={self.bucket_start})>"
+
 # Helper function to get or create a device based on device_id or MAC address
 def get_or_create_device(session, device_id=None, mac_address=None, hostname=None, os_info=None):
+    # Remember what the caller actually supplied; the fallbacks below are only for new devices
+    supplied_device_id = device_id
+    supplied_hostname = hostname
+    supplied_os_info = os_info
+    
     # If no device_id provided, generate a UUID as fallback
     if not device_id:
         # Create a UUID as fallback if no device ID is provided
@@ -129,16 +202,16 @@ def get_or_create_device(session, device_id=None, mac_address=None, hostname=Non
             os_info = os.name
     
     # First check if a device with this MAC address exists
+    device = None
     if mac_address:
-        device_by_mac = session.query(Device).filter_by(mac_address=mac_address).first()
-        if device_by_mac:
-            # If found by MAC but device_id is different, update it
-            if device_by_mac.device_id != device_id:
-                device_by_mac.device_id = device_id
-            return device_by_mac
+        device = session.query(Device).filter_by(mac_address=mac_address).first()
+        # If found by MAC but the caller's device_id is different, update it
+        if device and supplied_device_id and device.device_id != supplied_device_id:
+            device.device_id = supplied_device_id
     
     # If not found by MAC or no MAC provided, check by device_id
-    device = session.query(Device).filter_by(device_id=device_id).first()
+    if not device:
+        device = session.query(Device).filter_by(device_id=device_id).first()
     
     if not device:
         # Make sure we have a MAC address for new devices
@@ -155,19 +228,113 @@ def get_or_create_device(session, device_id=None, mac_address=None, hostname=Non
             os_info=os_info
         )
         session.add(device)
-        session.commit()
+        # Flush to generate the ID; committing is left to the caller's transaction
+        session.flush()
     else:
-        # Update last seen timestamp
-        device.last_seen = datetime.datetime.now()
-        device.hostname = hostname  # Update hostname in case it changed
-        device.os_info = os_info    # Update OS info in case it changed
-        session.commit()
+        # Only write when the hostname or OS info actually changed;
+        # last_seen is maintained by the ingestion path's LastSeenTracker
+        changed = False
+        if supplied_hostname and device.hostname != supplied_hostname:
+            device.hostname = supplied_hostname
+            changed = True
+        if supplied_os_info and device.os_info != supplied_os_info:
+            device.os_info = supplied_os_info
+            changed = True
+        if changed:
+            device.last_seen = datetime.datetime.now()
+            session.flush()
     
     return device
 
 # Database connection handling
+# Pool and SQLite PRAGMA settings, overridable through the "database" section of config.json
+DATABASE_OPTIONS = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_timeout": 30,
+    "pool_recycle": 3600,
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,       # milliseconds
+    "mmap_size": 268435456,     # bytes (256 MB)
+    "cache_size": -20000,       # negative means KiB (about 20 MB)
+    "auto_vacuum": "INCREMENTAL"  # only takes effect for new files or after a full VACUUM
+}
+
+# One engine, session factory and scoped session per database path, shared process-wide
+_engines = {}
+_session_factories = {}
+_scoped_sessions = {}
+_registry_lock = threading.Lock()
+
+def configure_database(options=None):
+    """Override the pool/PRAGMA defaults. Only affects engines created afterwards."""
+    if options:
+        DATABASE_OPTIONS.update(options)
+
+def _make_pragma_listener(options):
+    """Build a connect listener that applies the SQLite PRAGMAs once per new DBAPI connection."""
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # Must come first: auto_vacuum can only be chosen before the first table is created
+            cursor.execute(f"PRAGMA auto_vacuum={options['auto_vacuum']}")
+            cursor.execute(f"PRAGMA journal_mode={options['journal_mode']}")
+            cursor.execute(f"PRAGMA synchronous={options['synchronous']}")
+            cursor.execute(f"PRAGMA busy_timeout={int(options['busy_timeout'])}")
+            cursor.execute(f"PRAGMA mmap_size={int(options['mmap_size'])}")
+            cursor.execute(f"PRAGMA cache_size={int(options['cache_size'])}")
+        finally:
+            cursor.close()
+    return set_sqlite_pragmas
+
 def get_engine(db_path):
-    return create_engine(f'sqlite:///{db_path}')
+    """Return the cached engine for db_path, creating it (with its connection pool) on first use."""
+    engine = _engines.get(db_path)
+    if engine is not None:
+        return engine
+    
+    with _registry_lock:
+        engine = _engines.get(db_path)
+        if engine is None:
+            options = dict(DATABASE_OPTIONS)
+            engine = create_engine(
+                f'sqlite:///{db_path}',
+                poolclass=QueuePool,
+                pool_size=options['pool_size'],
+                max_overflow=options['max_overflow'],
+                pool_timeout=options['pool_timeout'],
+                pool_recycle=options['pool_recycle'],
+                connect_args={'check_same_thread': False}
+            )
+            event.listen(engine, 'connect', _make_pragma_listener(options))
+            _engines[db_path] = engine
+        return engine
+
+def get_session_factory(db_path):
+    """Return the shared sessionmaker bound to the cached engine for db_path."""
+    factory = _session_factories.get(db_path)
+    if factory is not None:
+        return factory
+    
+    engine = get_engine(db_path)
+    with _registry_lock:
+        factory = _session_factories.get(db_path)
+        if factory is None:
+            factory = sessionmaker(bind=engine)
+            _session_factories[db_path] = factory
+        return factory
+
+def dispose_engines():
+    """Close every pooled connection and forget all cached engines."""
+    with _registry_lock:
+        for scoped in _scoped_sessions.values():
+            scoped.remove()
+        for engine in _engines.values():
+            engine.dispose()
+        _scoped_sessions.clear()
+        _session_factories.clear()
+        _engines.clear()
 
 def init_db(db_path):
     engine = get_engine(db_path)
@@ -185,9 +352,39 @@ def init_db(db_path):
     session.commit()
     session.close()
     
+    backfill_latest_values(engine)
+    
+    # Imported here because rollups builds on the models defined in this module
+    from .rollups import backfill_rollups
+    backfill_rollups(engine)
+    
     return engine
 
+def backfill_latest_values(engine):
+    """Populate empty latest-value tables from the raw history (used when upgrading an existing database)"""
+    with engine.begin() as conn:
+        # SQLite returns the bare columns from the row holding MAX(timestamp)
+        if conn.execute(text("SELECT 1 FROM latest_metrics LIMIT 1")).first() is None:
+            conn.execute(text(
+                "INSERT OR REPLACE INTO latest_metrics (device_id, metric_type_id, metric_value, timestamp) "
+                "SELECT device_id, metric_type_id, metric_value, MAX(timestamp) "
+                "FROM system_metrics GROUP BY device_id, metric_type_id"
+            ))
+        if conn.execute(text("SELECT 1 FROM latest_stock_prices LIMIT 1")).first() is None:
+            conn.execute(text(
+                "INSERT OR REPLACE INTO latest_stock_prices (symbol_id, price, timestamp) "
+                "SELECT symbol_id, price, MAX(timestamp) FROM stock_data GROUP BY symbol_id"
+            ))
+
 def get_session(db_path):
-    engine = get_engine(db_path)
-    session_factory = sessionmaker(bind=engine)
-    return scoped_session(session_factory) 
\ No newline at end of file
+    scoped = _scoped_sessions.get(db_path)
+    if scoped is not None:
+        return scoped
+    
+    session_factory = get_session_factory(db_path)
+    with _registry_lock:
+        scoped = _scoped_sessions.get(db_path)
+        if scoped is None:
+            scoped = scoped_session(session_factory)
+            _scoped_sessions[db_path] = scoped
+        return scoped
\ No newline at end of file
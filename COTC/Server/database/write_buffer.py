@@ -0,0 +1,181 @@
+"""
+Write-Behind Buffer
+
+Optional ingestion mode where request handlers only validate samples and push
+them onto a bounded in-process queue. A dedicated flusher thread drains the
+queue in large batches through ingestion.ingest_batch, on whichever comes
+first of a size trigger (flush_size samples) or a time trigger (flush_interval
+seconds), so requests no longer wait for an SQLite commit.
+"""
+import logging
+import queue
+import threading
+import time
+from .ingestion import ingest_batch
+
+# Longest the flusher waits for samples before checking whether it should stop
+STOP_POLL_SECONDS = 0.1
+
+
+class WriteBufferFull(Exception):
+    """Raised when the queue can't take a submission; callers should answer 503."""
+
+
+class WriteBehindBuffer:
+    def __init__(self, db_path, allowed_metrics=None, max_queue=10000, flush_size=500, flush_interval=1.0, max_retries=3):
+        """
+        Initialize the buffer.
+
+        Args:
+            db_path: Path to the SQLite database
+            allowed_metrics: Metric names accepted by ingest_batch
+            max_queue: Maximum number of queued samples before submissions are refused
+            flush_size: Flush as soon as this many samples are queued
+            flush_interval: Flush at least this often (seconds) while samples are queued
+            max_retries: Attempts per batch before it is dropped and logged
+        """
+        self.db_path = db_path
+        self.allowed_metrics = allowed_metrics
+        self.max_queue = max_queue
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._submit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self._stats = {
+            "enqueued": 0,
+            "refused": 0,
+            "flushes": 0,
+            "flushed_samples": 0,
+            "failed_flushes": 0,
+            "dropped_samples": 0,
+            "rejected_samples": 0,
+            "duplicate_samples": 0,
+            "last_flush_size": 0,
+            "max_flush_size": 0,
+            "last_flush_seconds": 0.0,
+            "max_flush_seconds": 0.0,
+            "total_flush_seconds": 0.0
+        }
+
+    def start(self):
+        """Start the flusher thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="WriteBehindFlusher", daemon=True)
+        self._thread.start()
+        logging.info(f"Write-behind flusher started (max_queue={self.max_queue}, flush_size={self.flush_size}, flush_interval={self.flush_interval}s)")
+
+    def stop(self, timeout=30):
+        """Stop accepting work, drain everything still queued and join the flusher thread."""
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.error(f"Write-behind flusher did not drain within {timeout}s ({self._queue.qsize()} samples left)")
+        else:
+            logging.info("Write-behind flusher drained and stopped")
+        self._thread = None
+
+    def submit(self, samples):
+        """
+        Queue validated samples for the flusher, all or nothing.
+
+        Raises:
+            WriteBufferFull: If the queue is stopping or lacks room for every sample
+        """
+        with self._submit_lock:
+            if self._stopping.is_set() or self._queue.qsize() + len(samples) > self.max_queue:
+                with self._stats_lock:
+                    self._stats["refused"] += len(samples)
+                raise WriteBufferFull(f"Write buffer full ({self._queue.qsize()}/{self.max_queue} samples queued)")
+
+            # Only submitters add to the queue and they hold the lock, so these can't block
+            for sample in samples:
+                self._queue.put_nowait(sample)
+
+        with self._stats_lock:
+            self._stats["enqueued"] += len(samples)
+
+    def get_stats(self):
+        """Return a snapshot of the queue depth and flush counters."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["max_queue"] = self.max_queue
+        stats["avg_flush_size"] = stats["flushed_samples"] / stats["flushes"] if stats["flushes"] else 0.0
+        stats["avg_flush_seconds"] = stats["total_flush_seconds"] / stats["flushes"] if stats["flushes"] else 0.0
+        return stats
+
+    def _next_batch(self):
+        """Collect up to flush_size samples, waiting at most flush_interval for the batch to fill."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            if self._stopping.is_set():
+                # Draining: take whatever is left without waiting
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                # Wait in short slices so that stop() doesn't sit out a long flush_interval
+                batch.append(self._queue.get(timeout=min(remaining, STOP_POLL_SECONDS)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _run(self):
+        """Flusher loop: drain the queue in batches until stopped and empty."""
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            elif self._stopping.is_set():
+                break
+
+    def _flush(self, batch):
+        """Write one batch, retrying transient failures before giving up on it."""
+        started = time.perf_counter()
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                results = ingest_batch(self.db_path, batch, self.allowed_metrics)
+                break
+            except Exception as e:
+                logging.warning(f"Write-behind flush of {len(batch)} samples failed (attempt {attempt}/{self.max_retries}): {e}")
+                if attempt < self.max_retries:
+                    time.sleep(0.5 * attempt)
+        else:
+            logging.error(f"Dropping {len(batch)} samples after {self.max_retries} failed flush attempts")
+            with self._stats_lock:
+                self._stats["failed_flushes"] += 1
+                self._stats["dropped_samples"] += len(batch)
+            return
+
+        elapsed = time.perf_counter() - started
+        rejected = [result for result in results if result["status"] == "rejected"]
+        duplicates = sum(1 for result in results if result["status"] == "duplicate")
+        if rejected:
+            # Samples were validated when queued, so this points at a mismatch worth investigating
+            logging.warning(f"Write-behind flush rejected {len(rejected)} of {len(batch)} samples (first error: {rejected[0]['error']})")
+        with self._stats_lock:
+            self._stats["rejected_samples"] += len(rejected)
+            self._stats["duplicate_samples"] += duplicates
+            self._stats["flushes"] += 1
+            self._stats["flushed_samples"] += len(batch)
+            self._stats["last_flush_size"] = len(batch)
+            self._stats["max_flush_size"] = max(self._stats["max_flush_size"], len(batch))
+            self._stats["last_flush_seconds"] = elapsed
+            self._stats["max_flush_seconds"] = max(self._stats["max_flush_seconds"], elapsed)
+            self._stats["total_flush_seconds"] += elapsed
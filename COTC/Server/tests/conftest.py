@@ -0,0 +1,45 @@
+"""
+Shared pytest fixtures.
+
+Run the suite from COTC/Server with: python -m pytest -q
+"""
+import os
+import sys
+import pytest
+from flask import Flask
+
+SERVER_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The agent's modules (collectors.*) are tested here too
+CLIENT_ROOT = os.path.join(os.path.dirname(SERVER_ROOT), "Client")
+for root in (SERVER_ROOT, CLIENT_ROOT):
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+from database.models import init_database
+from database.schema import dispose_engines
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Path of a freshly initialised database, private to the test."""
+    path = str(tmp_path / "test.db")
+    init_database(path)
+    yield path
+    dispose_engines()
+
+
+@pytest.fixture
+def make_client(db_path):
+    """Factory for Flask test clients of the API backed by db_path, with extra config entries."""
+    from api.endpoints import register_routes
+
+    def make(**config):
+        app = Flask(__name__)
+        register_routes(app, {"database_path": db_path, "system_metrics": ["cpu_usage", "ram_usage"], **config})
+        return app.test_client()
+    return make
+
+@pytest.fixture
+def client(make_client):
+    """Flask test client for the API, backed by db_path."""
+    return make_client()
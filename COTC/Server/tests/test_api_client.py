@@ -0,0 +1,193 @@
+import gzip
+import json
+import threading
+import pytest
+from collectors.api_client import APIClient
+from collectors.spool import Spool
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body if body is not None else {}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+class FakeServer:
+    """Stands in for _make_request: records the decoded batches and answers with queued status codes."""
+
+    def __init__(self):
+        self.batches = []
+        self.statuses = []
+        self.received = threading.Condition()
+
+    def __call__(self, method, endpoint, data=None, headers=None, **kwargs):
+        assert (method, endpoint) == ("POST", "/metrics/batch")
+        assert headers["Content-Encoding"] == "gzip"
+        with self.received:
+            self.batches.append(json.loads(gzip.decompress(data))["samples"])
+            self.received.notify_all()
+            status = self.statuses.pop(0) if self.statuses else 200
+        return None if status is None else FakeResponse(status)
+
+    def wait_for(self, count, timeout=5):
+        with self.received:
+            return self.received.wait_for(lambda: len(self.batches) >= count, timeout)
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+def make_api_client(server, **batching):
+    client = APIClient("http://monitor", batching={"enabled": True, "max_delay": 3600, **batching})
+    client._make_request = server
+    return client
+
+def prices(batch):
+    return [sample["price"] for sample in batch]
+
+
+def test_full_batch_is_sent_as_one_compressed_request(server):
+    client = make_api_client(server, max_samples=3)
+    try:
+        for price in (1.0, 2.0, 3.0):
+            client.send_stock_data("ACME", price)
+        assert server.wait_for(1)
+    finally:
+        client.close()
+
+    assert [prices(batch) for batch in server.batches] == [[1.0, 2.0, 3.0]]
+    assert all(sample["timestamp"] for sample in server.batches[0])
+
+def test_oldest_sample_is_sent_after_max_delay(server):
+    client = make_api_client(server, max_samples=100, max_delay=0.1)
+    try:
+        client.send_stock_data("ACME", 1.0)
+        assert server.wait_for(1)
+    finally:
+        client.close()
+    assert prices(server.batches[0]) == [1.0]
+
+def test_flush_splits_into_batches_of_max_samples(server):
+    # Filled directly, so no flusher thread is started and only flush() sends
+    client = make_api_client(server, max_samples=2)
+    with client._condition:
+        client._pending = [{"type": "stock", "symbol": "ACME", "price": float(price)} for price in range(5)]
+
+    assert client.flush()
+    assert [prices(batch) for batch in server.batches] == [[0.0, 1.0], [2.0, 3.0], [4.0]]
+
+@pytest.mark.parametrize("status", [None, 429, 503])
+def test_unsent_samples_are_requeued_ahead_of_newer_ones(server, status):
+    client = make_api_client(server, max_samples=2)
+    with client._condition:
+        client._pending = [{"type": "stock", "symbol": "ACME", "price": float(price)} for price in range(4)]
+    server.statuses = [200, status]
+
+    assert not client.flush()
+    with client._condition:
+        client._pending.append({"type": "stock", "symbol": "ACME", "price": 4.0})
+    assert client.flush()
+
+    assert [prices(batch) for batch in server.batches] == [[0.0, 1.0], [2.0, 3.0], [2.0, 3.0], [4.0]]
+
+def test_batches_refused_as_invalid_are_not_retried(server):
+    client = make_api_client(server, max_samples=2)
+    with client._condition:
+        client._pending = [{"type": "stock", "symbol": "ACME", "price": float(price)} for price in range(2)]
+    server.statuses = [400]
+
+    assert client.flush()
+    assert client._pending == []
+
+def test_requeued_samples_are_capped_at_max_pending(server):
+    client = make_api_client(server, max_samples=10, max_pending=3)
+    with client._condition:
+        client._pending = [{"type": "stock", "symbol": "ACME", "price": float(price)} for price in range(5)]
+    server.statuses = [503]
+
+    assert not client.flush()
+    # The oldest are dropped first
+    assert prices(client._pending) == [2.0, 3.0, 4.0]
+
+def test_spool_is_replayed_in_order_on_the_flusher_thread(server, tmp_path):
+    spool = Spool(tmp_path / "spool.db")
+    client = APIClient("http://monitor", spool=spool)
+    online = threading.Event()
+    replaying = threading.Event()
+    release = threading.Event()
+
+    def make_request(method, endpoint, **kwargs):
+        if method == "PUT":
+            return FakeResponse(200) if online.is_set() else None
+        replaying.set()
+        assert release.wait(5)
+        return server(method, endpoint, **kwargs)
+    client._make_request = make_request
+
+    try:
+        for price in (1.0, 2.0, 3.0):
+            assert not client.send_stock_data("ACME", price)
+        assert len(spool) == 3
+
+        online.set()
+        # The send returns while the replay is still waiting on the server
+        assert client.send_stock_data("ACME", 4.0)
+        assert replaying.wait(5)
+        assert client._flush_thread is not None and threading.current_thread() is not client._flush_thread
+        release.set()
+        assert server.wait_for(1)
+    finally:
+        release.set()
+        client.close()
+
+    assert [prices(batch) for batch in server.batches] == [[1.0, 2.0, 3.0]]
+    assert len(spool) == 0
+    spool.close()
+
+def test_flush_sends_spooled_samples_before_queued_ones(server, tmp_path):
+    spool = Spool(tmp_path / "spool.db")
+    spool.append([{"type": "stock", "symbol": "ACME", "price": float(price)} for price in range(3)])
+    client = APIClient("http://monitor", batching={"enabled": True, "max_samples": 2}, spool=spool, replay_batch_size=2)
+    client._make_request = server
+    with client._condition:
+        client._pending = [{"type": "stock", "symbol": "ACME", "price": float(price)} for price in (3, 4)]
+
+    assert client.flush()
+    assert [prices(batch) for batch in server.batches] == [[0.0, 1.0], [2.0], [3.0, 4.0]]
+    assert len(spool) == 0
+    spool.close()
+
+def test_samples_unsent_during_replay_join_the_spool(server, tmp_path):
+    spool = Spool(tmp_path / "spool.db")
+    spool.append([{"type": "stock", "symbol": "ACME", "price": 0.0}])
+    client = APIClient("http://monitor", batching={"enabled": True, "max_samples": 2}, spool=spool)
+    client._make_request = server
+    with client._condition:
+        client._pending = [{"type": "stock", "symbol": "ACME", "price": 1.0}]
+    server.statuses = [503]
+
+    assert not client.flush()
+    assert [sample["price"] for sample in spool.peek(10)[0]] == [0.0, 1.0]
+    spool.close()
+
+def test_batches_are_accepted_by_the_server(db_path, make_client):
+    from database.models import get_stock_history
+
+    flask_client = make_client()
+    client = APIClient("http://monitor", batching={"enabled": True, "max_samples": 10})
+
+    def make_request(method, endpoint, **kwargs):
+        response = flask_client.open(endpoint, method=method, data=kwargs["data"], headers=kwargs["headers"])
+        return FakeResponse(response.status_code, response.get_json())
+    client._make_request = make_request
+
+    assert client.send_batch([
+        {"type": "stock", "symbol": "ACME", "price": 10.0 + minute, "timestamp": f"2024-01-01T00:0{minute}:00"}
+        for minute in range(3)
+    ])
+    assert [row["price"] for row in get_stock_history(db_path, "ACME")] == [10.0, 11.0, 12.0]
@@ -0,0 +1,50 @@
+from sqlalchemy import event
+from database.models import get_session
+from database.schema import get_session_factory, Device, StockData, SystemMetric
+
+
+def count_rows(db_path, model):
+    session = get_session(db_path)
+    try:
+        return session.query(model).count()
+    finally:
+        session.close()
+
+
+def test_mixed_batch_is_stored_in_one_commit_with_per_item_status(client, db_path):
+    commits = []
+    event.listen(get_session_factory(db_path), "after_commit", lambda session: commits.append(session))
+    samples = [
+        {"type": "system", "mac_address": "aa:bb:cc:dd:ee:01", "metrics": {"cpu_usage": 10, "ram_usage": 20},
+         "timestamp": "2024-01-01T00:00:00"},
+        {"type": "system", "mac_address": "aa:bb:cc:dd:ee:02", "metrics": {"cpu_usage": 30},
+         "timestamp": 1704067260},
+        {"type": "stock", "symbol": "acme", "price": 12.5, "timestamp": "2024-01-01T00:00:00"},
+        {"type": "stock", "symbol": "INIT", "price": -1},
+        {"type": "system", "metrics": {"cpu_usage": 1}},
+        {"type": "stock", "symbol": "INIT", "price": 3.0, "timestamp": "not a time"},
+        "not an object"
+    ]
+
+    response = client.post("/metrics/batch", json={"samples": samples})
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert [result["status"] for result in body["results"]] == ["stored"] * 3 + ["rejected"] * 4
+    assert [result["index"] for result in body["results"]] == list(range(len(samples)))
+    assert body["accepted"] == 3 and body["rejected"] == 4
+    assert len(commits) == 1
+    assert count_rows(db_path, Device) == 2
+    assert count_rows(db_path, SystemMetric) == 3
+    assert count_rows(db_path, StockData) == 1
+
+def test_bare_list_is_accepted(client):
+    response = client.post("/metrics/batch", json=[{"symbol": "ACME", "price": 1.0}])
+    assert response.get_json()["accepted"] == 1
+
+def test_rejects_non_lists_and_oversized_batches(make_client):
+    client = make_client(batch_max_samples=2)
+
+    assert client.post("/metrics/batch", json={"samples": "nope"}).status_code == 400
+    oversized = [{"symbol": "ACME", "price": 1.0}] * 3
+    assert client.post("/metrics/batch", json=oversized).status_code == 413
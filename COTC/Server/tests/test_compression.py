@@ -0,0 +1,62 @@
+import gzip
+import json
+import zlib
+import pytest
+from database.models import get_stock_history
+
+SAMPLES = [{"type": "stock", "symbol": "ACME", "price": 10.0 + index, "timestamp": f"2024-01-01T00:0{index}:00"}
+           for index in range(3)]
+
+
+def post(client, body, encoding):
+    return client.post("/metrics/batch", data=body, headers={"Content-Type": "application/json", "Content-Encoding": encoding})
+
+def payload(samples=SAMPLES):
+    return json.dumps({"samples": samples}).encode("utf-8")
+
+
+@pytest.mark.parametrize("encoding, compress", [
+    ("gzip", gzip.compress),
+    ("deflate", zlib.compress),
+    ("identity", lambda body: body)
+])
+def test_compressed_batches_are_stored(client, db_path, encoding, compress):
+    response = post(client, compress(payload()), encoding)
+    assert response.status_code == 200
+    assert response.get_json()["accepted"] == 3
+    assert [row["price"] for row in get_stock_history(db_path, "ACME")] == [10.0, 11.0, 12.0]
+
+def test_oversized_bodies_are_refused_without_inflating_them(make_client):
+    client = make_client(max_decompressed_bytes=1024)
+    # Highly compressible: a few hundred bytes on the wire, megabytes once inflated
+    bomb = gzip.compress(payload([{"type": "stock", "symbol": "ACME", "price": 1.0, "note": "x" * 4 * 1024 * 1024}]))
+    assert len(bomb) < 16 * 1024
+
+    response = post(client, bomb, "gzip")
+    assert response.status_code == 413
+    assert "exceeds 1024 bytes" in response.get_json()["error"]
+    assert post(client, gzip.compress(payload()), "gzip").status_code == 200
+
+@pytest.mark.parametrize("body", [
+    b"not gzip at all",
+    gzip.compress(payload())[:-12],
+    gzip.compress(payload())[:10] + b"\x00" * 32
+], ids=["garbage", "truncated", "corrupt"])
+def test_corrupt_bodies_answer_400(client, db_path, body):
+    response = post(client, body, "gzip")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid compressed body"}
+    assert get_stock_history(db_path, "ACME") == []
+
+def test_unknown_encoding_answers_415(client):
+    assert post(client, payload(), "br").status_code == 415
+
+def test_zstd(make_client, db_path):
+    zstandard = pytest.importorskip("zstandard")
+    client = make_client(max_decompressed_bytes=1024)
+    compressor = zstandard.ZstdCompressor()
+
+    assert post(client, compressor.compress(payload()), "zstd").status_code == 200
+    assert len(get_stock_history(db_path, "ACME")) == 3
+    assert post(client, compressor.compress(b" " * 1024 * 1024), "zstd").status_code == 413
+    assert post(client, b"\x28\xb5\x2f\xfd garbage", "zstd").status_code == 400
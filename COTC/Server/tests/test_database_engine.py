@@ -0,0 +1,32 @@
+from sqlalchemy import text
+from database.schema import DATABASE_OPTIONS, configure_database, dispose_engines, get_engine, get_session_factory
+
+
+def pragma(connection, name):
+    return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_one_engine_and_session_factory_per_path(db_path, tmp_path):
+    assert get_engine(db_path) is get_engine(db_path)
+    assert get_session_factory(db_path) is get_session_factory(db_path)
+    assert get_engine(db_path) is not get_engine(str(tmp_path / "other.db"))
+
+def test_every_pooled_connection_gets_the_pragmas(db_path):
+    engine = get_engine(db_path)
+    # Hold two connections at once so the pool has to open a second one
+    with engine.connect() as first, engine.connect() as second:
+        for connection in (first, second):
+            assert pragma(connection, "journal_mode") == "wal"
+            assert pragma(connection, "synchronous") == 1  # NORMAL
+            assert pragma(connection, "busy_timeout") == DATABASE_OPTIONS["busy_timeout"]
+            assert pragma(connection, "cache_size") == DATABASE_OPTIONS["cache_size"]
+            assert pragma(connection, "auto_vacuum") == 2  # INCREMENTAL
+
+def test_configured_options_apply_to_engines_created_afterwards(db_path, monkeypatch):
+    monkeypatch.setattr("database.schema.DATABASE_OPTIONS", dict(DATABASE_OPTIONS))
+    dispose_engines()
+    configure_database({"busy_timeout": 1234, "synchronous": "FULL"})
+
+    with get_engine(db_path).connect() as connection:
+        assert pragma(connection, "busy_timeout") == 1234
+        assert pragma(connection, "synchronous") == 2  # FULL
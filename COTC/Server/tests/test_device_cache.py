@@ -0,0 +1,41 @@
+from database.device_cache import get_device_cache
+from database.ingestion import resolve_device_pk
+
+OLD_MAC = "aa:bb:cc:dd:ee:01"
+NEW_MAC = "aa:bb:cc:dd:ee:02"
+
+
+def register(client, device_id, mac_address):
+    response = client.post("/devices/register", json={
+        "device_id": device_id, "mac_address": mac_address, "hostname": "host"
+    })
+    assert response.status_code in (200, 201)
+
+
+def test_reregistering_with_a_new_device_id_drops_the_old_one(client, db_path):
+    register(client, "old-id", OLD_MAC)
+    pk = resolve_device_pk(db_path, device_id="old-id", mac_address=OLD_MAC)
+    cache = get_device_cache(db_path)
+    assert cache.lookup(device_id="old-id") == pk
+
+    # Same MAC, freshly generated device_id
+    register(client, "new-id", OLD_MAC)
+
+    assert cache.lookup(device_id="old-id") is None
+    assert resolve_device_pk(db_path, device_id="old-id") is None
+    assert resolve_device_pk(db_path, device_id="new-id") == pk
+    assert resolve_device_pk(db_path, mac_address=OLD_MAC) == pk
+
+def test_mac_migration_drops_the_old_mac(client, db_path):
+    register(client, "device", OLD_MAC)
+    pk = resolve_device_pk(db_path, mac_address=OLD_MAC)
+    cache = get_device_cache(db_path)
+    assert cache.lookup(mac_address=OLD_MAC) == pk
+
+    # Same device_id, new network interface
+    register(client, "device", NEW_MAC)
+
+    assert cache.lookup(mac_address=OLD_MAC) is None
+    assert resolve_device_pk(db_path, mac_address=NEW_MAC) == pk
+    # The old MAC no longer belongs to this device, so a sample from it starts a new one
+    assert resolve_device_pk(db_path, mac_address=OLD_MAC) not in (None, pk)
@@ -0,0 +1,61 @@
+import math
+import random
+import pytest
+from dashboard.utils.downsample import lttb, min_max_envelope
+
+
+def noisy_series(length, seed=1):
+    generator = random.Random(seed)
+    xs = [float(index) for index in range(length)]
+    ys = [math.sin(index / 50) * 10 + generator.uniform(-1, 1) for index in range(length)]
+    return xs, ys
+
+
+@pytest.mark.parametrize("select", [lttb, min_max_envelope])
+def test_keeps_endpoints_and_returns_threshold_points(select):
+    xs, ys = noisy_series(10000)
+
+    indices = select(xs, ys, 500)
+
+    assert indices[0] == 0 and indices[-1] == len(xs) - 1
+    assert len(indices) == 500
+    assert indices == sorted(set(indices))
+
+@pytest.mark.parametrize("select", [lttb, min_max_envelope])
+@pytest.mark.parametrize("length", [0, 1, 2, 499, 500])
+def test_short_series_pass_through(select, length):
+    xs, ys = noisy_series(length)
+    assert select(xs, ys, 500) == list(range(length))
+
+def test_lttb_follows_a_single_spike():
+    xs = [float(index) for index in range(1000)]
+    ys = [0.0] * 1000
+    ys[437] = 100.0
+
+    assert 437 in lttb(xs, ys, 50)
+
+def test_envelope_keeps_every_spike_and_the_extremes():
+    xs, ys = noisy_series(10000)
+    spikes = {index: 100.0 + index for index in range(250, 10000, 997)}
+    dips = {index: -100.0 - index for index in range(600, 10000, 1201)}
+    for index, value in {**spikes, **dips}.items():
+        ys[index] = value
+
+    indices = min_max_envelope(xs, ys, 200)
+
+    assert set(spikes) | set(dips) <= set(indices)
+    selected = [ys[index] for index in indices]
+    assert max(selected) == max(ys) and min(selected) == min(ys)
+
+def test_envelope_buckets_hold_their_min_and_max():
+    xs, ys = noisy_series(1000)
+    indices = min_max_envelope(xs, ys, 102)
+
+    # The inner 998 points form 50 buckets, each represented by its lowest and highest point
+    bucket_size = 998 / 50
+    inner = indices[1:-1]
+    assert len(inner) == 100
+    for bucket in range(50):
+        values = ys[int(bucket * bucket_size) + 1:int((bucket + 1) * bucket_size) + 1]
+        kept = {ys[index] for index in inner[2 * bucket:2 * bucket + 2]}
+        assert kept == {min(values), max(values)}
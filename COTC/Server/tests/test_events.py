@@ -0,0 +1,77 @@
+import json
+from database.device_cache import get_device_cache
+from database.events import EventBroker, get_event_broker
+from database.ingestion import ingest_batch
+from database.models import get_session
+from database.query_cache import SYSTEM_METRICS, STOCK_DATA, DEVICES
+from database.schema import Device
+
+
+def write_metric(db_path, mac, value=1.0):
+    ingest_batch(db_path, [{"type": "system", "mac_address": mac, "metrics": {"cpu_usage": value}}])
+
+def write_price(db_path, symbol, price=1.0):
+    ingest_batch(db_path, [{"type": "stock", "symbol": symbol, "price": price}])
+
+def device_pk(db_path, mac):
+    return get_device_cache(db_path).lookup(mac_address=mac)
+
+
+def test_subscriber_only_gets_the_keys_it_watches():
+    broker = EventBroker()
+    everything = broker.subscribe()
+    scoped = broker.subscribe({SYSTEM_METRICS: [7], STOCK_DATA: []})
+
+    broker.publish(["system_metrics:3", "stock_data:ACME"])
+    assert everything.wait(0) == {"system_metrics:3", "stock_data:ACME"}
+    assert scoped.wait(0) is None
+
+    broker.publish(["system_metrics:7", "devices"])
+    assert everything.wait(0) == {"system_metrics:7", "devices"}
+    assert scoped.wait(0) == {"system_metrics:7", "devices"}
+
+def test_ingest_publishes_the_written_devices_and_symbols(db_path):
+    subscription = get_event_broker(db_path).subscribe()
+    write_metric(db_path, "02:00:00:00:00:01")
+    write_price(db_path, "acme")
+
+    pk = device_pk(db_path, "02:00:00:00:00:01")
+    topics = subscription.wait(0)
+    assert f"{SYSTEM_METRICS}:{pk}" in topics and f"{STOCK_DATA}:ACME" in topics
+    assert SYSTEM_METRICS not in topics and STOCK_DATA not in topics
+    assert DEVICES in topics
+
+def test_events_stream_is_scoped_to_the_selection(db_path, make_client):
+    write_metric(db_path, "02:00:00:00:00:01")
+    write_metric(db_path, "02:00:00:00:00:02")
+    write_price(db_path, "ACME")
+    write_price(db_path, "OTHER")
+    session = get_session(db_path)
+    try:
+        watched = session.query(Device).filter_by(mac_address="02:00:00:00:00:01").one().device_id
+    finally:
+        session.close()
+
+    client = make_client(live_updates={"enabled": True, "heartbeat_seconds": 0.2, "min_push_interval": 0})
+    response = client.get(f"/events?device_id={watched}&symbol=acme")
+    chunks = iter(response.response)
+    try:
+        assert next(chunks).startswith(b"retry:")
+
+        # Another device's metrics and another symbol's price wake nobody watching this selection
+        write_metric(db_path, "02:00:00:00:00:02")
+        write_price(db_path, "OTHER")
+        assert next(chunks).startswith(b": keep-alive")
+
+        write_metric(db_path, "02:00:00:00:00:01")
+        write_price(db_path, "ACME")
+        topics = set()
+        while len(topics) < 2:
+            chunk = next(chunks)
+            if chunk.startswith(b"event: update"):
+                topics.update(json.loads(chunk.split(b"data: ", 1)[1])["topics"])
+        pk = device_pk(db_path, "02:00:00:00:00:01")
+        assert topics == {f"{SYSTEM_METRICS}:{pk}", f"{STOCK_DATA}:ACME"}
+    finally:
+        response.close()
+    assert get_event_broker(db_path).get_stats()["subscribers"] == 0
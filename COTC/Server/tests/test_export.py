@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+import pytest
+from api.export import EXPORT_CHUNK_ROWS, encode_csv
+from database.ingestion import ingest_batch
+from database.models import get_session
+from database.schema import Device
+
+START = datetime(2024, 1, 1)
+MACS = ("aa:bb:cc:dd:ee:01", "aa:bb:cc:dd:ee:02")
+
+
+@pytest.fixture
+def history(db_path):
+    """Ten minutes of cpu_usage and ram_usage for two devices and prices for two symbols."""
+    samples = []
+    for minute in range(10):
+        timestamp = START + timedelta(minutes=minute)
+        for mac in MACS:
+            samples.append({"type": "system", "mac_address": mac, "timestamp": timestamp,
+                            "metrics": {"cpu_usage": float(minute), "ram_usage": 50.0}})
+        samples.append({"type": "stock", "symbol": "ACME", "price": 100.0 + minute, "timestamp": timestamp})
+        samples.append({"type": "stock", "symbol": "OTHER", "price": 1.0, "timestamp": timestamp})
+    ingest_batch(db_path, samples)
+
+    session = get_session(db_path)
+    try:
+        return {mac: device_id for mac, device_id in session.query(Device.mac_address, Device.device_id)}
+    finally:
+        session.close()
+
+def export_csv(client, query):
+    response = client.get(f"/export?{query}")
+    assert response.status_code == 200
+    return list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_csv_export_of_every_sample(client, history):
+    response = client.get("/export")
+    assert response.mimetype == "text/csv"
+    assert response.headers["Content-Disposition"] == 'attachment; filename="system_history.csv"'
+
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 10 * 2 * 2
+    assert list(rows[0]) == ["id", "timestamp", "device_id", "hostname", "metric_name", "metric_value"]
+    assert rows[0]["timestamp"] == START.isoformat()
+    assert [row["timestamp"] for row in rows] == sorted(row["timestamp"] for row in rows)
+
+def test_ndjson_export(client, history):
+    response = client.get("/export?type=stock&format=ndjson&symbol=acme")
+    assert response.mimetype == "application/x-ndjson"
+
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["price"] for row in rows] == [100.0 + minute for minute in range(10)]
+    assert set(rows[0]) == {"id", "timestamp", "symbol", "price"}
+    assert {row["symbol"] for row in rows} == {"ACME"}
+
+def test_filters(client, history):
+    device_id = history[MACS[0]]
+    rows = export_csv(client, f"device_id={device_id}&metric=cpu_usage")
+    assert {(row["device_id"], row["metric_name"]) for row in rows} == {(device_id, "cpu_usage")}
+    assert len(rows) == 10
+
+    since, until = START + timedelta(minutes=2), START + timedelta(minutes=4)
+    rows = export_csv(client, f"type=stock&symbol=ACME&since={since.isoformat()}&until={until.isoformat()}")
+    assert [float(row["price"]) for row in rows] == [102.0, 103.0, 104.0]
+
+def test_rejects_unknown_type_and_format(client, history):
+    assert client.get("/export?type=other").status_code == 400
+    assert client.get("/export?format=xml").status_code == 400
+
+def test_export_is_streamed_in_chunks(client, db_path):
+    ingest_batch(db_path, [
+        {"type": "stock", "symbol": "ACME", "price": 1.0 + index, "timestamp": START + timedelta(seconds=index)}
+        for index in range(EXPORT_CHUNK_ROWS * 2 + 1)
+    ])
+
+    response = client.get("/export?type=stock")
+    assert response.is_streamed
+    # A header chunk, then one chunk per EXPORT_CHUNK_ROWS rows
+    chunks = list(response.response)
+    assert len(chunks) == 4
+    assert sum(chunk.count(b"\n") for chunk in chunks) == EXPORT_CHUNK_ROWS * 2 + 2
+
+def test_encoders_consume_rows_lazily():
+    consumed = []
+
+    def rows():
+        for index in range(5):
+            consumed.append(index)
+            yield (index,)
+
+    chunks = encode_csv(["id"], rows(), chunk_rows=2)
+    assert next(chunks) == "id\r\n"
+    assert next(chunks) == "0\r\n1\r\n"
+    assert consumed == [0, 1]
+
+def test_parquet_export(client, history):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    response = client.get("/export?type=stock&format=parquet&symbol=ACME")
+
+    table = pyarrow_parquet.read_table(io.BytesIO(response.get_data()))
+    assert table.column_names == ["id", "timestamp", "symbol", "price"]
+    assert table.column("price").to_pylist() == [100.0 + minute for minute in range(10)]
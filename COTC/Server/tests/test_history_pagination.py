@@ -0,0 +1,70 @@
+import datetime
+from database.ingestion import ingest_batch
+from database.models import get_stock_history, get_stock_history_page, get_system_metrics_history_page
+
+START = datetime.datetime(2024, 1, 1)
+MAC = "aa:bb:cc:dd:ee:ff"
+
+
+def store(db_path):
+    """Store 25 prices and CPU samples, three per timestamp so that pages split ties."""
+    samples = []
+    for step in range(25):
+        timestamp = START + datetime.timedelta(minutes=step // 3)
+        samples.append({"type": "stock", "symbol": "ACME", "price": float(step + 1), "timestamp": timestamp})
+        samples.append({"type": "system", "mac_address": MAC, "metrics": {"cpu_usage": float(step)}, "timestamp": timestamp})
+    ingest_batch(db_path, samples)
+
+def walk(fetch_page):
+    """Follow next_cursor from the first page to the last and return every item."""
+    items = []
+    page = fetch_page(None, None)
+    while True:
+        items += page["items"]
+        if page["next_cursor"] is None:
+            return items
+        page = fetch_page(page["next_cursor"]["after_timestamp"], page["next_cursor"]["after_id"])
+
+
+def test_pages_cover_every_row_once_even_across_timestamp_ties(db_path):
+    store(db_path)
+
+    items = walk(lambda after_timestamp, after_id: get_stock_history_page(
+        db_path, "ACME", after_timestamp=after_timestamp and datetime.datetime.fromisoformat(after_timestamp),
+        after_id=after_id, limit=4
+    ))
+
+    assert [item["price"] for item in items] == [float(step + 1) for step in range(25)]
+    assert items == get_stock_history(db_path, "ACME")
+
+def test_pages_stay_within_the_range(db_path):
+    store(db_path)
+    since, until = START + datetime.timedelta(minutes=2), START + datetime.timedelta(minutes=5)
+
+    items = walk(lambda after_timestamp, after_id: get_system_metrics_history_page(
+        db_path, "cpu_usage", since=since, until=until,
+        after_timestamp=after_timestamp and datetime.datetime.fromisoformat(after_timestamp),
+        after_id=after_id, limit=5
+    ))
+
+    assert [item["metric_value"] for item in items] == [float(step) for step in range(6, 18)]
+
+def test_last_page_has_no_cursor(db_path):
+    store(db_path)
+    assert get_stock_history_page(db_path, "ACME", limit=25)["next_cursor"] is None
+    assert get_stock_history_page(db_path, "ACME", limit=24)["next_cursor"] is not None
+    assert get_stock_history_page(db_path, "NONE")["items"] == []
+
+def test_history_endpoints_follow_cursors(client, db_path):
+    store(db_path)
+
+    for url in ("/metrics/stock/acme/history?resolution=raw&limit=7",
+                "/metrics/system/history?metric=cpu_usage&resolution=raw&limit=7"):
+        items = walk(lambda after_timestamp, after_id: client.get(
+            url + (f"&after_timestamp={after_timestamp}&after_id={after_id}" if after_timestamp else "")
+        ).get_json())
+        assert len(items) == 25
+        assert [item["id"] for item in items] == sorted(item["id"] for item in items)
+
+    assert client.get("/metrics/stock/ACME/history?limit=0").status_code == 400
+    assert client.get("/metrics/stock/ACME/history?since=yesterday").status_code == 400
@@ -0,0 +1,131 @@
+import datetime
+from database.ingestion import ingest_batch
+from database.models import (
+    fetch_devices, pick_resolution, get_device_metrics_history_columns, get_stock_history_columns, get_stock_resolution,
+    get_system_metrics_resolution, get_session
+)
+from database.query_cache import get_query_cache
+from database.rollups import rebuild_rollups
+from database.schema import StockData, StockDataRollup, get_engine
+
+NOW = datetime.datetime.now().replace(microsecond=0)
+
+
+def store_hourly(db_path, hours, device="aa:bb:cc:dd:ee:ff", symbol="ACME"):
+    """Store one CPU sample and one price per hour for the last hours hours, two per hour for averaging."""
+    samples = []
+    for hour in range(hours):
+        for minute, value in ((0, 10.0), (30, 20.0)):
+            timestamp = (NOW - datetime.timedelta(hours=hour, minutes=minute)).isoformat()
+            samples.append({"type": "system", "mac_address": device, "hostname": "host",
+                            "metrics": {"cpu_usage": value}, "timestamp": timestamp})
+            samples.append({"type": "stock", "symbol": symbol, "price": value, "timestamp": timestamp})
+    ingest_batch(db_path, samples)
+
+
+def test_pick_resolution_prefers_the_coarsest_that_fills_min_points():
+    assert pick_resolution("system", NOW - datetime.timedelta(hours=1), NOW, min_points=200) is None
+    assert pick_resolution("system", NOW - datetime.timedelta(days=2), NOW, min_points=200) == 60
+    assert pick_resolution("system", NOW - datetime.timedelta(days=30), NOW, min_points=200) == 3600
+    assert pick_resolution("system", NOW - datetime.timedelta(days=400), NOW, min_points=200) == 86400
+    assert pick_resolution("system", None, NOW, min_points=200) is None
+
+def test_history_endpoint_reads_rollups_for_long_ranges(client, db_path):
+    store_hourly(db_path, 24 * 10)
+    since = (NOW - datetime.timedelta(days=10)).isoformat()
+
+    page = client.get(f"/metrics/system/history?metric=cpu_usage&since={since}&limit=5000").get_json()
+    assert page["resolution"] == 3600
+    assert all(item["avg"] == 15.0 and item["count"] == 2 for item in page["items"][1:-1])
+
+    recent = (NOW - datetime.timedelta(minutes=90)).isoformat()
+    page = client.get(f"/metrics/system/history?metric=cpu_usage&since={recent}").get_json()
+    assert page["resolution"] == 0
+    assert {item["metric_value"] for item in page["items"]} <= {10.0, 20.0}
+
+    page = client.get(f"/metrics/stock/ACME/history?since={since}&resolution=raw").get_json()
+    assert page["resolution"] == 0
+    assert client.get("/metrics/stock/ACME/history?resolution=5").status_code == 400
+
+def test_rollup_pages_follow_the_cursor(client, db_path):
+    store_hourly(db_path, 24 * 10)
+    since = (NOW - datetime.timedelta(days=10)).isoformat()
+
+    timestamps = []
+    url = f"/metrics/stock/ACME/history?since={since}&resolution=3600&limit=100"
+    page = client.get(url).get_json()
+    while True:
+        timestamps += [item["timestamp"] for item in page["items"]]
+        if not page["next_cursor"]:
+            break
+        cursor = page["next_cursor"]
+        page = client.get(f"{url}&after_timestamp={cursor['after_timestamp']}&after_id={cursor['after_id']}").get_json()
+
+    assert timestamps == sorted(set(timestamps))
+    assert len(timestamps) >= 24 * 10
+
+def test_dashboard_history_uses_rollups_when_long(db_path):
+    store_hourly(db_path, 24 * 10)
+
+    resolution = get_stock_resolution(db_path, "ACME", min_points=200)
+    assert resolution == 3600
+    history = get_stock_history_columns(db_path, "ACME", resolution=resolution)
+    assert len(history["price"]) < 24 * 10 * 2
+    assert history["min"][1] == 10.0 and history["max"][1] == 20.0
+
+    device_id = fetch_devices(db_path)[0]["device_id"]
+    device_history = get_device_metrics_history_columns(db_path, device_id, ("cpu_usage",), resolution=3600)
+    assert device_history["cpu_usage"]["metric_value"] == history["price"]
+
+def store_prices(db_path, *timestamps):
+    ingest_batch(db_path, [
+        {"type": "stock", "symbol": "ACME", "price": float(index), "timestamp": timestamp}
+        for index, timestamp in enumerate(timestamps, 1)
+    ])
+
+def bucket_counts(db_path, resolution):
+    session = get_session(db_path)
+    try:
+        return dict(
+            session.query(StockDataRollup.bucket_start, StockDataRollup.sample_count)
+            .filter(StockDataRollup.resolution == resolution)
+        )
+    finally:
+        session.close()
+
+def test_rebuild_aggregates_the_partial_oldest_bucket(db_path):
+    day = datetime.datetime(2024, 1, 1)
+    store_prices(db_path, day.replace(hour=10, minute=30), day.replace(hour=10, minute=45), day.replace(hour=11, minute=15))
+    with get_engine(db_path).begin() as conn:
+        conn.exec_driver_sql("DELETE FROM stock_data_rollups")
+
+    rebuild_rollups(get_engine(db_path), "stock")
+
+    assert bucket_counts(db_path, 3600) == {day.replace(hour=10): 2, day.replace(hour=11): 1}
+    assert bucket_counts(db_path, 86400) == {day: 3}
+
+def test_rebuild_keeps_an_oldest_bucket_holding_pruned_rows(db_path):
+    day = datetime.datetime(2024, 1, 1)
+    store_prices(db_path, day.replace(hour=10, minute=30), day.replace(hour=10, minute=45), day.replace(hour=11, minute=15))
+    # Retention pruned the oldest raw row, which the rollups still account for
+    session = get_session(db_path)
+    session.query(StockData).filter(StockData.timestamp < day.replace(hour=10, minute=40)).delete()
+    session.commit()
+    session.close()
+
+    rebuild_rollups(get_engine(db_path), "stock")
+
+    assert bucket_counts(db_path, 3600) == {day.replace(hour=10): 2, day.replace(hour=11): 1}
+    assert bucket_counts(db_path, 86400) == {day: 3}
+
+def test_whole_history_resolution_starts_at_the_first_sample_not_midnight(db_path):
+    evening = datetime.datetime(2024, 1, 1, 21)
+    store_prices(db_path, *(evening + datetime.timedelta(minutes=minute) for minute in range(0, 180, 10)))
+    ingest_batch(db_path, [{"type": "system", "mac_address": "aa:bb:cc:dd:ee:ff", "metrics": {"cpu_usage": 1.0},
+                            "timestamp": evening}])
+    get_query_cache(db_path).clear()
+    until = evening + datetime.timedelta(hours=3)
+
+    # Three hours are fewer than 200 one-minute buckets; from midnight on they would not be
+    assert get_stock_resolution(db_path, "ACME", until=until, min_points=200) is None
+    assert get_system_metrics_resolution(db_path, ("cpu_usage",), until=until, min_points=200) is None
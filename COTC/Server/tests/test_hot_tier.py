@@ -0,0 +1,67 @@
+import threading
+from datetime import datetime, timedelta
+from database.device_cache import get_device_cache
+from database.hot_tier import SYSTEM, get_hot_tier
+from database.ingestion import ingest_batch
+from database.models import get_session
+from database.schema import SystemMetric
+
+MAC = "aa:bb:cc:dd:ee:01"
+
+
+def stored_ids(db_path, device_pk):
+    session = get_session(db_path)
+    try:
+        return [row_id for row_id, in session.query(SystemMetric.id).filter_by(device_id=device_pk).order_by(SystemMetric.id)]
+    finally:
+        session.close()
+
+
+def test_series_warmed_during_ingest_misses_no_rows(db_path):
+    start = datetime.now() - timedelta(hours=1)
+    ingest_batch(db_path, [{"type": "system", "mac_address": MAC, "metrics": {"cpu_usage": 0.0}, "timestamp": start}])
+    device_pk = get_device_cache(db_path).lookup(mac_address=MAC)
+    tier = get_hot_tier(db_path)
+
+    written = [1]
+    stop = threading.Event()
+
+    def write():
+        while not stop.is_set():
+            ingest_batch(db_path, [{
+                "type": "system", "mac_address": MAC, "metrics": {"cpu_usage": float(written[0])},
+                "timestamp": start + timedelta(seconds=written[0])
+            }])
+            written[0] += 1
+
+    # Hold each load open until the writer has committed more rows, which only the buffer sees
+    load = tier._load
+    overlapped = []
+
+    def slow_load(key):
+        unit = load(key)
+        seen = written[0]
+        deadline = datetime.now() + timedelta(seconds=2)
+        while written[0] < seen + 3 and datetime.now() < deadline:
+            stop.wait(0.005)
+        overlapped.append(written[0] >= seen + 3)
+        return unit
+    tier._load = slow_load
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(5):
+            tier.invalidate(SYSTEM, device_pk)
+            tier.metric_columns(device_pk, ["cpu_usage"])
+    finally:
+        stop.set()
+        writer.join()
+
+    # Ingestion kept committing while the series were read from SQLite
+    assert all(overlapped)
+    warmups = tier.get_stats()["warmups"]
+    held = tier.metric_columns(device_pk, ["cpu_usage"])["cpu_usage"]
+    assert tier.get_stats()["warmups"] == warmups
+    assert held["id"] == stored_ids(db_path, device_pk)
+    assert held["metric_value"] == [float(value) for value in range(len(held["id"]))]
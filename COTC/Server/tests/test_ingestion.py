@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import event
+from database import ingestion
+from database.device_cache import get_device_cache
+from database.ingestion import ingest_batch
+from database.models import get_session
+from database.schema import get_session_factory, Device, SystemMetric
+
+
+def system_sample(mac_address, cpu_usage=10.0):
+    return {
+        "type": "system",
+        "mac_address": mac_address,
+        "hostname": "test-host",
+        "metrics": {"cpu_usage": cpu_usage}
+    }
+
+def count_rows(db_path, model):
+    session = get_session(db_path)
+    try:
+        return session.query(model).count()
+    finally:
+        session.close()
+
+
+def test_batch_with_new_device_commits_once(db_path):
+    commits = []
+    event.listen(get_session_factory(db_path), "after_commit", lambda session: commits.append(session))
+
+    results = ingest_batch(db_path, [system_sample("aa:bb:cc:dd:ee:01"), system_sample("aa:bb:cc:dd:ee:02")])
+
+    assert [result["status"] for result in results] == ["stored", "stored"]
+    assert len(commits) == 1
+    assert count_rows(db_path, Device) == 2
+    assert count_rows(db_path, SystemMetric) == 2
+    assert get_device_cache(db_path).lookup(mac_address="aa:bb:cc:dd:ee:01") is not None
+
+def test_failed_batch_does_not_keep_new_device(db_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("rollup write failed")
+    monkeypatch.setattr(ingestion, "upsert_rollups", fail)
+
+    with pytest.raises(RuntimeError):
+        ingest_batch(db_path, [system_sample("aa:bb:cc:dd:ee:03")])
+
+    assert count_rows(db_path, Device) == 0
+    assert count_rows(db_path, SystemMetric) == 0
+    assert get_device_cache(db_path).lookup(mac_address="aa:bb:cc:dd:ee:03") is None
@@ -0,0 +1,62 @@
+from sqlalchemy import event
+from database.last_seen import get_last_seen_tracker
+from database.models import get_session
+from database.schema import Device, get_engine, get_or_create_device
+
+MACS = ("aa:bb:cc:dd:ee:01", "aa:bb:cc:dd:ee:02")
+
+
+def record_device_updates(db_path):
+    """Collect (statement, executemany) for every UPDATE of the devices table."""
+    updates = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("UPDATE DEVICES"):
+            updates.append((statement, executemany))
+
+    event.listen(get_engine(db_path), "before_cursor_execute", on_execute)
+    return updates
+
+def stored_last_seen(db_path):
+    session = get_session(db_path)
+    try:
+        return {mac: last_seen.isoformat() if last_seen else None
+                for mac, last_seen in session.query(Device.mac_address, Device.last_seen)}
+    finally:
+        session.close()
+
+
+def test_last_seen_is_kept_in_memory_and_written_in_one_update(client, db_path):
+    updates = record_device_updates(db_path)
+    for cpu_usage in range(5):
+        for mac in MACS:
+            response = client.put("/metrics/system", json={"mac_address": mac, "metrics": {"cpu_usage": cpu_usage}})
+            assert response.status_code == 200
+    assert updates == []
+
+    # The device list already shows the in-memory values
+    listed = {device["mac_address"]: device["last_seen"] for device in client.get("/devices").get_json()}
+    assert listed != stored_last_seen(db_path)
+
+    assert get_last_seen_tracker(db_path).flush() == 2
+    assert len(updates) == 1 and updates[0][1]  # one executemany for both devices
+    assert stored_last_seen(db_path) == listed
+
+def test_device_lookup_only_writes_changed_details(db_path):
+    session = get_session(db_path)
+    try:
+        get_or_create_device(session, device_id="device", mac_address=MACS[0], hostname="host", os_info="Linux 6.1")
+        session.commit()
+        updates = record_device_updates(db_path)
+
+        get_or_create_device(session, mac_address=MACS[0], hostname="host", os_info="Linux 6.1")
+        session.commit()
+        assert updates == []
+
+        get_or_create_device(session, mac_address=MACS[0], hostname="renamed")
+        session.commit()
+        assert len(updates) == 1
+        # Lookups by MAC alone keep the device_id the device registered with
+        assert session.query(Device.device_id, Device.hostname, Device.os_info).one() == ("device", "renamed", "Linux 6.1")
+    finally:
+        session.close()
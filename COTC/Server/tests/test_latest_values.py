@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+from database.ingestion import ingest_batch
+from database.models import fetch_latest_stock_data, fetch_latest_system_metrics, get_session
+from database.schema import Device, LatestMetric, LatestStockPrice
+
+MAC = "aa:bb:cc:dd:ee:01"
+NOW = datetime(2024, 1, 1, 12)
+
+
+def system(cpu_usage, minutes_ago):
+    return {"type": "system", "mac_address": MAC, "metrics": {"cpu_usage": cpu_usage},
+            "timestamp": NOW - timedelta(minutes=minutes_ago)}
+
+def stock(price, minutes_ago):
+    return {"type": "stock", "symbol": "ACME", "price": price, "timestamp": NOW - timedelta(minutes=minutes_ago)}
+
+def latest_device_metrics(db_path):
+    """Latest metrics of the device, through the hot tier and through the latest-value table."""
+    session = get_session(db_path)
+    try:
+        device_id = session.query(Device.device_id).filter_by(mac_address=MAC).scalar()
+    finally:
+        session.close()
+    return fetch_latest_system_metrics(db_path, device_id=device_id), fetch_latest_system_metrics(db_path)
+
+def latest_rows(db_path):
+    session = get_session(db_path)
+    try:
+        return (
+            session.query(LatestMetric.metric_value, LatestMetric.timestamp).all(),
+            session.query(LatestStockPrice.price, LatestStockPrice.timestamp).all()
+        )
+    finally:
+        session.close()
+
+
+def test_late_samples_do_not_replace_newer_latest_values(db_path):
+    ingest_batch(db_path, [system(50.0, 0), stock(10.0, 0)])
+    # Warm the hot tier, which serves the next reads
+    assert latest_device_metrics(db_path)[0] == {"cpu_usage": 50.0}
+    assert fetch_latest_stock_data(db_path, "ACME")["price"] == 10.0
+
+    # A retried or spooled batch arrives after the newer values
+    ingest_batch(db_path, [system(20.0, 5), stock(9.0, 5)])
+
+    assert latest_rows(db_path) == ([(50.0, NOW)], [(10.0, NOW)])
+    assert latest_device_metrics(db_path) == ({"cpu_usage": 50.0}, {"cpu_usage": 50.0})
+    assert fetch_latest_stock_data(db_path, "ACME")["price"] == 10.0
+
+def test_newest_sample_of_an_unordered_batch_wins(db_path):
+    ingest_batch(db_path, [system(1.0, 2), system(3.0, 0), system(2.0, 1), stock(3.0, 0), stock(1.0, 2)])
+
+    assert latest_rows(db_path) == ([(3.0, NOW)], [(3.0, NOW)])
+
+def test_newer_samples_replace_the_latest_values(db_path):
+    ingest_batch(db_path, [system(20.0, 5), stock(9.0, 5)])
+    ingest_batch(db_path, [system(50.0, 0), stock(10.0, 0)])
+
+    assert latest_rows(db_path) == ([(50.0, NOW)], [(10.0, NOW)])
+    assert latest_device_metrics(db_path) == ({"cpu_usage": 50.0}, {"cpu_usage": 50.0})
+    assert fetch_latest_stock_data(db_path, "ACME")["price"] == 10.0
@@ -0,0 +1,62 @@
+from database.ingestion import ingest_batch
+from database.models import (
+    fetch_devices, fetch_latest_system_metrics, get_device_metrics_history_columns, get_stock_history_columns
+)
+from database.query_cache import SYSTEM_METRICS, get_query_cache
+
+MACS = ("aa:bb:cc:dd:ee:01", "aa:bb:cc:dd:ee:02")
+
+
+def write_metrics(db_path, mac, value=1.0):
+    ingest_batch(db_path, [{"type": "system", "mac_address": mac, "metrics": {"cpu_usage": value}}])
+
+def write_price(db_path, symbol, price=1.0):
+    ingest_batch(db_path, [{"type": "stock", "symbol": symbol, "price": price}])
+
+def misses(db_path):
+    return get_query_cache(db_path).get_stats()["misses"]
+
+
+def test_device_reads_stay_cached_while_other_devices_write(db_path):
+    for mac in MACS:
+        write_metrics(db_path, mac)
+    device_ids = {device["id"]: device["device_id"] for device in fetch_devices(db_path)}
+    first = device_ids[min(device_ids)]
+
+    get_device_metrics_history_columns(db_path, first, ("cpu_usage",))
+    before = misses(db_path)
+    for value in range(10):
+        write_metrics(db_path, MACS[1], value)
+        get_device_metrics_history_columns(db_path, first, ("cpu_usage",))
+    assert misses(db_path) == before
+
+    # Its own writes, and reads across every device, still see new data
+    write_metrics(db_path, MACS[0], 50.0)
+    assert get_device_metrics_history_columns(db_path, first, ("cpu_usage",))["cpu_usage"]["metric_value"][-1] == 50.0
+    assert fetch_latest_system_metrics(db_path) == {"cpu_usage": 50.0}
+    write_metrics(db_path, MACS[1], 70.0)
+    assert fetch_latest_system_metrics(db_path) == {"cpu_usage": 70.0}
+
+def test_symbol_reads_stay_cached_while_other_symbols_write(db_path):
+    write_price(db_path, "ACME")
+    get_stock_history_columns(db_path, "ACME")
+    before = misses(db_path)
+
+    for price in range(10):
+        write_price(db_path, "INIT", float(price + 1))
+        get_stock_history_columns(db_path, "ACME")
+    assert misses(db_path) == before
+
+    write_price(db_path, "ACME", 2.0)
+    assert get_stock_history_columns(db_path, "ACME")["price"][-1] == 2.0
+
+def test_table_wide_invalidation_drops_scoped_entries(db_path):
+    write_metrics(db_path, MACS[0])
+    device_id = fetch_devices(db_path)[0]["device_id"]
+    get_device_metrics_history_columns(db_path, device_id, ("cpu_usage",))
+    before = misses(db_path)
+
+    # e.g. retention pruning rows of every device
+    get_query_cache(db_path).invalidate(SYSTEM_METRICS)
+    get_device_metrics_history_columns(db_path, device_id, ("cpu_usage",))
+    assert misses(db_path) == before + 1
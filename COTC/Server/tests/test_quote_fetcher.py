@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from flask import Flask
+from api.endpoints import register_routes
+from api.quote_fetcher import QuoteFetcher, TokenBucket
+from database.ingestion import ingest_batch
+from database.models import get_stock_history
+
+
+class StubQuoteServer(ThreadingHTTPServer):
+    """Local stand-in for the upstream /quote endpoint that counts the calls it gets."""
+    daemon_threads = True
+    # Room for the fetcher's whole worker pool to connect at once
+    request_queue_size = 128
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubQuoteHandler)
+        self.lock = threading.Lock()
+        self.requested = []
+        self.delay = 0
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class StubQuoteHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        url = urlparse(self.path)
+        symbol = parse_qs(url.query).get("symbol", [""])[0]
+        with self.server.lock:
+            self.server.requested.append(symbol)
+        body = json.dumps({"c": 100.0 + len(symbol)}).encode()
+        self.send_response(200 if url.path == "/quote" else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = StubQuoteServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def register_agents(db_path, agents, pool, per_agent):
+    """Store one price for each symbol every agent watches, as the agents' own collectors would."""
+    watched = [[pool[(agent + offset) % len(pool)] for offset in range(per_agent)] for agent in range(agents)]
+    ingest_batch(db_path, [
+        {"type": "stock", "symbol": symbol, "price": 1.0} for symbols in watched for symbol in symbols
+    ])
+    return sorted({symbol for symbols in watched for symbol in symbols})
+
+
+def test_one_upstream_call_per_symbol_whatever_the_fleet_size(db_path, stub_server):
+    pool = [f"SYM{index}" for index in range(12)]
+    symbols = register_agents(db_path, agents=50, pool=pool, per_agent=5)
+
+    fetcher = QuoteFetcher(db_path, api_key="test", base_url=stub_server.base_url, rate_limit_per_minute=6000)
+    try:
+        fetcher.run_once()
+    finally:
+        fetcher.stop()
+
+    stats = fetcher.get_stats()
+    assert stats["upstream_calls"] == len(symbols) == len(stub_server.requested)
+    assert sorted(stub_server.requested) == symbols
+    assert stats["failures"] == 0 and stats["stored"] == len(symbols)
+    assert get_stock_history(db_path, "SYM0")[-1]["price"] == 104.0
+
+def test_fetcher_starts_with_the_first_request(db_path, stub_server):
+    register_agents(db_path, agents=1, pool=["ACME"], per_agent=1)
+    app = Flask(__name__)
+    register_routes(app, {
+        "database_path": db_path,
+        "system_metrics": ["cpu_usage"],
+        "quote_fetcher": {"enabled": True, "base_url": stub_server.base_url, "interval_seconds": 3600}
+    })
+    client = app.test_client()
+
+    # Registering the routes (e.g. in the reloader's watcher process) starts nothing
+    time.sleep(0.2)
+    assert stub_server.requested == []
+
+    deadline = time.monotonic() + 5
+    while client.get("/stats").get_json()["quote_fetcher"]["cycles"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert stub_server.requested == ["ACME"]
+
+def test_stop_lets_in_flight_requests_finish(db_path, stub_server):
+    stub_server.delay = 0.3
+    fetcher = QuoteFetcher(db_path, api_key="test", base_url=stub_server.base_url, timeout=5)
+    quote = fetcher.executor.submit(fetcher.fetch_quote, "ACME")
+    while not stub_server.requested:
+        time.sleep(0.01)
+
+    fetcher.stop()
+    # The session is only closed once the request has its answer
+    assert quote.done() and quote.result() == 104.0
+    assert fetcher.get_stats()["failures"] == 0
+
+def test_rate_limiter_waits_without_a_timeout():
+    bucket = TokenBucket(1200, burst=1)  # 20 a second
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0)
+
+    started = time.monotonic()
+    assert bucket.acquire()
+    assert 0.03 <= time.monotonic() - started < 1
@@ -0,0 +1,45 @@
+from collectors.spool import Spool
+
+
+def samples(*prices):
+    return [{"type": "stock", "symbol": "ACME", "price": price} for price in prices]
+
+
+def test_oldest_samples_are_evicted_beyond_max_samples(tmp_path):
+    spool = Spool(tmp_path / "spool.db", max_samples=5)
+    spool.append(samples(1.0, 2.0, 3.0))
+    spool.append(samples(4.0, 5.0, 6.0, 7.0))
+
+    assert len(spool) == 5
+    assert spool.get_stats() == {"spooled": 5, "evicted": 2}
+    peeked, _ = spool.peek(10)
+    assert [sample["price"] for sample in peeked] == [3.0, 4.0, 5.0, 6.0, 7.0]
+
+    # A single append larger than the spool keeps its newest samples
+    spool.append(samples(*range(10, 17)))
+    peeked, _ = spool.peek(10)
+    assert [sample["price"] for sample in peeked] == [12, 13, 14, 15, 16]
+    assert spool.get_stats() == {"spooled": 5, "evicted": 9}
+    spool.close()
+
+def test_ack_removes_delivered_samples_in_order(tmp_path):
+    spool = Spool(tmp_path / "spool.db")
+    spool.append(samples(1.0, 2.0, 3.0))
+
+    peeked, last_id = spool.peek(2)
+    assert [sample["price"] for sample in peeked] == [1.0, 2.0]
+    spool.ack(last_id)
+    assert len(spool) == 1
+    assert [sample["price"] for sample in spool.peek(10)[0]] == [3.0]
+    spool.close()
+
+def test_count_survives_reopening(tmp_path):
+    spool = Spool(tmp_path / "spool.db", max_samples=4)
+    spool.append(samples(1.0, 2.0, 3.0))
+    spool.close()
+
+    spool = Spool(tmp_path / "spool.db", max_samples=4)
+    assert len(spool) == 3
+    spool.append(samples(4.0, 5.0))
+    assert [sample["price"] for sample in spool.peek(10)[0]] == [2.0, 3.0, 4.0, 5.0]
+    spool.close()
@@ -0,0 +1,56 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from client_agent import ClientAgent
+from database.ingestion import INGESTION_OPTIONS
+from database.models import get_stock_history
+
+START = datetime(2024, 1, 1, 12)
+
+
+@pytest.fixture
+def dedup_client(make_client, monkeypatch):
+    """API client with a 10 second stock_interval; the global de-duplication window is restored afterwards."""
+    monkeypatch.setitem(INGESTION_OPTIONS, "stock_dedup_seconds", INGESTION_OPTIONS["stock_dedup_seconds"])
+    return make_client(stock_interval=10)
+
+def post_prices(client, *seconds):
+    response = client.post("/metrics/batch", json={"samples": [
+        {"type": "stock", "symbol": "ACME", "price": 100.0 + offset, "timestamp": (START + timedelta(seconds=offset)).isoformat()}
+        for offset in seconds
+    ]})
+    return [result["status"] for result in response.get_json()["results"]]
+
+
+def test_next_interval_is_kept_even_if_slightly_early(dedup_client, db_path):
+    assert post_prices(dedup_client, 0) == ["stored"]
+    # Collection jitter: the next cycle's quote is stamped just under one interval later
+    assert post_prices(dedup_client, 9.5) == ["stored"]
+    assert post_prices(dedup_client, 19.2, 29.0) == ["stored", "stored"]
+    assert len(get_stock_history(db_path, "ACME")) == 4
+
+def test_same_quote_from_another_agent_is_a_duplicate(dedup_client, db_path):
+    assert post_prices(dedup_client, 0, 1, 8.9) == ["stored", "duplicate", "duplicate"]
+    assert post_prices(dedup_client, 9) == ["stored"]
+    assert [row["price"] for row in get_stock_history(db_path, "ACME")] == [100.0, 109.0]
+
+
+def write_agent_config(tmp_path, stock_interval, quote_cache_ttl):
+    path = tmp_path / "client_config.json"
+    path.write_text(json.dumps({
+        "server_url": "http://monitor",
+        "collection_interval": 10,
+        "stock_interval": stock_interval,
+        "metrics": {"enabled": ["cpu_usage"]},
+        "stocks": {"api_key": "test", "symbols": ["ACME"], "quote_cache_ttl": quote_cache_ttl}
+    }))
+    return path
+
+@pytest.mark.parametrize("stock_interval, quote_cache_ttl, expected", [(10, 30, 10), (10, 5, 5), (10, 0, 0)])
+def test_quote_cache_never_outlives_a_stock_interval(tmp_path, monkeypatch, stock_interval, quote_cache_ttl, expected):
+    monkeypatch.setattr(ClientAgent, "register_device", lambda self, max_retries=3: False)
+    agent = ClientAgent(write_agent_config(tmp_path, stock_interval, quote_cache_ttl))
+    try:
+        assert agent.stock_collector.quote_cache_ttl == expected
+    finally:
+        agent.stock_collector.close()
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from database.ingestion import ingest_batch
+from database.models import fetch_latest_stock_data, get_stock_history, get_system_metrics_history
+from database.query_cache import get_query_cache
+from database.schema import get_engine
+
+MAC = "aa:bb:cc:dd:ee:01"
+
+
+def query_plans(db_path, function, *args, **kwargs):
+    """Run function and return the EXPLAIN QUERY PLAN details of every SELECT it issued."""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    engine = get_engine(db_path)
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        function(db_path, *args, **kwargs)
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+
+    with engine.connect() as conn:
+        return [
+            " | ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+            for statement, parameters in statements
+        ]
+
+def seed(db_path):
+    start = datetime(2024, 1, 1)
+    ingest_batch(db_path, [
+        {"type": "system", "mac_address": MAC, "device_id": "device", "timestamp": start + timedelta(minutes=minute),
+         "metrics": {"cpu_usage": minute, "ram_usage": minute}}
+        for minute in range(60)
+    ] + [
+        {"type": "stock", "symbol": symbol, "price": 1.0 + minute, "timestamp": start + timedelta(minutes=minute)}
+        for minute in range(60) for symbol in ("ACME", "INIT")
+    ])
+    get_query_cache(db_path).clear()
+
+
+def test_system_metrics_history_uses_the_device_type_timestamp_index(db_path):
+    seed(db_path)
+    for kwargs in ({}, {"since": datetime(2024, 1, 1, 0, 30), "limit": 10}):
+        plans = query_plans(db_path, get_system_metrics_history, "cpu_usage", "device", **kwargs)
+        assert any("ix_system_metrics_device_type_ts" in plan for plan in plans), plans
+
+def test_stock_history_uses_the_symbol_timestamp_index(db_path):
+    seed(db_path)
+    for kwargs in ({}, {"since": datetime(2024, 1, 1, 0, 30), "limit": 10}):
+        plans = query_plans(db_path, get_stock_history, "ACME", **kwargs)
+        assert any("ix_stock_data_symbol_ts" in plan for plan in plans), plans
+
+def test_latest_stock_price_and_hot_tier_warm_up_use_the_symbol_timestamp_index(db_path):
+    seed(db_path)
+    # The first read also loads the symbol's recent window into the hot tier
+    plans = query_plans(db_path, fetch_latest_stock_data, "ACME")
+    assert any("ix_stock_data_symbol_ts" in plan for plan in plans), plans
+    assert not any("SCAN stock_data" in plan for plan in plans), plans
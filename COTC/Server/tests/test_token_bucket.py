@@ -0,0 +1,76 @@
+import threading
+import time
+import pytest
+from collectors import stock_collector
+from collectors.stock_collector import TokenBucket
+
+
+class FakeTime:
+    """Stands in for the time module: monotonic() only advances when sleep() is called."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(stock_collector, "time", fake)
+    return fake
+
+
+def test_starts_with_a_full_burst(clock):
+    bucket = TokenBucket(120, burst=3)
+    assert all(bucket.acquire(timeout=0) for _ in range(3))
+    assert not bucket.acquire(timeout=0)
+    assert clock.sleeps == []
+
+def test_default_burst_is_one_seconds_worth_and_at_least_one():
+    assert TokenBucket(600).capacity == 10
+    assert TokenBucket(30).capacity == 1
+
+def test_tokens_refill_at_the_configured_rate(clock):
+    bucket = TokenBucket(60, burst=1)  # one token a second
+    assert bucket.acquire(timeout=0)
+
+    clock.now += 0.5
+    assert not bucket.acquire(timeout=0.25)
+    clock.now += 0.5
+    assert bucket.acquire(timeout=0)
+    assert clock.sleeps == []
+
+def test_acquire_sleeps_until_the_next_token(clock):
+    bucket = TokenBucket(60, burst=1)
+    bucket.acquire()
+
+    assert bucket.acquire()
+    assert clock.sleeps == [pytest.approx(1.0)]
+    assert bucket.acquire(timeout=1.0)
+    assert len(clock.sleeps) == 2
+
+def test_idle_time_does_not_build_up_more_than_the_burst(clock):
+    bucket = TokenBucket(60, burst=2)
+    clock.now += 3600
+
+    assert bucket.acquire(timeout=0) and bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0)
+
+def test_concurrent_callers_share_the_rate():
+    bucket = TokenBucket(1200, burst=1)  # 20 a second
+    started = time.monotonic()
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(11)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The first token is there from the start, the other ten take 1/20 s each
+    assert time.monotonic() - started >= 0.45
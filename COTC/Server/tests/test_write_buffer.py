@@ -0,0 +1,43 @@
+from database.models import get_stock_history
+from database.write_buffer import WriteBehindBuffer
+
+
+def write_behind(**options):
+    return {"write_behind": {"enabled": True, **options}}
+
+
+def test_full_queue_answers_503_with_retry_after(make_client):
+    client = make_client(**write_behind(max_queue=2, flush_interval=2))
+
+    response = client.post("/metrics/batch", json=[{"symbol": "ACME", "price": 1.0}] * 3)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+    assert client.get("/stats").get_json()["write_buffer"]["refused"] == 3
+
+def test_queued_samples_are_drained_by_the_stop_registered_at_exit(make_client, db_path, monkeypatch):
+    exit_handlers = []
+    monkeypatch.setattr("api.endpoints.atexit.register", exit_handlers.append)
+    # Nothing is flushed on its own during the test, so only the exit drain can store the samples
+    client = make_client(**write_behind(flush_size=1000, flush_interval=3600))
+
+    response = client.post("/metrics/batch", json=[{"symbol": "ACME", "price": float(price)} for price in (1, 2, 3)])
+    assert [result["status"] for result in response.get_json()["results"]] == ["queued"] * 3
+    assert get_stock_history(db_path, "ACME") == []
+
+    for handler in exit_handlers:
+        handler()
+
+    assert [row["price"] for row in get_stock_history(db_path, "ACME")] == [1.0, 2.0, 3.0]
+    stats = client.get("/stats").get_json()["write_buffer"]
+    assert stats["flushed_samples"] == 3 and stats["queue_depth"] == 0
+
+def test_samples_rejected_at_flush_time_are_counted(db_path):
+    buffer = WriteBehindBuffer(db_path, flush_interval=3600)
+    buffer.start()
+    buffer.submit([{"type": "stock", "symbol": "ACME", "price": 1.0}, {"type": "stock", "symbol": "ACME", "price": -1.0}])
+    buffer.stop()
+
+    stats = buffer.get_stats()
+    assert stats["flushed_samples"] == 2
+    assert stats["rejected_samples"] == 1